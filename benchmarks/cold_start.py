@@ -0,0 +1,63 @@
+"""
+Cold-start check for the Cloud Run services.
+
+Imports each service's main module in a fresh interpreter several times and
+reports the median import time (what an instance pays before it can serve).
+Exits non-zero when a service exceeds --max-seconds, so it can gate CI/deploys.
+
+    python benchmarks/cold_start.py --runs 5 --max-seconds 3
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICES = ["ingestion-service", "cloud-run-ai-service-backed"]
+
+_PROBE = (
+    "import time; t = time.perf_counter(); import main; "
+    "print(time.perf_counter() - t)"
+)
+
+
+def measure(service, runs):
+    service_dir = os.path.join(ROOT, service)
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    timings = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-c", _PROBE], cwd=service_dir, env=env,
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"{service}: import failed\n{result.stderr[-2000:]}")
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=None,
+                        help="fail if a service's median import time is above this")
+    parser.add_argument("services", nargs="*", default=SERVICES)
+    args = parser.parse_args()
+
+    failed = False
+    for service in args.services:
+        try:
+            timings = measure(service, args.runs)
+        except RuntimeError as e:
+            print(e, file=sys.stderr)
+            failed = True
+            continue
+        median = statistics.median(timings)
+        over = args.max_seconds is not None and median > args.max_seconds
+        failed = failed or over
+        print(f"{service:32s} median={median:.3f}s min={min(timings):.3f}s max={max(timings):.3f}s"
+              f"{'  OVER BUDGET' if over else ''}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
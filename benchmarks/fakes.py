@@ -0,0 +1,235 @@
+"""
+In-process stand-ins for the cloud clients, for benchmarks and offline runs.
+
+Each fake sleeps for a configurable latency (with jitter) and fails a configurable
+fraction of calls with a retryable error, so the services' scheduling, retry and
+circuit-breaker paths are exercised the same way a slow or flaky backend would.
+Plug them in through the services' injection points:
+
+    ingestion-service:  main.inject(storage_client=..., embedding_model=..., summary_model=..., writer=...)
+    AI backend:         main.use_model(FakeGenerativeModel(...))
+"""
+import asyncio
+import hashlib
+import itertools
+import math
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+
+class ServiceUnavailable(Exception):
+    """Same class name as google.api_core's 503, so model_scheduler treats it as retryable."""
+
+
+class Behaviour:
+    """Latency (milliseconds, +/- jitter fraction) and error rate shared by the fakes."""
+
+    def __init__(self, latency_ms=0.0, jitter=0.2, error_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+
+    def _draw(self):
+        """(delay in seconds, whether this call fails)"""
+        with self._lock:
+            self.calls += 1
+            spread = self._random.uniform(-self.jitter, self.jitter)
+            fail = self._random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        return max(0.0, self.latency_ms * (1 + spread)) / 1000, fail
+
+    def __call__(self, what="call"):
+        delay, fail = self._draw()
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise ServiceUnavailable(f"503 fake {what} unavailable")
+
+    async def wait(self, what="call"):
+        """Async variant: the latency is an asyncio.sleep, like an awaited network call."""
+        delay, fail = self._draw()
+        if delay:
+            await asyncio.sleep(delay)
+        if fail:
+            raise ServiceUnavailable(f"503 fake {what} unavailable")
+
+
+# --- Cloud Storage ---
+
+def synthetic_text(name, pages=4, page_chars=3000):
+    """Deterministic pseudo-document: `pages` form-feed separated pages of words."""
+    rng = random.Random(name)
+    words = ["alumno", "calificación", "asistencia", "parcial", "tarea", "examen", "proyecto",
+             "grupo", "promedio", "evaluación", "riesgo", "tutoría", "docente", "materia"]
+    out = []
+    for _ in range(pages):
+        page, size = [], 0
+        while size < page_chars:
+            word = rng.choice(words)
+            page.append(word)
+            size += len(word) + 1
+        out.append(" ".join(page))
+    return "\f".join(out)
+
+
+class FakeBlob:
+    def __init__(self, bucket, name, behaviour, pages, page_chars):
+        self.bucket = bucket
+        self.name = name
+        self._behaviour = behaviour
+        self._content = synthetic_text(name, pages, page_chars)
+        self.size = len(self._content.encode("utf-8"))
+        # Unique per object, so every event is a content-cache miss
+        self.md5_hash = hashlib.md5(f"{bucket.name}/{name}/{self._content}".encode("utf-8")).hexdigest()
+        self.crc32c = None
+
+    def download_as_text(self):
+        self._behaviour("storage download")
+        return self._content
+
+    def download_as_bytes(self):
+        self._behaviour("storage download")
+        return self._content.encode("utf-8")
+
+    def download_to_file(self, file_obj):
+        file_obj.write(self.download_as_bytes())
+
+
+class FakeBucket:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def blob(self, name):
+        return FakeBlob(self, name, self.client.behaviour, self.client.pages, self.client.page_chars)
+
+    def get_blob(self, name):
+        self.client.metadata_behaviour("storage metadata")
+        return self.blob(name)
+
+
+class FakeStorageClient:
+    """Every object exists and holds synthetic text of `pages` x `page_chars`."""
+
+    def __init__(self, behaviour=None, metadata_behaviour=None, pages=4, page_chars=3000):
+        self.behaviour = behaviour or Behaviour()
+        self.metadata_behaviour = metadata_behaviour or Behaviour()
+        self.pages = pages
+        self.page_chars = page_chars
+
+    def bucket(self, name):
+        return FakeBucket(self, name)
+
+    def list_blobs(self, bucket_name, prefix="", max_results=None):
+        count = 10 if max_results is None else min(10, max_results)
+        bucket = self.bucket(bucket_name)
+        return [bucket.blob(f"{prefix}doc-{i}.txt") for i in range(count)]
+
+
+# --- Vertex AI / Gemini ---
+
+class FakeEmbedding:
+    def __init__(self, values):
+        self.values = values
+
+
+class FakeEmbeddingModel:
+    """get_embeddings() -> deterministic unit vectors derived from each input's text."""
+
+    def __init__(self, behaviour=None, dimensions=768):
+        self.behaviour = behaviour or Behaviour()
+        self.dimensions = dimensions
+
+    def _vector(self, text_value):
+        rng = random.Random(hashlib.sha1(text_value.encode("utf-8")).digest())
+        values = [rng.gauss(0, 1) for _ in range(self.dimensions)]
+        norm = math.sqrt(sum(v * v for v in values)) or 1.0
+        return [v / norm for v in values]
+
+    def get_embeddings(self, inputs):
+        self.behaviour("embedding")
+        return [FakeEmbedding(self._vector(getattr(item, "text", item))) for item in inputs]
+
+
+class FakeResponse:
+    def __init__(self, text_value):
+        self.text = text_value
+
+
+class FakeGenerativeModel:
+    """generate_content() -> `response_chars` of text; stream=True yields it in `chunks` pieces."""
+
+    def __init__(self, behaviour=None, response_chars=1500, chunks=10):
+        self.behaviour = behaviour or Behaviour()
+        self.response_chars = response_chars
+        self.chunks = max(1, chunks)
+
+    def _text(self, prompt):
+        seed = hashlib.sha1(str(prompt).encode("utf-8")).hexdigest()
+        return (f"Texto generado {seed[:8]}. " * (self.response_chars // 24 + 1))[:self.response_chars]
+
+    def generate_content(self, prompt, stream=False, request_options=None, **kwargs):
+        if not stream:
+            self.behaviour("generation")
+            return FakeResponse(self._text(prompt))
+        # The first-chunk latency is the call latency; later chunks arrive at the same pace
+        self.behaviour("generation")
+        return self._stream(self._text(prompt))
+
+    async def generate_content_async(self, prompt, stream=False, request_options=None, **kwargs):
+        await self.behaviour.wait("generation")
+        if not stream:
+            return FakeResponse(self._text(prompt))
+        return self._stream_async(self._text(prompt))
+
+    def _pieces(self, text_value):
+        size = math.ceil(len(text_value) / self.chunks)
+        return [text_value[i:i + size] for i in range(0, len(text_value), size)]
+
+    def _stream(self, text_value):
+        pause = self.behaviour.latency_ms / self.chunks / 1000
+        for i, piece in enumerate(self._pieces(text_value)):
+            if i and pause:
+                time.sleep(pause)
+            yield FakeResponse(piece)
+
+    async def _stream_async(self, text_value):
+        pause = self.behaviour.latency_ms / self.chunks / 1000
+        for i, piece in enumerate(self._pieces(text_value)):
+            if i and pause:
+                await asyncio.sleep(pause)
+            yield FakeResponse(piece)
+
+
+# --- Database ---
+
+class FakeDocumentWriter:
+    """BulkDocumentWriter stand-in: each add() resolves after the configured write latency."""
+
+    def __init__(self, behaviour=None):
+        self.behaviour = behaviour or Behaviour()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def available(self):
+        return True
+
+    def add(self, document, embedding=None, chunks=(), cache_hash=None):
+        future = Future()
+        try:
+            self.behaviour("database write")
+            with self._lock:
+                future.set_result(next(self._ids))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def flush(self):
+        pass
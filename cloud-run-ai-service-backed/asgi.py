@@ -0,0 +1,342 @@
+"""
+Async (ASGI) serving mode for the AI backend (SERVING_MODE=async in the Dockerfile).
+
+Under gunicorn each request holds a worker thread for the whole blocking
+generate_content call, so an instance has at most `threads` generations in flight.
+Here the generation routes run on one event loop and await the SDK's
+generate_content_async, so waiting on Gemini costs a coroutine instead of a thread and
+hundreds of requests can be in flight per instance (raise Cloud Run --concurrency to
+match). The model scheduler's token bucket still paces the calls to the quota.
+
+Native async routes, with the same JSON contracts as main.py:
+    GET  /
+    POST /generate-report, /generate-group-report, /generate-student-feedback, /record-attendance
+Every other route (/group-stats, /attendance-rate, /metrics, batch feedback, ...)
+is served by the Flask app through a WSGI bridge on a small thread pool.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8080
+"""
+import asyncio
+import functools
+import logging
+import time
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+import main
+from main import (response_cache, materialized_reports, model_scheduler, prompt_chars, response_chars, generations_total,
+                  attendance_store, ATTENDANCE_WRITE_TIMEOUT, ATTENDANCE_STORAGE_ERROR, build_group_report_prompt,
+                  build_student_feedback_prompt, group_report_body, student_feedback_body,
+                  read_attendance_request, health_status, cache_options, wants_stream, wants_sse, format_event)
+from metrics import (REGISTRY, PROFILE_HEADER, span, observe_stage, start_profile, finish_profile,
+                     wants_profile, server_timing)
+from model_scheduler import ModelUnavailableError, INTERACTIVE
+from response_cache import cache_key
+from attendance_store import summarize_payload
+
+logger = logging.getLogger(__name__)
+
+requests_total = REGISTRY.counter("http_requests_total", "HTTP requests by endpoint and status")
+request_seconds = REGISTRY.summary("http_request_seconds", "HTTP request latency by endpoint")
+
+FLASK_BRIDGE_THREADS = 8
+
+
+# --- Model calls (async counterparts of main.call_generative_api*) ---
+
+async def _generate_content_async(prompt, timeout=None, **kwargs):
+    if timeout:
+        kwargs["request_options"] = {"timeout": timeout}
+    return await main.model.generate_content_async(prompt, **kwargs)
+
+
+def _require_model():
+    if not main.is_ai_ready or not main.model:
+        raise Exception("Model not initialized. Check server logs for startup errors.")
+
+
+async def call_generative_api_async(prompt, timeout=None, priority=INTERACTIVE):
+    _require_model()
+    try:
+        logger.info("🔄 Calling Gemini model (async) with prompt length: " + str(len(prompt)))
+        prompt_chars.inc(len(prompt))
+        generations_total.inc(mode="blocking")
+        with span("generate_content"):
+            response = await model_scheduler.call_async(_generate_content_async, prompt, timeout, priority=priority)
+
+        if not response or not response.text:
+            logger.error("⚠️ Empty response from Gemini model")
+            raise Exception("Gemini model returned empty response")
+
+        response_chars.inc(len(response.text))
+        return response.text
+    except ModelUnavailableError as e:
+        logger.error(f"❌ Gemini unavailable: {e}")
+        raise
+    except Exception as e:
+        logger.error(f"❌ Error calling Gemini: {e}", exc_info=True)
+        raise Exception(f"Model generation failed: {str(e)}")
+
+
+async def call_generative_api_stream_async(prompt, priority=INTERACTIVE):
+    _require_model()
+    logger.info("🔄 Streaming Gemini response (async) for prompt length: " + str(len(prompt)))
+    prompt_chars.inc(len(prompt))
+    generations_total.inc(mode="stream")
+    total = 0
+    started = time.perf_counter()
+    first_chunk = True
+    try:
+        response = await model_scheduler.call_async(_generate_content_async, prompt, stream=True, priority=priority)
+        async for chunk in response:
+            if first_chunk:
+                observe_stage("generate_first_chunk", time.perf_counter() - started)
+                first_chunk = False
+            try:
+                piece = chunk.text
+            except ValueError:
+                # Chunks without text parts (e.g. safety/finish metadata) raise on .text
+                continue
+            if piece:
+                total += len(piece)
+                yield piece
+    except ModelUnavailableError as e:
+        logger.error(f"❌ Gemini unavailable: {e}")
+        raise
+    except Exception as e:
+        logger.error(f"❌ Error streaming from Gemini: {e}", exc_info=True)
+        raise Exception(f"Model generation failed: {str(e)}")
+
+    observe_stage("generate_stream", time.perf_counter() - started)
+    response_chars.inc(total)
+    if total == 0:
+        logger.error("⚠️ Empty response from Gemini model")
+        raise Exception("Gemini model returned empty response")
+
+
+# Cache lookups stay synchronous: the in-process LRU (and the optional local SQLite file) answer in microseconds.
+# Materialized reports are a database query, so that lookup runs off the event loop.
+async def lookup_cached_async(key):
+    """Like main.lookup_cached."""
+    with span("cache_lookup"):
+        cached_text = response_cache.get(key)
+        if cached_text is None and materialized_reports.enabled:
+            cached_text = await asyncio.to_thread(materialized_reports.get, key)
+            if cached_text is not None:
+                logger.info("📦 Materialized report found")
+                response_cache.set(key, cached_text)
+    return cached_text
+
+
+async def generate_with_cache_async(prompt, use_cache=True, refresh=False):
+    """Returns (text, cached), like main.generate_with_cache."""
+    if not use_cache:
+        response_cache.count("bypassed")
+        return await call_generative_api_async(prompt), False
+
+    key = cache_key(prompt, main.model_name)
+    if refresh:
+        response_cache.count("refreshed")
+    else:
+        cached_text = await lookup_cached_async(key)
+        if cached_text is not None:
+            logger.info("⚡ Response served from cache")
+            return cached_text, True
+
+    generated = await call_generative_api_async(prompt)
+    response_cache.set(key, generated)
+    return generated, False
+
+
+async def stream_with_cache_async(prompt, use_cache=True, refresh=False):
+    """Yields (text_piece, cached) tuples, like main.stream_with_cache."""
+    if not use_cache:
+        response_cache.count("bypassed")
+        async for piece in call_generative_api_stream_async(prompt):
+            yield piece, False
+        return
+
+    key = cache_key(prompt, main.model_name)
+    if refresh:
+        response_cache.count("refreshed")
+    else:
+        cached_text = await lookup_cached_async(key)
+        if cached_text is not None:
+            logger.info("⚡ Response served from cache")
+            yield cached_text, True
+            return
+
+    parts = []
+    async for piece in call_generative_api_stream_async(prompt):
+        parts.append(piece)
+        yield piece, False
+    response_cache.set(key, "".join(parts))
+
+
+# --- Responses ---
+
+def stream_generation(prompt, use_cache, refresh, use_sse, done_payload, error_prefix):
+    """Streams `chunk` events, then a `done` event carrying the usual response fields."""
+    async def events():
+        cached = False
+        try:
+            async for piece, cached in stream_with_cache_async(prompt, use_cache=use_cache, refresh=refresh):
+                yield format_event("chunk", {"text": piece}, use_sse)
+            yield format_event("done", {"success": True, **done_payload, "cached": cached}, use_sse)
+        except ModelUnavailableError as e:
+            yield format_event("error", {"error": f"{error_prefix}: {str(e)}", "retry_after": e.retry_after}, use_sse)
+        except Exception as e:
+            logger.error(f"Streaming generation failed: {e}")
+            yield format_event("error", {"error": f"{error_prefix}: {str(e)}"}, use_sse)
+    return StreamingResponse(events(), media_type="text/event-stream" if use_sse else "application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def model_unavailable_response(e):
+    """503 with Retry-After when the scheduler is shedding load."""
+    return JSONResponse({"error": f"Servicio de IA saturado, intenta de nuevo en {e.retry_after}s",
+                         "retry_after": e.retry_after}, status_code=503,
+                        headers={"Retry-After": str(e.retry_after)})
+
+
+async def read_json(request):
+    """The JSON body, or None when it is missing or not valid JSON."""
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+def instrumented(endpoint):
+    """Request counters, latency summary and the X-Profile breakdown, as install_flask adds for Flask routes."""
+    def decorate(handler):
+        @functools.wraps(handler)
+        async def wrapper(request):
+            started = time.perf_counter()
+            profile, token = start_profile(wants_profile(request.headers.get(PROFILE_HEADER)))
+            try:
+                response = await handler(request)
+            finally:
+                finish_profile(token)
+            elapsed = time.perf_counter() - started
+            requests_total.inc(endpoint=endpoint, status=response.status_code)
+            request_seconds.observe(elapsed, endpoint=endpoint)
+            if profile is not None:
+                # Streamed bodies are produced after this point, so their stages are not included
+                response.headers["Server-Timing"] = server_timing(profile, elapsed)
+            return response
+        return wrapper
+    return decorate
+
+
+# --- Routes ---
+
+async def health(request):
+    payload, status_code = health_status()
+    return JSONResponse(payload, status_code=status_code)
+
+
+async def generate_group_report(request):
+    """Generate an AI analysis for a group's academic performance."""
+    try:
+        if not main.is_ai_ready:
+            error_msg = "AI model not initialized. Check server logs for startup errors."
+            logger.error(error_msg)
+            return JSONResponse({"error": error_msg}, status_code=500)
+
+        data = await read_json(request)
+        if not data:
+            return JSONResponse({"error": "No data provided"}, status_code=400)
+
+        with span("prompt_build"):
+            prompt, group_name, partial = build_group_report_prompt(data)
+
+        logger.info(f"Generating report for group: {group_name}, partial: {partial}")
+        use_cache, refresh = cache_options(data, args=request.query_params)
+        if wants_stream(data, args=request.query_params, headers=request.headers):
+            use_sse = wants_sse(data, default=True, args=request.query_params, headers=request.headers)
+            return stream_generation(prompt, use_cache, refresh, use_sse,
+                                     {"group": group_name, "partial": partial}, "Error al generar informe")
+        report_text, cached = await generate_with_cache_async(prompt, use_cache=use_cache, refresh=refresh)
+        return JSONResponse(group_report_body(report_text, group_name, partial, cached))
+
+    except ModelUnavailableError as e:
+        return model_unavailable_response(e)
+    except Exception as e:
+        logger.error(f"Error generating group report: {e}", exc_info=True)
+        return JSONResponse({"error": f"Error al generar informe: {str(e)}"}, status_code=500)
+
+
+async def generate_student_feedback(request):
+    """Generate personalized feedback for a student."""
+    try:
+        if not main.is_ai_ready:
+            error_msg = "AI model not initialized. Check server logs for startup errors."
+            logger.error(error_msg)
+            return JSONResponse({"error": error_msg}, status_code=500)
+
+        data = await read_json(request)
+        if not data:
+            return JSONResponse({"error": "No data provided"}, status_code=400)
+
+        with span("prompt_build"):
+            prompt, student_name, subject = build_student_feedback_prompt(data)
+
+        logger.info(f"Generating feedback for student: {student_name}, subject: {subject}")
+        use_cache, refresh = cache_options(data, args=request.query_params)
+        if wants_stream(data, args=request.query_params, headers=request.headers):
+            use_sse = wants_sse(data, default=True, args=request.query_params, headers=request.headers)
+            return stream_generation(prompt, use_cache, refresh, use_sse,
+                                     {"student": student_name, "subject": subject},
+                                     "Error al generar retroalimentación")
+        feedback_text, cached = await generate_with_cache_async(prompt, use_cache=use_cache, refresh=refresh)
+        return JSONResponse(student_feedback_body(feedback_text, student_name, subject, cached))
+
+    except ModelUnavailableError as e:
+        return model_unavailable_response(e)
+    except Exception as e:
+        logger.error(f"Error generating student feedback: {e}", exc_info=True)
+        return JSONResponse({"error": f"Error al generar retroalimentación: {str(e)}"}, status_code=500)
+
+
+async def record_attendance(request):
+    """Records student attendance data; the response is sent once the records are stored."""
+    if ATTENDANCE_STORAGE_ERROR:
+        return JSONResponse({"error": ATTENDANCE_STORAGE_ERROR}, status_code=503)
+    try:
+        try:
+            group_id, partial, records = read_attendance_request(await read_json(request))
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+
+        size = int(request.headers.get("content-length") or 0)
+        logger.info(f"Received attendance: {summarize_payload(group_id, partial, records, size)}")
+        # The store's writer thread resolves the future; awaiting it keeps the loop free meanwhile
+        stored = await asyncio.wait_for(asyncio.wrap_future(attendance_store.add(group_id, partial, records)),
+                                        timeout=ATTENDANCE_WRITE_TIMEOUT)
+
+        return JSONResponse({"success": True, "message": "Attendance recorded successfully.",
+                             "records": len(records), "batch_size": stored})
+
+    except Exception as e:
+        logger.error(f"Error in /record-attendance: {e}", exc_info=True)
+        return JSONResponse({"error": f"An unexpected error occurred: {str(e)}"}, status_code=500)
+
+
+def route(path, handler):
+    methods = ["GET"] if path == "/" else ["POST"]
+    return Route(path, instrumented(path)(handler), methods=methods)
+
+
+app = Starlette(routes=[
+    route("/", health),
+    route("/generate-report", generate_group_report),
+    route("/generate-group-report", generate_group_report),
+    route("/generate-student-feedback", generate_student_feedback),
+    route("/record-attendance", record_attendance),
+    # Everything else keeps its Flask implementation
+    Mount("/", app=WSGIMiddleware(main.app, workers=FLASK_BRIDGE_THREADS)),
+])
@@ -0,0 +1,319 @@
+"""
+Persistent attendance storage with write coalescing and incremental aggregates.
+
+One compact row per (group, session date, student) holds a 0/1 flag. Incoming
+roll calls are merged in memory (last write per key wins) and flushed in one
+transaction when `max_batch` records are pending or the oldest is `max_age`
+seconds old, like the ingestion service's bulk writer.
+
+Each flush also applies present/total deltas to `attendance_group_totals` and
+`attendance_student_totals`, so attendance rates per group and partial are
+single-row reads instead of rescans. Re-sending the same roll call is a no-op.
+Changing a record moves its counts between aggregates. On Postgres a flush holds
+an advisory lock per touched group, so instances sharing the database never apply
+a delta against the same previous records. rebuild_aggregates()
+recomputes both tables from the records if they ever need repair.
+
+ATTENDANCE_DB_URL is any SQLAlchemy URL (Cloud SQL Postgres in production). The
+SQLite default is per-instance and only suitable for local runs, so on Cloud Run
+main.py answers the attendance endpoints with 503 until ATTENDANCE_DB_URL is set.
+"""
+import threading
+import time
+import logging
+from concurrent.futures import Future
+
+import sqlalchemy
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS attendance_records (
+        group_id VARCHAR(128) NOT NULL,
+        session_date VARCHAR(32) NOT NULL,
+        student_id VARCHAR(128) NOT NULL,
+        partial VARCHAR(64) NOT NULL,
+        present SMALLINT NOT NULL,
+        PRIMARY KEY (group_id, session_date, student_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS attendance_group_totals (
+        group_id VARCHAR(128) NOT NULL,
+        partial VARCHAR(64) NOT NULL,
+        present_count INTEGER NOT NULL DEFAULT 0,
+        total_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (group_id, partial)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS attendance_student_totals (
+        group_id VARCHAR(128) NOT NULL,
+        partial VARCHAR(64) NOT NULL,
+        student_id VARCHAR(128) NOT NULL,
+        present_count INTEGER NOT NULL DEFAULT 0,
+        total_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (group_id, partial, student_id)
+    )
+    """,
+]
+
+
+def parse_attendance(attendance_data):
+    """
+    Normalizes the app's {date: {studentId: bool}} map, or a list of
+    {"student_id", "date", "present"} objects, into (date, student_id, present) tuples.
+    """
+    if isinstance(attendance_data, dict):
+        return [(str(date), str(student_id), 1 if present else 0)
+                for date, students in attendance_data.items()
+                if isinstance(students, dict)
+                for student_id, present in students.items()]
+    if isinstance(attendance_data, list):
+        return [(str(item["date"]), str(item["student_id"]), 1 if item.get("present") else 0)
+                for item in attendance_data]
+    raise ValueError("attendance_data must be a {date: {studentId: bool}} object or a list of records")
+
+
+def summarize_payload(group_id, partial, records, raw_bytes, max_ids=5):
+    """One-line, size-bounded description of a roll call for the logs."""
+    dates = sorted({r[0] for r in records})
+    students = {r[1] for r in records}
+    present = sum(r[2] for r in records)
+    shown = ",".join(dates[:max_ids]) + (f",+{len(dates) - max_ids}" if len(dates) > max_ids else "")
+    return (f"group={group_id} partial={partial} sessions={len(dates)} [{shown}] "
+            f"students={len(students)} records={len(records)} present={present} bytes={raw_bytes}")
+
+
+class AttendanceStore:
+    """Coalesces attendance upserts in memory and flushes them in bulk."""
+
+    def __init__(self, db_url, max_batch=500, max_age=0.5):
+        self.db_url = db_url
+        self.max_batch = max_batch
+        self.max_age = max_age
+        self._engine = None
+        self._engine_lock = threading.Lock()
+        self._pending = {}   # (group_id, date, student_id) -> (partial, present)
+        self._futures = []
+        self._oldest = None
+        self._cond = threading.Condition()
+        self._thread = None
+        # Held from dequeue to commit: one flush at a time, applied in the order batches were taken
+        self._write_lock = threading.Lock()
+        self._counters = {"received": 0, "coalesced": 0, "flushes": 0, "written": 0, "failed_flushes": 0}
+
+    # --- engine / schema ---------------------------------------------------
+
+    @property
+    def engine(self):
+        with self._engine_lock:
+            if self._engine is None:
+                self._engine = sqlalchemy.create_engine(self.db_url, pool_pre_ping=True)
+                with self._engine.begin() as conn:
+                    for statement in _SCHEMA:
+                        conn.execute(text(statement))
+            return self._engine
+
+    @property
+    def engine_if_started(self):
+        """The engine if something has used it already (for metrics; never connects)."""
+        return self._engine
+
+    # --- writes ------------------------------------------------------------
+
+    def add(self, group_id, partial, records):
+        """Queues (date, student_id, present) records; the Future resolves once they are durable."""
+        future = Future()
+        with self._cond:
+            self._ensure_thread()
+            for date, student_id, present in records:
+                key = (group_id, date, student_id)
+                if key in self._pending:
+                    self._counters["coalesced"] += 1
+                self._pending[key] = (partial, present)
+            self._counters["received"] += len(records)
+            self._futures.append(future)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            self._cond.notify()
+        return future
+
+    def flush(self):
+        """Writes everything that is pending right now (also used by the writer thread)."""
+        with self._write_lock:
+            with self._cond:
+                batch, futures = self._take()
+            if futures:
+                self._write(batch, futures)
+
+    def _take(self):
+        batch, futures = self._pending, self._futures
+        self._pending, self._futures, self._oldest = {}, [], None
+        return batch, futures
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="attendance-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._futures:
+                        age = time.monotonic() - self._oldest
+                        if len(self._pending) >= self.max_batch or age >= self.max_age:
+                            break
+                        self._cond.wait(self.max_age - age)
+                    else:
+                        self._cond.wait()
+            self.flush()
+
+    def _write(self, batch, futures):
+        try:
+            if batch:
+                self._upsert(batch)
+        except Exception as e:
+            logger.error(f"Attendance flush of {len(batch)} records failed: {e}")
+            with self._cond:
+                self._counters["failed_flushes"] += 1
+            for future in futures:
+                future.set_exception(e)
+            return
+        with self._cond:
+            self._counters["flushes"] += 1
+            self._counters["written"] += len(batch)
+        for future in futures:
+            future.set_result(len(batch))
+
+    def _upsert(self, batch):
+        keys = list(batch)
+        with self.engine.begin() as conn:
+            groups = sorted({key[0] for key in keys})
+            _lock_groups(conn, groups)
+            # Previous values of the touched records, to turn upserts into aggregate deltas
+            previous = {}
+            for group_id in groups:
+                dates = sorted({key[1] for key in keys if key[0] == group_id})
+                rows = conn.execute(text("""
+                    SELECT session_date, student_id, partial, present FROM attendance_records
+                    WHERE group_id = :group_id AND session_date IN :dates
+                """).bindparams(sqlalchemy.bindparam("dates", expanding=True)),
+                    {"group_id": group_id, "dates": dates})
+                for date, student_id, partial, present in rows:
+                    previous[(group_id, date, student_id)] = (partial, present)
+
+            group_deltas, student_deltas = {}, {}
+
+            def apply(group_id, partial, student_id, present, sign):
+                for deltas, key in ((group_deltas, (group_id, partial)),
+                                    (student_deltas, (group_id, partial, student_id))):
+                    p, t = deltas.get(key, (0, 0))
+                    deltas[key] = (p + sign * present, t + sign)
+
+            changed = []
+            for key in keys:
+                partial, present = batch[key]
+                old = previous.get(key)
+                if old == (partial, present):
+                    continue  # idempotent re-send
+                if old is not None:
+                    apply(key[0], old[0], key[2], old[1], -1)
+                apply(key[0], partial, key[2], present, +1)
+                changed.append({"group_id": key[0], "session_date": key[1], "student_id": key[2],
+                                "partial": partial, "present": present})
+
+            if not changed:
+                return
+            conn.execute(text("""
+                INSERT INTO attendance_records (group_id, session_date, student_id, partial, present)
+                VALUES (:group_id, :session_date, :student_id, :partial, :present)
+                ON CONFLICT (group_id, session_date, student_id)
+                DO UPDATE SET partial = excluded.partial, present = excluded.present
+            """), changed)
+            group_rows = [{"group_id": g, "partial": p, "present": d[0], "total": d[1]}
+                          for (g, p), d in group_deltas.items() if d != (0, 0)]
+            student_rows = [{"group_id": g, "partial": p, "student_id": st, "present": d[0], "total": d[1]}
+                            for (g, p, st), d in student_deltas.items() if d != (0, 0)]
+            if group_rows:
+                conn.execute(text("""
+                    INSERT INTO attendance_group_totals (group_id, partial, present_count, total_count)
+                    VALUES (:group_id, :partial, :present, :total)
+                    ON CONFLICT (group_id, partial) DO UPDATE SET
+                        present_count = attendance_group_totals.present_count + excluded.present_count,
+                        total_count = attendance_group_totals.total_count + excluded.total_count
+                """), group_rows)
+            if student_rows:
+                conn.execute(text("""
+                    INSERT INTO attendance_student_totals (group_id, partial, student_id, present_count, total_count)
+                    VALUES (:group_id, :partial, :student_id, :present, :total)
+                    ON CONFLICT (group_id, partial, student_id) DO UPDATE SET
+                        present_count = attendance_student_totals.present_count + excluded.present_count,
+                        total_count = attendance_student_totals.total_count + excluded.total_count
+                """), student_rows)
+
+    # --- reads -------------------------------------------------------------
+
+    def rates(self, group_id, partial=None, include_students=False):
+        """Attendance rates for a group, per partial (all partials when `partial` is None)."""
+        self.flush()
+        params = {"group_id": group_id, "partial": partial}
+        partial_filter = "" if partial is None else "AND partial = :partial"
+        with self.engine.connect() as conn:
+            groups = conn.execute(text(f"""
+                SELECT partial, present_count, total_count FROM attendance_group_totals
+                WHERE group_id = :group_id {partial_filter} ORDER BY partial
+            """), params).fetchall()
+            students = conn.execute(text(f"""
+                SELECT partial, student_id, present_count, total_count FROM attendance_student_totals
+                WHERE group_id = :group_id {partial_filter} ORDER BY partial, student_id
+            """), params).fetchall() if include_students else []
+
+        result = {}
+        for partial_id, present, total in groups:
+            result[partial_id] = {"present": present, "total": total, "attendanceRate": _rate(present, total)}
+        for partial_id, student_id, present, total in students:
+            entry = result.setdefault(partial_id, {"present": 0, "total": 0, "attendanceRate": 100.0})
+            entry.setdefault("students", {})[student_id] = {
+                "present": present, "total": total, "attendanceRate": _rate(present, total)}
+        return result
+
+    def rebuild_aggregates(self):
+        """Recomputes both aggregate tables from attendance_records."""
+        self.flush()
+        with self.engine.begin() as conn:
+            conn.execute(text("DELETE FROM attendance_group_totals"))
+            conn.execute(text("DELETE FROM attendance_student_totals"))
+            conn.execute(text("""
+                INSERT INTO attendance_group_totals (group_id, partial, present_count, total_count)
+                SELECT group_id, partial, SUM(present), COUNT(*) FROM attendance_records GROUP BY group_id, partial
+            """))
+            conn.execute(text("""
+                INSERT INTO attendance_student_totals (group_id, partial, student_id, present_count, total_count)
+                SELECT group_id, partial, student_id, SUM(present), COUNT(*) FROM attendance_records
+                GROUP BY group_id, partial, student_id
+            """))
+
+    def stats(self):
+        with self._cond:
+            return {**self._counters, "pending": len(self._pending)}
+
+
+def _lock_groups(conn, groups):
+    """
+    Serializes flushes of the same groups across instances until the transaction ends;
+    otherwise two instances could read the same previous records and both apply their
+    delta. Groups are locked in sorted order so two flushes can't deadlock. SQLite
+    (local runs) is single-process, where _write_lock already serializes flushes.
+    """
+    if conn.dialect.name != "postgresql":
+        return
+    for group_id in groups:
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": f"attendance:{group_id}"})
+
+
+def _rate(present, total):
+    return round(present * 100 / total, 1) if total else 100.0
@@ -0,0 +1,181 @@
+"""
+Threaded (gunicorn + Flask) vs async (uvicorn + asgi.py) serving, with a fake slow model.
+
+Starts each server in its own process with benchmarks/fakes.FakeGenerativeModel
+injected (main.use_model), then fires --requests POST /generate-student-feedback
+calls from --concurrency concurrent connections (cache disabled, so every request
+waits --latency-ms on the "model"). The threaded server runs one gunicorn worker
+with --threads threads (1, a single sync worker, is the production default);
+the async server is a single uvicorn process.
+
+Reports requests/sec, latency percentiles, errors and the server's peak RSS.
+With a 500 ms model the default threaded server tops out near 2 req/s (16 with --threads 8);
+the async one is bounded by --concurrency (and, in production, the model quota).
+
+    python benchmarks/serving_benchmark.py --requests 1000 --concurrency 200 --latency-ms 500
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKES_DIR = os.path.join(os.path.dirname(SERVICE_DIR), "benchmarks")
+MODES = ("threaded", "async")
+
+
+# --- server process ---
+
+def serve(mode, port, args):
+    sys.path[:0] = [SERVICE_DIR, FAKES_DIR]
+    import logging
+    import main
+    from fakes import Behaviour, FakeGenerativeModel
+
+    main.use_model(FakeGenerativeModel(Behaviour(latency_ms=args.latency_ms, error_rate=args.error_rate),
+                                       response_chars=args.response_chars))
+    logging.disable(logging.INFO)
+
+    if mode == "async":
+        import uvicorn
+        import asgi
+        uvicorn.run(asgi.app, host="127.0.0.1", port=port, log_level="warning", backlog=4096)
+        return
+
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in {"bind": f"127.0.0.1:{port}", "workers": 1, "threads": args.threads,
+                               "worker_class": "gthread", "timeout": 120, "backlog": 4096,
+                               "loglevel": "warning"}.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return main.app
+
+    Server().run()
+
+
+def peak_rss_mb(pid):
+    """VmHWM of a process and its children (gunicorn runs the app in a forked worker); Linux only."""
+    total, pids = 0, [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            pids += [int(child) for child in f.read().split()]
+        for each in pids:
+            with open(f"/proc/{each}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        total += int(line.split()[1])
+    except OSError:
+        return None
+    return total / 1024
+
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with code {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+# --- load generator ---
+
+async def post(port, path, body):
+    """One HTTP/1.1 request on a fresh connection; returns the status code."""
+    payload = json.dumps(body).encode("utf-8")
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        writer.write((f"POST {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                      f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n").encode("ascii") + payload)
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+    return int(response.split(b" ", 2)[1])
+
+
+async def load(port, requests, concurrency, mode):
+    latencies, statuses = [], {}
+    indices = iter(range(requests))
+
+    async def caller():
+        for i in indices:
+            body = {"student_name": f"{mode}-{i}", "subject": "Matemáticas", "grades": [70, 85],
+                    "attendance": 92, "cache": False}
+            started = time.perf_counter()
+            try:
+                status = await post(port, "/generate-student-feedback", body)
+            except OSError:
+                status = 0
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(caller() for _ in range(concurrency)))
+    return time.perf_counter() - started, sorted(latencies), statuses
+
+
+def run_mode(mode, args):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    env = dict(os.environ, MODEL_RATE_PER_SECOND="100000", MODEL_BURST="100000", SERVING_MODE=mode,
+               ATTENDANCE_DB_URL="sqlite://", PYTHONDONTWRITEBYTECODE="1")
+    command = [sys.executable, os.path.abspath(__file__), "--serve", mode, "--port", str(port),
+               "--latency-ms", str(args.latency_ms), "--error-rate", str(args.error_rate),
+               "--threads", str(args.threads), "--response-chars", str(args.response_chars)]
+    process = subprocess.Popen(command, cwd=SERVICE_DIR, env=env)
+    try:
+        wait_for_port(port, process)
+        asyncio.run(load(port, min(args.concurrency, 20), args.concurrency, f"warmup-{mode}"))
+        elapsed, latencies, statuses = asyncio.run(load(port, args.requests, args.concurrency, mode))
+        rss = peak_rss_mb(process.pid)
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=30)
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] * 1000
+    errors = sum(count for status, count in statuses.items() if status != 200)
+    print(f"{mode:9s} {len(latencies) / elapsed:9.1f} {pct(50):9.1f} {pct(95):9.1f} {pct(99):9.1f} "
+          f"{errors:7d} {rss if rss is not None else float('nan'):8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=200, help="concurrent client connections")
+    parser.add_argument("--latency-ms", type=float, default=500.0, help="fake model latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of model calls failing with a 503")
+    parser.add_argument("--threads", type=int, default=1, help="gunicorn threads for the threaded server")
+    parser.add_argument("--response-chars", type=int, default=1500)
+    parser.add_argument("--modes", nargs="*", default=list(MODES), choices=MODES)
+    parser.add_argument("--serve", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args)
+        return
+
+    print(f"{args.requests} requests, {args.concurrency} concurrent, model latency {args.latency_ms:.0f} ms")
+    print(f"{'mode':9s} {'req/s':>9s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'errors':>7s} {'rss MB':>8s}")
+    for mode in args.modes:
+        run_mode(mode, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Server-side group statistics for reports.
+
+Takes raw per-student data for one or many groups and computes the aggregates the
+frontend used to send as `stats` (approvalRate, groupAverage, atRiskStudentCount, ...),
+plus grade distributions and per-student risk flags. All groups are flattened into
+one set of arrays with a group index, and every aggregate is one vectorized
+NumPy pass (bincount over the group index), so a whole campus costs milliseconds.
+
+Rules mirror the web app (src/hooks/use-data.tsx):
+- finalGrade = earned points / possible points * 100, clamped to 0..100
+- approved when finalGrade >= 60
+- high risk: finalGrade <= 59 or attendance below 80%; medium risk: 59 < finalGrade <= 70
+  (getStudentRiskLevel; a 59.5 is neither approved nor high risk, as in the app)
+- a student with no attendance records counts as 100%
+"""
+import numpy as np
+
+APPROVAL_THRESHOLD = 60.0
+HIGH_RISK_MAX_GRADE = 59.0
+MEDIUM_RISK_MAX_GRADE = 70.0
+ATTENDANCE_RISK_THRESHOLD = 80.0
+
+GRADE_BUCKETS = ("0-59", "60-69", "70-79", "80-89", "90-100")
+_BUCKET_EDGES = np.array([60.0, 70.0, 80.0, 90.0])
+
+RISK_LEVELS = ("low", "medium", "high")
+
+
+def _group_arrays(group):
+    """
+    Converts one group payload into (student_ids, grades, present, total).
+
+    Accepted fields (one grade source and one optional attendance source):
+      grades: [finalGrade, ...]
+      criteria_scores: [[earned per criterion], ...] with criteria_weights: [possible points, ...]
+      attendance: [[true/false/null per day], ...]  or the app's {date: {studentId: bool}}
+      attendance_present / attendance_total: [count, ...]
+    """
+    student_ids = group.get("student_ids")
+
+    if group.get("criteria_scores") is not None:
+        scores = np.asarray(group["criteria_scores"], dtype=float)
+        if scores.ndim != 2:
+            if scores.size:
+                raise ValueError("criteria_scores must be a list of per-student lists")
+            scores = np.zeros((0, 0))
+        weights = np.asarray(group.get("criteria_weights") or [], dtype=float)
+        possible = weights.sum() if weights.size else 0.0
+        earned = np.nansum(scores, axis=1)
+        grades = earned / possible * 100 if possible > 0 else np.zeros(len(scores))
+    else:
+        grades = np.asarray(group.get("grades") or [], dtype=float)
+    grades = np.clip(np.nan_to_num(grades), 0, 100)
+    n = len(grades)
+
+    attendance = group.get("attendance")
+    if isinstance(attendance, dict):
+        if student_ids is None:
+            raise ValueError("student_ids is required with date-keyed attendance")
+        columns = {sid: i for i, sid in enumerate(student_ids)}
+        present = np.zeros(n)
+        total = np.zeros(n)
+        for day in attendance.values():
+            for sid, was_present in day.items():
+                i = columns.get(sid)
+                if i is not None:
+                    total[i] += 1
+                    present[i] += bool(was_present)
+    elif attendance is not None:
+        # true/false become 1/0 and null (no record that day) becomes NaN
+        matrix = np.array(attendance, dtype=float) if attendance else np.zeros((n, 0))
+        if matrix.ndim != 2:
+            raise ValueError("attendance rows must all have the same number of days")
+        recorded = ~np.isnan(matrix)
+        total = recorded.sum(axis=1).astype(float)
+        present = np.where(recorded, matrix, 0).sum(axis=1)
+    else:
+        present = np.asarray(group.get("attendance_present") or np.zeros(n), dtype=float)
+        total = np.asarray(group.get("attendance_total") or np.zeros(n), dtype=float)
+
+    if not (len(present) == len(total) == n):
+        raise ValueError("grade and attendance arrays must have one entry per student")
+    if student_ids is None:
+        student_ids = list(range(n))
+    elif len(student_ids) != n:
+        raise ValueError("student_ids must have one entry per student")
+    return list(student_ids), grades, present, total
+
+
+def parse_groups(groups):
+    """Converts group payloads to arrays; usually the most expensive step for large JSON bodies."""
+    return [_group_arrays(group) for group in groups]
+
+
+def compute_group_stats(groups, include_students=False, parsed=None):
+    """Returns one stats dict per input group, in order (camelCase keys, as the app uses)."""
+    if parsed is None:
+        parsed = parse_groups(groups)
+    n_groups = len(parsed)
+    if n_groups == 0:
+        return []
+
+    counts = np.array([len(p[1]) for p in parsed])
+    group_idx = np.repeat(np.arange(n_groups), counts)
+    grades = np.concatenate([p[1] for p in parsed]) if counts.sum() else np.zeros(0)
+    present = np.concatenate([p[2] for p in parsed]) if counts.sum() else np.zeros(0)
+    total = np.concatenate([p[3] for p in parsed]) if counts.sum() else np.zeros(0)
+
+    # Per-student derived values
+    attendance_rate = np.divide(present * 100, total, out=np.full_like(present, 100.0), where=total > 0)
+    approved = grades >= APPROVAL_THRESHOLD
+    high = (grades <= HIGH_RISK_MAX_GRADE) | (attendance_rate < ATTENDANCE_RISK_THRESHOLD)
+    medium = ~high & (grades <= MEDIUM_RISK_MAX_GRADE)
+    risk = np.where(high, 2, np.where(medium, 1, 0))
+    bucket = np.searchsorted(_BUCKET_EDGES, grades, side="right")
+
+    # Per-group aggregates: one bincount each over the group index
+    def per_group(weights=None):
+        return np.bincount(group_idx, weights=weights, minlength=n_groups)
+
+    safe_counts = np.maximum(counts, 1)
+    grade_sum = per_group(grades)
+    average = grade_sum / safe_counts
+    variance = np.maximum(per_group(grades * grades) / safe_counts - average ** 2, 0)
+    approved_count = per_group(approved.astype(float))
+    high_count = per_group(high.astype(float))
+    medium_count = per_group(medium.astype(float))
+    present_sum = per_group(present)
+    total_sum = per_group(total)
+    group_attendance = np.divide(present_sum * 100, total_sum, out=np.full(n_groups, 100.0), where=total_sum > 0)
+    distribution = np.bincount(group_idx * len(GRADE_BUCKETS) + bucket,
+                               minlength=n_groups * len(GRADE_BUCKETS)).reshape(n_groups, len(GRADE_BUCKETS))
+    grade_min = np.full(n_groups, np.nan)
+    grade_max = np.full(n_groups, np.nan)
+    if grades.size:
+        np.fmin.at(grade_min, group_idx, grades)
+        np.fmax.at(grade_max, group_idx, grades)
+
+    # Round and convert once for all groups; the loop below only slices Python lists
+    safe = counts > 0
+    columns = {
+        "totalStudents": counts,
+        "approvedCount": approved_count.astype(int),
+        "failedCount": counts - approved_count.astype(int),
+        "approvalRate": np.round(np.where(safe, approved_count * 100 / safe_counts, 0), 1),
+        "groupAverage": np.round(np.where(safe, average, 0), 1),
+        "gradeStdDev": np.round(np.where(safe, np.sqrt(variance), 0), 1),
+        "minGrade": np.round(grade_min, 1),
+        "maxGrade": np.round(grade_max, 1),
+        "attendanceRate": np.round(group_attendance, 1),
+        "atRiskStudentCount": (high_count + medium_count).astype(int),
+        "atRiskPercentage": np.round(np.where(safe, (high_count + medium_count) * 100 / safe_counts, 0), 1),
+        "highRiskCount": high_count.astype(int),
+        "mediumRiskCount": medium_count.astype(int),
+    }
+    columns = {key: values.tolist() for key, values in columns.items()}
+    distributions = distribution.tolist()
+
+    student_grades = np.round(grades, 2).tolist()
+    student_attendance = np.round(attendance_rate, 1).tolist()
+    student_risk = [RISK_LEVELS[level] for level in risk.tolist()]
+    flagged = np.nonzero(risk)[0]
+    flagged_bounds = np.searchsorted(flagged, np.concatenate([[0], np.cumsum(counts)])).tolist()
+    flagged = flagged.tolist()
+    offsets = np.concatenate([[0], np.cumsum(counts)]).tolist()
+
+    def student(ids, start, i):
+        return {"id": ids[i - start], "finalGrade": student_grades[i],
+                "attendanceRate": student_attendance[i], "riskLevel": student_risk[i]}
+
+    results = []
+    for g, group in enumerate(groups):
+        stats = {"groupId": group.get("group_id")}
+        stats.update((key, values[g]) for key, values in columns.items())
+        if not stats["totalStudents"]:
+            stats["minGrade"] = stats["maxGrade"] = None
+        stats["gradeDistribution"] = dict(zip(GRADE_BUCKETS, distributions[g]))
+
+        ids, start = parsed[g][0], offsets[g]
+        stats["atRiskStudents"] = [student(ids, start, i)
+                                   for i in flagged[flagged_bounds[g]:flagged_bounds[g + 1]]]
+        if include_students:
+            stats["students"] = [student(ids, start, i) for i in range(start, offsets[g + 1])]
+        results.append(stats)
+    return results
+
+
+def has_raw_data(group):
+    """True when a payload carries per-student data that stats can be computed from."""
+    return any(group.get(field) is not None for field in ("grades", "criteria_scores"))
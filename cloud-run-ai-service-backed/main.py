@@ -1,9 +1,20 @@
+import time
+_IMPORT_STARTED = time.perf_counter()  # Cold-start measurement (see health and benchmarks/cold_start.py)
+
 import os
 import logging
 import json
+import threading
 from datetime import datetime
-from flask import Flask, request, jsonify
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from flask import Flask, request, jsonify, Response, stream_with_context
 import google.generativeai as genai
+from response_cache import ResponseCache, cache_key
+from group_stats import compute_group_stats, has_raw_data
+from attendance_store import AttendanceStore, parse_attendance, summarize_payload
+from report_store import MaterializedReports, materialize, entry_key, GROUP_REPORT, STUDENT_FEEDBACK
+from metrics import REGISTRY, span, observe_stage, install_flask, sqlalchemy_pool_stats
+from model_scheduler import ModelScheduler, ModelUnavailableError, INTERACTIVE, BATCH
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -11,12 +22,82 @@ logger = logging.getLogger(__name__)
 
 # Force rebuild timestamp: 2025-12-19T07:30:00-update-prompt
 app = Flask(__name__)
+install_flask(app)  # /metrics, request timing, X-Profile: 1 -> Server-Timing stage breakdown
+
+# --- Metrics ---
+prompt_chars = REGISTRY.counter("prompt_chars_total", "Characters of prompts sent to the model")
+response_chars = REGISTRY.counter("response_chars_total", "Characters of generated text")
+generations_total = REGISTRY.counter("generations_total", "Model generations, by mode (blocking/stream)")
 
 # Initialize critical variables
 api_key = None
 model = None
 is_ai_ready = False 
 
+# Switching to gemini-2.5-flash-lite per user request for testing (cost/performance)
+model_name = 'gemini-2.5-flash-lite'
+
+# --- Model call scheduling: quota-sized token bucket, retries with backoff, circuit breaker ---
+model_scheduler = ModelScheduler.from_env()
+
+# --- Serving: "threaded" (gunicorn + Flask, main:app) or "async" (uvicorn, asgi:app); set by the Dockerfile ---
+SERVING_MODE = os.environ.get("SERVING_MODE", "threaded")
+
+# --- Startup diagnostics (list_models) are slow network calls: run them in the background only if asked ---
+AI_STARTUP_DIAGNOSTICS = os.environ.get("AI_STARTUP_DIAGNOSTICS", "0") == "1"
+
+# --- Attendance storage: coalesced upserts + incrementally maintained rates ---
+# The SQLite default lives on the container's in-memory filesystem, so on Cloud Run (K_SERVICE is set)
+# it would lose every roll call on scale-in or redeploy: there the attendance endpoints refuse with 503
+# until ATTENDANCE_DB_URL points at a real database.
+ATTENDANCE_DB_URL = os.environ.get("ATTENDANCE_DB_URL") or None
+ATTENDANCE_STORAGE_ERROR = None
+if ATTENDANCE_DB_URL is None and os.environ.get("K_SERVICE"):
+    ATTENDANCE_STORAGE_ERROR = "ATTENDANCE_DB_URL is not set; attendance is not stored on this deployment"
+    logger.error(f"⚠️ {ATTENDANCE_STORAGE_ERROR} (the local SQLite default would be lost with the instance)")
+attendance_store = AttendanceStore(
+    ATTENDANCE_DB_URL or "sqlite:///attendance.db",
+    max_batch=int(os.environ.get("ATTENDANCE_FLUSH_MAX_RECORDS", "500")),
+    max_age=float(os.environ.get("ATTENDANCE_FLUSH_MAX_AGE_SECONDS", "0.5")),
+)
+ATTENDANCE_WRITE_TIMEOUT = float(os.environ.get("ATTENDANCE_WRITE_TIMEOUT", "30"))
+
+REGISTRY.callback("response_cache_events", "Response cache counters (hits, misses, evictions, ...)",
+                  lambda: {k: v for k, v in response_cache.stats().items() if k not in ("entries", "bytes", "shared")},
+                  kind="counter", label="event")
+REGISTRY.callback("response_cache_bytes", "Bytes held by the in-process response cache",
+                  lambda: response_cache.stats()["bytes"])
+REGISTRY.callback("model_calls_total", "Model scheduler call outcomes (retries, rejections, ...)",
+                  lambda: {k: v for k, v in model_scheduler.stats().items() if isinstance(v, int) and k != "burst"},
+                  kind="counter", label="event")
+REGISTRY.callback("model_breaker_open", "1 while the model circuit breaker is open",
+                  lambda: int(model_scheduler.breaker.state == "open"))
+REGISTRY.callback("attendance_store_events", "Attendance writer counters",
+                  lambda: {k: v for k, v in attendance_store.stats().items() if k != "pending"},
+                  kind="counter", label="event")
+REGISTRY.callback("attendance_db_pool_connections", "Attendance SQLAlchemy connection pool state",
+                  lambda: sqlalchemy_pool_stats(attendance_store.engine_if_started), label="state")
+
+# --- Batch feedback limits ---
+FEEDBACK_BATCH_MAX_ITEMS = int(os.environ.get("FEEDBACK_BATCH_MAX_ITEMS", "100"))
+FEEDBACK_BATCH_CONCURRENCY = int(os.environ.get("FEEDBACK_BATCH_CONCURRENCY", "8"))
+FEEDBACK_BATCH_ITEM_TIMEOUT = float(os.environ.get("FEEDBACK_BATCH_ITEM_TIMEOUT", "60"))
+
+# --- Materialized reports (report_job.py): served before live generation; disabled when unset ---
+materialized_reports = MaterializedReports(os.environ.get("MATERIALIZED_REPORTS_DB_URL") or None)
+MATERIALIZE_CONCURRENCY = int(os.environ.get("MATERIALIZE_CONCURRENCY", "4"))
+REGISTRY.callback("materialized_reports_events", "Materialized report lookups and writes",
+                  lambda: {k: v for k, v in materialized_reports.stats().items() if k != "enabled"},
+                  kind="counter", label="event")
+
+# --- Response cache: in-process LRU + optional SQLite file shared across workers ---
+response_cache = ResponseCache(
+    max_entries=int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "500")),
+    max_bytes=int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", str(20 * 1024 * 1024))),
+    ttl_seconds=int(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", "3600")),
+    sqlite_path=os.environ.get("RESPONSE_CACHE_SQLITE_PATH") or None,
+)
+
 try:
     api_key = os.environ.get("GOOGLE_AI_API_KEY")
     
@@ -26,18 +107,8 @@ try:
         # --- CRITICAL: Configure without client_options ---
         genai.configure(api_key=api_key)
         logger.info("✅ Google Generative AI configured successfully")
-        
-        # --- DIAGNOSTIC: List available models ---
-        logger.info("🔍 Listing available models for this API Key (Diagnostic):")
-        try:
-            for m in genai.list_models():
-                if 'generateContent' in m.supported_generation_methods:
-                    logger.info(f"   - {m.name}")
-        except Exception as list_err:
-            logger.error(f"⚠️ Failed to list models: {list_err}")
-
-        # Switching to gemini-2.5-flash-lite per user request for testing (cost/performance)
-        model_name = 'gemini-2.5-flash-lite'
+
+        # Creating the model object is local; the first request opens the connection
         model = genai.GenerativeModel(model_name)
         logger.info(f"✅ Model initialized: {model_name} (Testing Flash-Lite variant)")
         is_ai_ready = True
@@ -46,81 +117,344 @@ except Exception as e:
     logger.error(f"CRITICAL ERROR: Failed to initialize AI model: {e}", flush=True)
     print(f"CRITICAL ERROR: {e}", flush=True)
 
-@app.route('/', methods=['GET'])
-def health():
-    """Health check endpoint."""
+def use_model(generative_model, name=None):
+    """
+    Injects the object used for generation instead of the Gemini client (tests,
+    benchmarks/service_benchmark.py). It only needs generate_content(prompt, stream=..., request_options=...),
+    plus generate_content_async with the same arguments for the ASGI app.
+    """
+    global model, model_name, is_ai_ready
+    model = generative_model
+    if name:
+        model_name = name
+    is_ai_ready = model is not None
+
+def run_model_diagnostics():
+    """Lists the models available to this API key that support generateContent."""
+    logger.info("🔍 Listing available models for this API Key (Diagnostic):")
+    models = []
+    for m in genai.list_models():
+        if 'generateContent' in m.supported_generation_methods:
+            logger.info(f"   - {m.name}")
+            models.append(m.name)
+    return models
+
+def _background_diagnostics():
+    try:
+        run_model_diagnostics()
+    except Exception as list_err:
+        logger.error(f"⚠️ Failed to list models: {list_err}")
+
+if is_ai_ready and AI_STARTUP_DIAGNOSTICS:
+    threading.Thread(target=_background_diagnostics, name="model-diagnostics", daemon=True).start()
+
+@app.route('/diagnostics', methods=['GET'])
+def diagnostics():
+    """On-demand model listing (kept off the startup path)."""
+    if not api_key:
+        return jsonify({"error": "GOOGLE_AI_API_KEY is not configured"}), 503
+    try:
+        started = time.perf_counter()
+        models = run_model_diagnostics()
+        return jsonify({
+            "configured_model": model_name,
+            "configured_model_available": any(name.endswith(model_name) for name in models),
+            "models": models,
+            "elapsed_seconds": round(time.perf_counter() - started, 3)
+        }), 200
+    except Exception as e:
+        logger.error(f"⚠️ Failed to list models: {e}")
+        return jsonify({"error": str(e)}), 500
+
+def health_status():
+    """Health payload and status code (shared with the ASGI app)."""
     status = "healthy" if is_ai_ready else "initializing"
-    return jsonify({
+    return {
         "status": status,
         "service": "AcTR-IA-Backend",
         "timestamp": datetime.utcnow().isoformat(),
         "version": "2.12-updated-prompt",
         "model": "gemini-2.5-flash" if is_ai_ready else "not-loaded",
         "api_key_configured": bool(api_key),
-        "endpoints": ["/generate-report", "/generate-group-report", "/generate-student-feedback"]
-    }), 200 if is_ai_ready else 500
+        "attendance_storage_configured": ATTENDANCE_STORAGE_ERROR is None,
+        "startup_seconds": round(STARTUP_SECONDS, 3),
+        "endpoints": ["/generate-report", "/generate-group-report", "/generate-student-feedback", "/generate-group-feedback-batch", "/group-stats", "/record-attendance", "/attendance-rate", "/metrics"],
+        "cache": response_cache.stats(),
+        "scheduler": model_scheduler.stats(),
+        "attendance": attendance_store.stats(),
+        "serving_mode": SERVING_MODE
+    }, 200 if is_ai_ready else 500
+
+@app.route('/', methods=['GET'])
+def health():
+    """Health check endpoint."""
+    payload, status_code = health_status()
+    return jsonify(payload), status_code
+
+def read_attendance_request(data):
+    """
+    Validates a /record-attendance body: {group_id, attendance_data: {date: {studentId: bool}}, partial?}.
+    Returns (group_id, partial, records); raises ValueError with the 400 message.
+    """
+    if not data:
+        logger.error("No data provided for attendance recording.")
+        raise ValueError("No data provided")
+    group_id = data.get('group_id')
+    partial = str(data.get('partial') or data.get('partial_id') or 'default')
+    if not group_id or data.get('attendance_data') is None:
+        raise ValueError("group_id and attendance_data are required")
+    try:
+        records = parse_attendance(data['attendance_data'])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid attendance_data: {e}")
+    return str(group_id), partial, records
 
 @app.route('/record-attendance', methods=['POST'])
 def record_attendance():
-    """Records student attendance data."""
+    """
+    Records student attendance data: {group_id, attendance_data: {date: {studentId: bool}}, partial?}.
+    Re-sending a roll call is idempotent; the response is sent once the records are stored.
+    """
+    if ATTENDANCE_STORAGE_ERROR:
+        return jsonify({"error": ATTENDANCE_STORAGE_ERROR}), 503
     try:
-        data = request.get_json()
-        if not data:
-            logger.error("No data provided for attendance recording.")
-            return jsonify({"error": "No data provided"}), 400
+        try:
+            group_id, partial, records = read_attendance_request(request.get_json())
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        logger.info(f"Received attendance data: {json.dumps(data, indent=2)}")
+        logger.info(f"Received attendance: {summarize_payload(group_id, partial, records, request.content_length or 0)}")
+        stored = attendance_store.add(group_id, partial, records).result(timeout=ATTENDANCE_WRITE_TIMEOUT)
 
-        return jsonify({"success": True, "message": "Attendance recorded successfully."}), 200
+        return jsonify({"success": True, "message": "Attendance recorded successfully.",
+                        "records": len(records), "batch_size": stored}), 200
 
     except Exception as e:
         logger.error(f"Error in /record-attendance: {e}", exc_info=True)
         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
 
-def call_generative_api(prompt: str) -> str:
+@app.route('/attendance-rate', methods=['GET'])
+def attendance_rate():
+    """Attendance rates for ?group_id=...[&partial=...][&students=1], read from the maintained totals."""
+    if ATTENDANCE_STORAGE_ERROR:
+        return jsonify({"error": ATTENDANCE_STORAGE_ERROR}), 503
+    try:
+        group_id = request.args.get('group_id')
+        if not group_id:
+            return jsonify({"error": "group_id is required"}), 400
+        partials = attendance_store.rates(group_id, request.args.get('partial'),
+                                          include_students=_flag(request.args.get('students')))
+        return jsonify({"group_id": group_id, "partials": partials}), 200
+    except Exception as e:
+        logger.error(f"Error in /attendance-rate: {e}", exc_info=True)
+        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
+
+def _generate_content(prompt, timeout=None, **kwargs):
+    if timeout:
+        kwargs["request_options"] = {"timeout": timeout}
+    return model.generate_content(prompt, **kwargs)
+
+def call_generative_api(prompt: str, timeout: float = None, priority: int = INTERACTIVE) -> str:
     """Call the Gemini model to generate content."""
     if not is_ai_ready or not model:
         raise Exception("Model not initialized. Check server logs for startup errors.")
     
     try:
         logger.info("🔄 Calling Gemini model with prompt length: " + str(len(prompt)))
-        response = model.generate_content(prompt)
+        prompt_chars.inc(len(prompt))
+        generations_total.inc(mode="blocking")
+        with span("generate_content"):
+            response = model_scheduler.call(_generate_content, prompt, timeout, priority=priority)
         
         if not response or not response.text:
             logger.error("⚠️ Empty response from Gemini model")
             raise Exception("Gemini model returned empty response")
         
         logger.info(f"✅ Gemini response received, length: {len(response.text)}")
+        response_chars.inc(len(response.text))
         return response.text
+    except ModelUnavailableError as e:
+        logger.error(f"❌ Gemini unavailable: {e}")
+        raise
     except Exception as e:
         logger.error(f"❌ Error calling Gemini: {e}", exc_info=True)
         raise Exception(f"Model generation failed: {str(e)}")
 
+def call_generative_api_stream(prompt: str, priority: int = INTERACTIVE):
+    """Stream text chunks from the Gemini model as they are generated."""
+    if not is_ai_ready or not model:
+        raise Exception("Model not initialized. Check server logs for startup errors.")
 
-@app.route('/generate-report', methods=['POST'])
-def generate_report():
-    """Generic report generation endpoint (alias for /generate-group-report)."""
-    return generate_group_report()
-
-@app.route('/generate-group-report', methods=['POST'])
-def generate_group_report():
-    """Generate an AI analysis for a group's academic performance."""
+    logger.info("🔄 Streaming Gemini response for prompt length: " + str(len(prompt)))
+    prompt_chars.inc(len(prompt))
+    generations_total.inc(mode="stream")
+    total = 0
+    started = time.perf_counter()
+    first_chunk = True
     try:
-        if not is_ai_ready:
-            error_msg = "AI model not initialized. Check server logs for startup errors."
-            logger.error(error_msg)
-            return jsonify({"error": error_msg}), 500
-            
-        data = request.get_json()
-        if not data:
-            return jsonify({"error": "No data provided"}), 400
-        
-        group_name = data.get('group_name', 'Unknown Group')
-        partial = data.get('partial', 'Unknown Partial')
-        stats = data.get('stats', {})
-        
-        # Adjusted prompt to include the specific greeting requested by the user
-        prompt = f'''Asume el rol de un Generador de Contenido Académico. Tu propósito es crear un **CUERPO DE TEXTO NARRATIVO continuo** para un informe formal.
+        for chunk in model_scheduler.call(_generate_content, prompt, stream=True, priority=priority):
+            if first_chunk:
+                observe_stage("generate_first_chunk", time.perf_counter() - started)
+                first_chunk = False
+            try:
+                piece = chunk.text
+            except ValueError:
+                # Chunks without text parts (e.g. safety/finish metadata) raise on .text
+                continue
+            if piece:
+                total += len(piece)
+                yield piece
+    except ModelUnavailableError as e:
+        logger.error(f"❌ Gemini unavailable: {e}")
+        raise
+    except Exception as e:
+        logger.error(f"❌ Error streaming from Gemini: {e}", exc_info=True)
+        raise Exception(f"Model generation failed: {str(e)}")
+
+    observe_stage("generate_stream", time.perf_counter() - started)
+    response_chars.inc(total)
+    if total == 0:
+        logger.error("⚠️ Empty response from Gemini model")
+        raise Exception("Gemini model returned empty response")
+    logger.info(f"✅ Gemini stream finished, length: {total}")
+
+def format_event(event, payload, use_sse):
+    """Serializes one streamed record as an SSE event or an NDJSON line."""
+    body = json.dumps(payload, ensure_ascii=False)
+    return f"event: {event}\ndata: {body}\n\n" if use_sse else body + "\n"
+
+# The request option helpers read Flask's request unless `args` (query) / `headers` are passed (ASGI app)
+def wants_sse(data, default=False, args=None, headers=None):
+    """format=sse|ndjson wins; otherwise the Accept header, then `default`."""
+    args = request.args if args is None else args
+    headers = request.headers if headers is None else headers
+    fmt = data.get('format', args.get('format'))
+    if fmt:
+        return fmt == 'sse'
+    return default or 'text/event-stream' in headers.get('Accept', '')
+
+def wants_stream(data, args=None, headers=None):
+    args = request.args if args is None else args
+    headers = request.headers if headers is None else headers
+    return _flag(data.get('stream', args.get('stream', False))) or \
+        'text/event-stream' in headers.get('Accept', '')
+
+def streaming_response(events, use_sse):
+    mimetype = "text/event-stream" if use_sse else "application/x-ndjson"
+    response = Response(stream_with_context(events), mimetype=mimetype)
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # Disable proxy buffering so chunks flush immediately
+    return response
+
+def _flag(value):
+    """Interprets JSON booleans and query-string values such as "0", "false", "no"."""
+    if isinstance(value, str):
+        return value.strip().lower() not in ("0", "false", "no", "off", "")
+    return bool(value)
+
+def cache_options(data, args=None):
+    """
+    Reads cache controls from the JSON body or query string:
+    cache=false skips the cache entirely, refresh=true regenerates and overwrites the entry.
+    """
+    args = request.args if args is None else args
+    use_cache = _flag(data.get('cache', args.get('cache', True)))
+    refresh = _flag(data.get('refresh', args.get('refresh', False)))
+    return use_cache, refresh
+
+def lookup_cached(key):
+    """Response cache first, then materialized reports (a hit there warms the response cache)."""
+    with span("cache_lookup"):
+        cached_text = response_cache.get(key)
+        if cached_text is None and materialized_reports.enabled:
+            cached_text = materialized_reports.get(key)
+            if cached_text is not None:
+                logger.info("📦 Materialized report found")
+                response_cache.set(key, cached_text)
+    return cached_text
+
+def generate_with_cache(prompt, use_cache=True, refresh=False, timeout=None, priority=INTERACTIVE):
+    """Returns (text, cached) for a prompt, serving repeated prompts from the response cache."""
+    if not use_cache:
+        response_cache.count("bypassed")
+        return call_generative_api(prompt, timeout=timeout, priority=priority), False
+
+    key = cache_key(prompt, model_name)
+    if refresh:
+        response_cache.count("refreshed")
+    else:
+        cached_text = lookup_cached(key)
+        if cached_text is not None:
+            logger.info("⚡ Response served from cache")
+            return cached_text, True
+
+    generated = call_generative_api(prompt, timeout=timeout, priority=priority)
+    response_cache.set(key, generated)
+    return generated, False
+
+def stream_with_cache(prompt, use_cache=True, refresh=False):
+    """
+    Streaming counterpart of generate_with_cache: yields (text_piece, cached) tuples.
+    A cache hit is returned as a single piece; a fresh stream is cached once complete.
+    """
+    if not use_cache:
+        response_cache.count("bypassed")
+        for piece in call_generative_api_stream(prompt):
+            yield piece, False
+        return
+
+    key = cache_key(prompt, model_name)
+    if refresh:
+        response_cache.count("refreshed")
+    else:
+        cached_text = lookup_cached(key)
+        if cached_text is not None:
+            logger.info("⚡ Response served from cache")
+            yield cached_text, True
+            return
+
+    parts = []
+    for piece in call_generative_api_stream(prompt):
+        parts.append(piece)
+        yield piece, False
+    response_cache.set(key, "".join(parts))
+
+def stream_generation(prompt, use_cache, refresh, use_sse, done_payload, error_prefix):
+    """Streams `chunk` events, then a `done` event carrying the usual response fields."""
+    def events():
+        cached = False
+        try:
+            for piece, cached in stream_with_cache(prompt, use_cache=use_cache, refresh=refresh):
+                yield format_event("chunk", {"text": piece}, use_sse)
+            yield format_event("done", {"success": True, **done_payload, "cached": cached}, use_sse)
+        except ModelUnavailableError as e:
+            yield format_event("error", {"error": f"{error_prefix}: {str(e)}", "retry_after": e.retry_after}, use_sse)
+        except Exception as e:
+            logger.error(f"Streaming generation failed: {e}")
+            yield format_event("error", {"error": f"{error_prefix}: {str(e)}"}, use_sse)
+    return streaming_response(events(), use_sse)
+
+def model_unavailable_response(e):
+    """503 with Retry-After when the scheduler is shedding load."""
+    response = jsonify({"error": f"Servicio de IA saturado, intenta de nuevo en {e.retry_after}s", "retry_after": e.retry_after})
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response, 503
+
+@app.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss counters and size of the response cache."""
+    return jsonify({**response_cache.stats(), "materialized": materialized_reports.stats()}), 200
+
+
+def build_group_report_prompt(data):
+    """Renders the group report prompt. Returns (prompt, group_name, partial)."""
+    group_name = data.get('group_name', 'Unknown Group')
+    partial = data.get('partial', 'Unknown Partial')
+    # Raw per-student data wins over client-computed stats, so every client gets the same numbers
+    stats = compute_group_stats([data])[0] if has_raw_data(data) else data.get('stats', {})
+    
+    # Adjusted prompt to include the specific greeting requested by the user
+    prompt = f'''Asume el rol de un Generador de Contenido Académico. Tu propósito es crear un **CUERPO DE TEXTO NARRATIVO continuo** para un informe formal.
 
 DATOS ESTADÍSTICOS (REFERENCIA INTERNA):
 Grupo: {group_name} - Período: {partial}
@@ -148,28 +482,45 @@ INSTRUCCIONES DE REDACCIÓN:
     *   No agregues despedidas ("Atentamente") ni firmas al final.
 
 Genera el informe completo.'''
-        
-        logger.info(f"Generating report for group: {group_name}, partial: {partial}")
-        report_text = call_generative_api(prompt)
+    return prompt, group_name, partial
+
+@app.route('/group-stats', methods=['POST'])
+def group_stats():
+    """
+    Computes report statistics from raw per-student data for one group or {"groups": [...]}.
+    Each group: grades or criteria_scores + criteria_weights, and attendance
+    (per-day matrix, the app's {date: {studentId: bool}} with student_ids, or present/total counts).
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+        groups = data.get('groups') if 'groups' in data else [data]
+        if not isinstance(groups, list) or not all(isinstance(g, dict) for g in groups):
+            return jsonify({"error": "groups must be a list of objects"}), 400
+
+        started = time.perf_counter()
+        try:
+            with span("group_stats"):
+                results = compute_group_stats(groups, include_students=bool(data.get('include_students')))
+        except (ValueError, TypeError) as e:
+            return jsonify({"error": str(e)}), 400
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        return jsonify({"groups": results, "elapsed_ms": round(elapsed_ms, 2)}), 200
 
-        if not report_text:
-            logger.warning("Report generated but is empty!")
-            report_text = "No se pudo generar el informe. Por favor intenta de nuevo."
-        
-        return jsonify({
-            "success": True,
-            "report": report_text,
-            "group": group_name,
-            "partial": partial
-        }), 200
-        
     except Exception as e:
-        logger.error(f"Error generating group report: {e}", exc_info=True)
-        return jsonify({"error": f"Error al generar informe: {str(e)}"}), 500
+        logger.error(f"Error in /group-stats: {e}", exc_info=True)
+        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
 
-@app.route('/generate-student-feedback', methods=['POST'])
-def generate_student_feedback():
-    """Generate personalized feedback for a student."""
+@app.route('/generate-report', methods=['POST'])
+def generate_report():
+    """Generic report generation endpoint (alias for /generate-group-report)."""
+    return generate_group_report()
+
+@app.route('/generate-group-report', methods=['POST'])
+def generate_group_report():
+    """Generate an AI analysis for a group's academic performance."""
     try:
         if not is_ai_ready:
             error_msg = "AI model not initialized. Check server logs for startup errors."
@@ -180,15 +531,46 @@ def generate_student_feedback():
         if not data:
             return jsonify({"error": "No data provided"}), 400
         
-        student_name = data.get('student_name', 'Estudiante')
-        subject = data.get('subject', 'Unknown')
-        grades = data.get('grades', [])
-        attendance = data.get('attendance', 0)
-        observations = data.get('observations', '')
-        
-        grades_summary = ', '.join([str(g) for g in grades]) if grades else 'No disponible'
+        with span("prompt_build"):
+            prompt, group_name, partial = build_group_report_prompt(data)
+
+        logger.info(f"Generating report for group: {group_name}, partial: {partial}")
+        use_cache, refresh = cache_options(data)
+        if wants_stream(data):
+            return stream_generation(prompt, use_cache, refresh, wants_sse(data, default=True),
+                                     {"group": group_name, "partial": partial}, "Error al generar informe")
+        report_text, cached = generate_with_cache(prompt, use_cache=use_cache, refresh=refresh)
+        return jsonify(group_report_body(report_text, group_name, partial, cached)), 200
         
-        prompt = f'''Asume el rol de un docente empático y profesional. Tu tarea es redactar una retroalimentación formal y completamente personalizada dirigida directamente a un estudiante.
+    except ModelUnavailableError as e:
+        return model_unavailable_response(e)
+    except Exception as e:
+        logger.error(f"Error generating group report: {e}", exc_info=True)
+        return jsonify({"error": f"Error al generar informe: {str(e)}"}), 500
+
+def group_report_body(report_text, group_name, partial, cached):
+    if not report_text:
+        logger.warning("Report generated but is empty!")
+        report_text = "No se pudo generar el informe. Por favor intenta de nuevo."
+    return {
+        "success": True,
+        "report": report_text,
+        "group": group_name,
+        "partial": partial,
+        "cached": cached
+    }
+
+def build_student_feedback_prompt(data):
+    """Renders the feedback prompt for one student payload. Returns (prompt, student_name, subject)."""
+    student_name = data.get('student_name', 'Estudiante')
+    subject = data.get('subject', 'Unknown')
+    grades = data.get('grades', [])
+    attendance = data.get('attendance', 0)
+    observations = data.get('observations', '')
+    
+    grades_summary = ', '.join([str(g) for g in grades]) if grades else 'No disponible'
+    
+    prompt = f'''Asume el rol de un docente empático y profesional. Tu tarea es redactar una retroalimentación formal y completamente personalizada dirigida directamente a un estudiante.
 
 DATOS DEL ESTUDIANTE:
 Nombre: {student_name}
@@ -217,32 +599,218 @@ El informe debe cubrir obligatoriamente las siguientes secciones en una redacci
    Incluye recomendaciones específicas sobre las anotaciones en la bitácora si es aplicable. Si el estudiante ha sido canalizado a atención psicológica, motívale para seguir adelante con el apoyo disponible, siempre de manera respetuosa y no invasiva. Recuérdale que el profesor está disponible para brindarle apoyo continuo y expresa plena confianza en sus capacidades para superar los desafíos.
 
 Redacta la retroalimentación completa, comenzando directamente con el análisis formal y dirigiéndote al estudiante en segunda persona (tú/usted).'''
+    return prompt, student_name, subject
 
+@app.route('/generate-student-feedback', methods=['POST'])
+def generate_student_feedback():
+    """Generate personalized feedback for a student."""
+    try:
+        if not is_ai_ready:
+            error_msg = "AI model not initialized. Check server logs for startup errors."
+            logger.error(error_msg)
+            return jsonify({"error": error_msg}), 500
+            
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
         
-        logger.info(f"Generating feedback for student: {student_name}, subject: {subject}")
-        feedback_text = call_generative_api(prompt)
+        with span("prompt_build"):
+            prompt, student_name, subject = build_student_feedback_prompt(data)
 
-        if not feedback_text:
-            logger.warning(f"Feedback generated but is empty for student {student_name}!")
-            feedback_text = "No se pudo generar la retroalimentación. Por favor intenta de nuevo."
-        
-        # Log preview of the feedback to confirm content
-        preview = feedback_text[:100].replace('\n', ' ') if feedback_text else "EMPTY"
-        logger.info(f"📝 Feedback generated (preview): {preview}...")
-        
-        response_json = {
-            "success": True,
-            "feedback": feedback_text,
-            "student": student_name,
-            "subject": subject
-        }
-        
-        return jsonify(response_json), 200
+        logger.info(f"Generating feedback for student: {student_name}, subject: {subject}")
+        use_cache, refresh = cache_options(data)
+        if wants_stream(data):
+            return stream_generation(prompt, use_cache, refresh, wants_sse(data, default=True),
+                                     {"student": student_name, "subject": subject}, "Error al generar retroalimentación")
+        feedback_text, cached = generate_with_cache(prompt, use_cache=use_cache, refresh=refresh)
+        return jsonify(student_feedback_body(feedback_text, student_name, subject, cached)), 200
         
+    except ModelUnavailableError as e:
+        return model_unavailable_response(e)
     except Exception as e:
         logger.error(f"Error generating student feedback: {e}", exc_info=True)
         return jsonify({"error": f"Error al generar retroalimentación: {str(e)}"}), 500
 
+def student_feedback_body(feedback_text, student_name, subject, cached):
+    if not feedback_text:
+        logger.warning(f"Feedback generated but is empty for student {student_name}!")
+        feedback_text = "No se pudo generar la retroalimentación. Por favor intenta de nuevo."
+
+    # Log preview of the feedback to confirm content
+    preview = feedback_text[:100].replace('\n', ' ') if feedback_text else "EMPTY"
+    logger.info(f"📝 Feedback generated (preview): {preview}...")
+
+    return {
+        "success": True,
+        "feedback": feedback_text,
+        "student": student_name,
+        "subject": subject,
+        "cached": cached
+    }
+
+def _generate_feedback_item(index, item, started, use_cache, refresh, item_timeout):
+    """Generates feedback for one batch entry; records its start time for the timeout watchdog."""
+    started[index] = time.monotonic()
+    with span("prompt_build"):
+        prompt, student_name, subject = build_student_feedback_prompt(item)
+    feedback_text, cached = generate_with_cache(prompt, use_cache=use_cache, refresh=refresh,
+                                                timeout=item_timeout, priority=BATCH)
+    if not feedback_text:
+        raise Exception("Gemini model returned empty response")
+    return {"student": student_name, "subject": subject, "feedback": feedback_text, "cached": cached}
+
+def iter_batch_feedback(items, concurrency, item_timeout, use_cache=True, refresh=False):
+    """
+    Fans feedback generation out over a thread pool and yields one result dict per
+    student as soon as it finishes. Failures and timeouts are reported per item.
+    """
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="feedback-batch")
+    started = {}
+    futures = {
+        executor.submit(_generate_feedback_item, index, item, started, use_cache, refresh, item_timeout): (index, item)
+        for index, item in enumerate(items)
+    }
+    pending = set(futures)
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, item = futures[future]
+                try:
+                    yield {"index": index, "success": True, **future.result()}
+                except Exception as e:
+                    logger.error(f"Batch feedback failed for item {index}: {e}")
+                    yield {"index": index, "success": False, "student": item.get('student_name', 'Estudiante'), "error": str(e)}
+
+            # The request_options timeout bounds the model call; this also catches items stuck elsewhere
+            now = time.monotonic()
+            for future in list(pending):
+                index, item = futures[future]
+                if index in started and now - started[index] > item_timeout:
+                    pending.discard(future)
+                    yield {"index": index, "success": False, "student": item.get('student_name', 'Estudiante'),
+                           "error": f"Timed out after {item_timeout:.0f}s"}
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+@app.route('/generate-group-feedback-batch', methods=['POST'])
+def generate_group_feedback_batch():
+    """
+    Generate feedback for a list of students in one request.
+    Body: {"students": [<same payload as /generate-student-feedback>, ...], "concurrency": n,
+    "item_timeout": seconds, "format": "ndjson" | "sse"}. Results are streamed as each
+    student finishes, followed by a summary record.
+    """
+    try:
+        if not is_ai_ready:
+            error_msg = "AI model not initialized. Check server logs for startup errors."
+            logger.error(error_msg)
+            return jsonify({"error": error_msg}), 500
+
+        # Shed the whole batch up front instead of failing every student one by one
+        if model_scheduler.breaker.state == "open":
+            return model_unavailable_response(ModelUnavailableError(
+                "Model temporarily unavailable (circuit open)", retry_after=model_scheduler.breaker.retry_after()))
+
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+
+        items = data.get('students')
+        if not isinstance(items, list) or not items:
+            return jsonify({"error": "'students' must be a non-empty list"}), 400
+        if len(items) > FEEDBACK_BATCH_MAX_ITEMS:
+            return jsonify({"error": f"Too many students (max {FEEDBACK_BATCH_MAX_ITEMS})"}), 400
+        if not all(isinstance(item, dict) for item in items):
+            return jsonify({"error": "Each student entry must be an object"}), 400
+
+        concurrency = max(1, min(int(data.get('concurrency', FEEDBACK_BATCH_CONCURRENCY)), FEEDBACK_BATCH_CONCURRENCY))
+        item_timeout = max(1.0, min(float(data.get('item_timeout', FEEDBACK_BATCH_ITEM_TIMEOUT)), FEEDBACK_BATCH_ITEM_TIMEOUT))
+        use_cache, refresh = cache_options(data)
+        use_sse = wants_sse(data)
+
+        logger.info(f"Generating batch feedback for {len(items)} students (concurrency {concurrency})")
+
+        def generate():
+            succeeded = failed = 0
+            for result in iter_batch_feedback(items, concurrency, item_timeout, use_cache, refresh):
+                if result["success"]:
+                    succeeded += 1
+                else:
+                    failed += 1
+                yield format_event("result", {"type": "result", **result}, use_sse)
+            yield format_event("summary", {"type": "summary", "total": len(items), "succeeded": succeeded, "failed": failed}, use_sse)
+
+        return streaming_response(generate(), use_sse)
+
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid parameter: {e}"}), 400
+    except Exception as e:
+        logger.error(f"Error generating batch feedback: {e}", exc_info=True)
+        return jsonify({"error": f"Error al generar retroalimentación: {str(e)}"}), 500
+
+def materialization_entries(groups):
+    """
+    (kind, entry_key, fingerprint, prompt) for every group report and student feedback in a
+    snapshot. Each group is a /generate-group-report payload; its optional "feedback" list holds
+    /generate-student-feedback payloads (e.g. the at-risk students).
+    """
+    for group in groups:
+        if not isinstance(group, dict):
+            raise ValueError("Each group must be an object")
+        prompt, group_name, partial = build_group_report_prompt(group)
+        yield GROUP_REPORT, entry_key(group_name, partial), cache_key(prompt, model_name), prompt
+        for item in group.get('feedback') or []:
+            if not isinstance(item, dict):
+                raise ValueError("Each feedback entry must be an object")
+            prompt, student_name, subject = build_student_feedback_prompt(item)
+            yield (STUDENT_FEEDBACK, entry_key(group_name, partial, student_name, subject),
+                   cache_key(prompt, model_name), prompt)
+
+def materialize_reports(groups, concurrency=MATERIALIZE_CONCURRENCY, force=False):
+    """Pre-generates the snapshot's reports, regenerating only entries whose inputs changed."""
+    entries = list(materialization_entries(groups))
+    return materialize(materialized_reports, entries,
+                       lambda prompt: call_generative_api(prompt, priority=BATCH),
+                       model_name=model_name, concurrency=concurrency, force=force)
+
+@app.route('/materialize-reports', methods=['POST'])
+def materialize_reports_endpoint():
+    """
+    Pre-generates group reports and student feedback for a snapshot of groups and partials
+    (same job as report_job.py, e.g. for Cloud Scheduler).
+    Body: {"groups": [<group report payload, optionally with "feedback": [<student payload>, ...]>],
+    "force": false, "concurrency": n}. Returns counts of unchanged, generated and failed entries.
+    """
+    try:
+        if not is_ai_ready:
+            error_msg = "AI model not initialized. Check server logs for startup errors."
+            logger.error(error_msg)
+            return jsonify({"error": error_msg}), 500
+        if not materialized_reports.enabled:
+            return jsonify({"error": "MATERIALIZED_REPORTS_DB_URL is not set"}), 500
+
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+        groups = data.get('groups')
+        if not isinstance(groups, list) or not groups:
+            return jsonify({"error": "'groups' must be a non-empty list"}), 400
+
+        concurrency = max(1, min(int(data.get('concurrency', MATERIALIZE_CONCURRENCY)), MATERIALIZE_CONCURRENCY))
+        with span("materialize"):
+            summary = materialize_reports(groups, concurrency=concurrency, force=_flag(data.get('force', False)))
+        return jsonify({"success": summary["failed"] == 0, **summary}), 200
+
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid parameter: {e}"}), 400
+    except Exception as e:
+        logger.error(f"Error materializing reports: {e}", exc_info=True)
+        return jsonify({"error": f"Error al generar informes: {str(e)}"}), 500
+
+STARTUP_SECONDS = time.perf_counter() - _IMPORT_STARTED
+logger.info(f"AI backend module loaded in {STARTUP_SECONDS:.2f}s")
+
 if __name__ == "__main__":
     port = int(os.environ.get('PORT', 8080))
     logger.info(f"🚀 Starting Flask app on port {port}")
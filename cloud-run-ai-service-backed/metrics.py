@@ -0,0 +1,243 @@
+"""
+Lightweight in-process metrics with a Prometheus text endpoint.
+
+- span("stage") times a block into the `stage_seconds` summary (p50/p95/p99 over
+  the most recent samples, plus _sum/_count) and, when the request asked for it
+  with an `X-Profile: 1` header, into a per-request breakdown returned as a
+  `Server-Timing` response header.
+- Counters are labelled, monotonic totals (bytes processed, prompt sizes, ...).
+- Callbacks read existing stats (SQLAlchemy pool, caches, scheduler) at scrape time.
+
+The same module ships in both Cloud Run services (each one builds from its own
+directory); tests/test_shared_modules.py in each service fails if the copies differ.
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+QUANTILES = (0.5, 0.95, 0.99)
+PROFILE_HEADER = "X-Profile"
+
+_profile = contextvars.ContextVar("metrics_profile", default=None)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in sorted(labels.items())) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(dict(key))} {value}" for key, value in sorted(values.items())]
+        return lines
+
+
+class Summary:
+    """Sum/count since start plus quantiles over the last `window` observations per label set."""
+
+    def __init__(self, name, help_text, window=1024):
+        self.name = name
+        self.help = help_text
+        self.window = window
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [deque(maxlen=self.window), 0.0, 0]
+            series[0].append(value)
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self):
+        """{labels tuple: {"p50": ..., "p95": ..., "p99": ..., "sum": ..., "count": ...}}"""
+        with self._lock:
+            series = {key: (sorted(samples), total, count) for key, (samples, total, count) in self._series.items()}
+        result = {}
+        for key, (samples, total, count) in series.items():
+            stats = {f"p{int(q * 100)}": samples[min(len(samples) - 1, int(q * len(samples)))] for q in QUANTILES}
+            result[key] = {**stats, "sum": total, "count": count}
+        return result
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} summary"]
+        for key, stats in sorted(self.snapshot().items()):
+            labels = dict(key)
+            for q in QUANTILES:
+                lines.append(f"{self.name}{_labels({**labels, 'quantile': q})} {stats[f'p{int(q * 100)}']:.6f}")
+            lines.append(f"{self.name}_sum{_labels(labels)} {stats['sum']:.6f}")
+            lines.append(f"{self.name}_count{_labels(labels)} {stats['count']}")
+        return lines
+
+
+class Callback:
+    """Value(s) read at scrape time: fn() returns a number or a {label_value: number} dict."""
+
+    def __init__(self, name, help_text, fn, kind="gauge", label="key"):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+        self.kind = kind
+        self.label = label
+
+    def render(self):
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        if value is None:
+            return []
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        if isinstance(value, dict):
+            lines += [f"{self.name}{_labels({self.label: key})} {number}"
+                      for key, number in sorted(value.items()) if isinstance(number, (int, float))]
+        else:
+            lines.append(f"{self.name} {value}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self.stages = self.summary("stage_seconds", "Time spent per processing stage")
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text):
+        return self._register(Counter(name, help_text))
+
+    def summary(self, name, help_text):
+        return self._register(Summary(name, help_text))
+
+    def callback(self, name, help_text, fn, kind="gauge", label="key"):
+        return self._register(Callback(name, help_text, fn, kind, label))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def observe_stage(stage, seconds):
+    REGISTRY.stages.observe(seconds, stage=stage)
+    profile = _profile.get()
+    if profile is not None:
+        profile.append((stage, seconds))
+
+
+def start_profile(enabled):
+    """Starts collecting this request's stages (X-Profile); returns (profile, token) for finish_profile."""
+    if not enabled:
+        return None, None
+    profile = []
+    return profile, _profile.set(profile)
+
+
+def finish_profile(token):
+    if token is not None:
+        _profile.reset(token)
+
+
+def wants_profile(header_value):
+    return (header_value or "").strip().lower() in ("1", "true", "yes")
+
+
+def server_timing(profile, elapsed):
+    """Server-Timing header value: per-stage totals plus the whole request, in milliseconds."""
+    totals = {}
+    for stage, seconds in profile:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    timings = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in totals.items()]
+    timings.append(f"total;dur={elapsed * 1000:.2f}")
+    return ", ".join(timings)
+
+
+@contextmanager
+def span(stage):
+    """Times the enclosed block as `stage`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def sqlalchemy_pool_stats(engine):
+    """Connection pool state of a SQLAlchemy engine (QueuePool-style pools)."""
+    if engine is None:
+        return None
+    pool = engine.pool
+    stats = {}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        fn = getattr(pool, name, None)
+        if callable(fn):
+            stats[name] = fn()
+    return stats
+
+
+def install_flask(app, registry=REGISTRY, path="/metrics"):
+    """Adds request timing, the X-Profile breakdown and the /metrics endpoint to a Flask app."""
+    from flask import Response, g, request
+
+    requests_total = registry.counter("http_requests_total", "HTTP requests by endpoint and status")
+    request_seconds = registry.summary("http_request_seconds", "HTTP request latency by endpoint")
+
+    @app.before_request
+    def _start_request():
+        g._metrics_start = time.perf_counter()
+        g._metrics_profile, g._metrics_token = start_profile(wants_profile(request.headers.get(PROFILE_HEADER)))
+
+    @app.after_request
+    def _finish_request(response):
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        elapsed = time.perf_counter() - g.get("_metrics_start", time.perf_counter())
+        requests_total.inc(endpoint=endpoint, status=response.status_code)
+        request_seconds.observe(elapsed, endpoint=endpoint)
+        profile = g.get("_metrics_profile")
+        if profile is not None:
+            # Streamed bodies are produced after this point, so their stages are not included
+            response.headers["Server-Timing"] = server_timing(profile, elapsed)
+        return response
+
+    @app.teardown_request
+    def _reset_profile(_exc):
+        finish_profile(g.pop("_metrics_token", None))
+
+    @app.route(path, methods=["GET"])
+    def metrics():
+        return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+    return app
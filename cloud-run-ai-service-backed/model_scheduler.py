@@ -0,0 +1,316 @@
+"""
+Client-side scheduler for model calls (Gemini / Vertex AI).
+
+- A token bucket sized to the project quota paces outgoing calls; waiting callers
+  are served by priority lane first (interactive before batch before background).
+- Retryable errors (429 / RESOURCE_EXHAUSTED, 503, deadline) are retried with
+  full-jitter exponential backoff.
+- A circuit breaker opens after repeated retryable failures and rejects calls
+  immediately with ModelUnavailableError until the cool-down has passed.
+- call_async() applies the same policy to coroutine functions; it waits for
+  tokens and backoff with asyncio.sleep, so it never blocks the event loop.
+
+The same module ships in both Cloud Run services (each one builds from its own
+directory); tests/test_shared_modules.py in each service fails if the copies differ.
+"""
+import os
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+BATCH = 1
+BACKGROUND = 2
+
+_RETRYABLE_NAMES = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable",
+                    "DeadlineExceeded", "InternalServerError", "GatewayTimeout", "Aborted"}
+_RETRYABLE_MARKERS = ("429", "resource_exhausted", "resource exhausted", "quota", "503",
+                      "unavailable", "deadline exceeded", "timed out")
+
+
+class ModelUnavailableError(Exception):
+    """The model cannot be called right now; callers should answer 503 with Retry-After."""
+
+    def __init__(self, message, retry_after=30):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_retryable(error):
+    """True for quota, overload and timeout errors; False for bad requests and the like."""
+    for cls in type(error).__mro__:
+        if cls.__name__ in _RETRYABLE_NAMES:
+            return True
+    message = str(error).lower()
+    return any(marker in message for marker in _RETRYABLE_MARKERS)
+
+
+class TokenBucket:
+    """Token bucket whose waiters are served in (priority, arrival) order."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._waiters = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _try_take(self, entry):
+        """With the lock held: takes a token for `entry` if it is first in line, else returns how long to wait."""
+        self._refill()
+        if self._waiters[0] == entry and self._tokens >= 1:
+            heapq.heappop(self._waiters)
+            self._tokens -= 1
+            return None
+        return (1 - self._tokens) / self.rate if self._tokens < 1 else 0.05
+
+    def _leave(self, entry):
+        self._waiters.remove(entry)
+        heapq.heapify(self._waiters)
+
+    def acquire(self, priority=INTERACTIVE, timeout=None):
+        """Blocks until a token is available for this caller; returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        entry = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    wait = self._try_take(entry)
+                    if wait is None:
+                        return True
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._leave(entry)
+                            return False
+                        wait = min(wait, remaining)
+                    self._cond.wait(max(wait, 0.001))
+            finally:
+                self._cond.notify_all()
+
+    async def acquire_async(self, priority=INTERACTIVE, timeout=None):
+        """acquire() for coroutines: same queue and order, but waits with asyncio.sleep."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        entry = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+        taken = False
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_take(entry)
+                    if wait is None:
+                        taken = True
+                        return True
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return False
+                        wait = min(wait, remaining)
+                # Polls (at most every 50 ms): threaded callers releasing their turn can't wake the loop
+                await asyncio.sleep(min(max(wait, 0.001), 0.05))
+        finally:
+            with self._cond:
+                if not taken and entry in self._waiters:
+                    self._leave(entry)  # timed out or cancelled
+                self._cond.notify_all()
+
+
+class CircuitBreaker:
+    """closed -> open after `failure_threshold` consecutive failures -> half-open after `reset_timeout`."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial = None  # token of the half-open trial call in flight
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def retry_after(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 0
+            return max(1, int(self.reset_timeout - (time.monotonic() - self._opened_at)))
+
+    def allow(self):
+        """
+        Raises ModelUnavailableError while open; lets a single trial call through when half-open.
+        Returns the trial's token (None when closed); pass it to release_trial() once the call is over.
+        """
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return None
+            if state == "half_open" and self._trial is None:
+                self._trial = object()
+                return self._trial
+            remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+        raise ModelUnavailableError("Model temporarily unavailable (circuit open)", retry_after=max(1, int(remaining)))
+
+    def release_trial(self, trial):
+        """
+        Ends a trial that recorded no outcome (e.g. it timed out waiting for a token or
+        was cancelled), so the next call can be the trial instead.
+        """
+        with self._lock:
+            if trial is not None and self._trial is trial:
+                self._trial = None
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning(f"⚠️ Circuit breaker opened after {self._failures} consecutive failures")
+                self._opened_at = time.monotonic()
+            self._trial = None
+
+
+class ModelScheduler:
+    """Runs model calls through the token bucket, retry policy and circuit breaker."""
+
+    def __init__(self, rate=5.0, burst=10, max_attempts=4, backoff_base=0.5, backoff_max=8.0,
+                 queue_timeout=30.0, failure_threshold=5, reset_timeout=30):
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "succeeded": 0, "retries": 0, "failed": 0,
+                          "rejected_open": 0, "rejected_queue": 0}
+
+    @classmethod
+    def from_env(cls, prefix="MODEL_"):
+        env = lambda name, default: os.environ.get(prefix + name, default)  # noqa: E731
+        return cls(
+            rate=float(env("RATE_PER_SECOND", "5")),
+            burst=int(env("BURST", "10")),
+            max_attempts=int(env("MAX_ATTEMPTS", "4")),
+            backoff_base=float(env("BACKOFF_BASE_SECONDS", "0.5")),
+            backoff_max=float(env("BACKOFF_MAX_SECONDS", "8")),
+            queue_timeout=float(env("QUEUE_TIMEOUT_SECONDS", "30")),
+            failure_threshold=int(env("BREAKER_FAILURE_THRESHOLD", "5")),
+            reset_timeout=int(env("BREAKER_RESET_SECONDS", "30")),
+        )
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _admit(self):
+        """Returns the breaker trial token of this attempt (see CircuitBreaker.allow)."""
+        try:
+            return self.breaker.allow()
+        except ModelUnavailableError:
+            self._count("rejected_open")
+            raise
+
+    def _rejected_queue(self):
+        self._count("rejected_queue")
+        return ModelUnavailableError("Model call queue timed out (rate limit)", retry_after=5)
+
+    def _failed_attempt(self, attempt, e):
+        """Records a failed attempt. Returns the backoff before the next one, or None to re-raise `e`."""
+        if not is_retryable(e):
+            # Caller errors say nothing about model health
+            self.breaker.record_success()
+            self._count("failed")
+            return None
+        self.breaker.record_failure()
+        if attempt + 1 >= self.max_attempts or self.breaker.state == "open":
+            self._count("failed")
+            raise ModelUnavailableError(f"Model unavailable after {attempt + 1} attempts: {e}",
+                                        retry_after=max(self.breaker.retry_after(), 5)) from e
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        logger.warning(f"Retryable model error (attempt {attempt + 1}/{self.max_attempts}), "
+                       f"retrying in {delay:.2f}s: {e}")
+        self._count("retries")
+        return delay
+
+    def _succeeded(self):
+        self.breaker.record_success()
+        self._count("succeeded")
+
+    def call(self, fn, *args, priority=INTERACTIVE, **kwargs):
+        """Calls `fn(*args, **kwargs)` under rate limiting, retries and the circuit breaker."""
+        self._count("calls")
+        for attempt in range(self.max_attempts):
+            trial = self._admit()
+            try:
+                if not self.bucket.acquire(priority, timeout=self.queue_timeout):
+                    raise self._rejected_queue()
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception as e:
+                    delay = self._failed_attempt(attempt, e)
+                    if delay is None:
+                        raise
+                else:
+                    self._succeeded()
+                    return result
+            finally:
+                self.breaker.release_trial(trial)
+            time.sleep(delay)
+
+    async def call_async(self, fn, *args, priority=INTERACTIVE, **kwargs):
+        """Awaits `fn(*args, **kwargs)` (a coroutine function) under the same policy as call()."""
+        self._count("calls")
+        for attempt in range(self.max_attempts):
+            trial = self._admit()
+            try:
+                if not await self.bucket.acquire_async(priority, timeout=self.queue_timeout):
+                    raise self._rejected_queue()
+                try:
+                    result = await fn(*args, **kwargs)
+                except Exception as e:
+                    delay = self._failed_attempt(attempt, e)
+                    if delay is None:
+                        raise
+                else:
+                    self._succeeded()
+                    return result
+            finally:
+                # Also reached on CancelledError, which the except above doesn't catch
+                self.breaker.release_trial(trial)
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        return {**counters, "breaker": self.breaker.state,
+                "rate_per_second": self.bucket.rate, "burst": self.bucket.capacity}
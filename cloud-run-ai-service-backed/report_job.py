@@ -0,0 +1,61 @@
+"""
+Pre-generates group reports and student feedback so requests don't wait on Gemini.
+
+Reads a snapshot of every group and partial (JSON: {"groups": [...]}, each group a
+/generate-group-report payload with an optional "feedback" list of
+/generate-student-feedback payloads) and stores the generated text in
+MATERIALIZED_REPORTS_DB_URL. Entries whose prompt fingerprint is unchanged since the
+last run are skipped, so re-running the job after new grades only regenerates the
+affected groups and students. The request handlers serve a stored result when the
+prompt they build matches, and generate live otherwise.
+
+Run it on a schedule (e.g. as a Cloud Run Job from the same image, before the end of
+each partial), or POST the same snapshot to /materialize-reports:
+
+    MATERIALIZED_REPORTS_DB_URL=... GOOGLE_AI_API_KEY=... python report_job.py snapshot.json
+    cat snapshot.json | python report_job.py - --concurrency 8
+"""
+import argparse
+import json
+import logging
+import sys
+
+from main import materialize_reports, is_ai_ready, materialized_reports, MATERIALIZE_CONCURRENCY
+
+logger = logging.getLogger("report_job")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("snapshot", help="JSON snapshot file, or - for stdin")
+    parser.add_argument("--concurrency", type=int, default=MATERIALIZE_CONCURRENCY)
+    parser.add_argument("--force", action="store_true", help="Regenerate every entry, changed or not")
+    args = parser.parse_args()
+
+    if not is_ai_ready:
+        logger.error("AI model not initialized; check GOOGLE_AI_API_KEY")
+        return 1
+    if not materialized_reports.enabled:
+        logger.error("MATERIALIZED_REPORTS_DB_URL is not set")
+        return 1
+
+    if args.snapshot == "-":
+        snapshot = json.load(sys.stdin)
+    else:
+        with open(args.snapshot, encoding="utf-8") as f:
+            snapshot = json.load(f)
+    groups = snapshot.get("groups") if isinstance(snapshot, dict) else snapshot
+    if not isinstance(groups, list):
+        logger.error("Snapshot must be {\"groups\": [...]} or a list of groups")
+        return 1
+
+    summary = materialize_reports(groups, concurrency=args.concurrency, force=args.force)
+    for error in summary["errors"]:
+        logger.error(f"{error['kind']} {error['key']}: {error['error']}")
+    logger.info(f"{summary['entries']} entries: {summary['unchanged']} unchanged, "
+                f"{summary['generated']} generated, {summary['failed']} failed")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""
+Materialized group reports and student feedback.
+
+report_job.py (or POST /materialize-reports) renders the same prompts as
+/generate-group-report and /generate-student-feedback for a snapshot of every
+group and partial, and stores the generated text here. The fingerprint of each
+entry is response_cache.cache_key(prompt, model_name): the prompt holds all of
+the input stats, so an unchanged fingerprint means nothing needs regenerating,
+and the request handlers can look a result up from the prompt they just built.
+
+One row per (kind, entry_key), e.g. ("group_report", '["3A", "Parcial 1"]');
+a regenerated entry replaces the previous text.
+
+MATERIALIZED_REPORTS_DB_URL is any SQLAlchemy URL (the same Cloud SQL database as
+attendance in production). Lookups never fail a request: errors count as misses.
+"""
+import json
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import sqlalchemy
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+GROUP_REPORT = "group_report"
+STUDENT_FEEDBACK = "student_feedback"
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS materialized_reports (
+        kind VARCHAR(32) NOT NULL,
+        entry_key VARCHAR(512) NOT NULL,
+        fingerprint VARCHAR(64) NOT NULL,
+        content TEXT NOT NULL,
+        model_name VARCHAR(128),
+        generated_at DOUBLE PRECISION NOT NULL,
+        PRIMARY KEY (kind, entry_key)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_materialized_reports_fingerprint ON materialized_reports (fingerprint)",
+]
+
+
+def entry_key(*parts):
+    """Stable, readable key for a group/partial (and student/subject) tuple."""
+    return json.dumps([str(p) for p in parts], ensure_ascii=False)
+
+
+class MaterializedReports:
+    """Precomputed report text keyed by prompt fingerprint; disabled without a db_url."""
+
+    def __init__(self, db_url=None):
+        self.db_url = db_url
+        self._engine = None
+        self._engine_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "errors": 0, "stored": 0}
+
+    @property
+    def enabled(self):
+        return bool(self.db_url)
+
+    @property
+    def engine(self):
+        with self._engine_lock:
+            if self._engine is None:
+                self._engine = sqlalchemy.create_engine(self.db_url, pool_pre_ping=True)
+                with self._engine.begin() as conn:
+                    for statement in _SCHEMA:
+                        conn.execute(text(statement))
+            return self._engine
+
+    @property
+    def engine_if_started(self):
+        """The engine if something has used it already (for metrics; never connects)."""
+        return self._engine
+
+    def _count(self, counter, n=1):
+        with self._lock:
+            self._counters[counter] += n
+
+    def get(self, fingerprint):
+        """The materialized text for a fingerprint, or None."""
+        if not self.enabled:
+            return None
+        try:
+            with self.engine.connect() as conn:
+                row = conn.execute(text("""
+                    SELECT content FROM materialized_reports WHERE fingerprint = :fingerprint LIMIT 1
+                """), {"fingerprint": fingerprint}).fetchone()
+        except Exception as e:
+            logger.warning(f"Materialized report lookup failed: {e}")
+            self._count("errors")
+            return None
+        self._count("hits" if row else "misses")
+        return row[0] if row else None
+
+    def fingerprints(self):
+        """{(kind, entry_key): fingerprint} of everything stored."""
+        with self.engine.connect() as conn:
+            rows = conn.execute(text("SELECT kind, entry_key, fingerprint FROM materialized_reports"))
+            return {(kind, key): fingerprint for kind, key, fingerprint in rows}
+
+    def put(self, kind, key, fingerprint, content, model_name=None):
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+                INSERT INTO materialized_reports (kind, entry_key, fingerprint, content, model_name, generated_at)
+                VALUES (:kind, :entry_key, :fingerprint, :content, :model_name, :generated_at)
+                ON CONFLICT (kind, entry_key) DO UPDATE SET
+                    fingerprint = excluded.fingerprint, content = excluded.content,
+                    model_name = excluded.model_name, generated_at = excluded.generated_at
+            """), {"kind": kind, "entry_key": key, "fingerprint": fingerprint, "content": content,
+                   "model_name": model_name, "generated_at": time.time()})
+        self._count("stored")
+
+    def stats(self):
+        with self._lock:
+            return {**self._counters, "enabled": self.enabled}
+
+
+def materialize(store, entries, generate, model_name=None, concurrency=4, force=False):
+    """
+    Generates and stores the entries whose fingerprint changed since the last run.
+    `entries` yields (kind, entry_key, fingerprint, prompt); `generate(prompt)` returns text.
+    Returns a summary dict; failed entries keep their previous text and are retried next run.
+    """
+    if not store.enabled:
+        raise RuntimeError("MATERIALIZED_REPORTS_DB_URL is not set")
+    entries = list(entries)
+    stored = {} if force else store.fingerprints()
+    changed = [entry for entry in entries if stored.get((entry[0], entry[1])) != entry[2]]
+    summary = {"entries": len(entries), "unchanged": len(entries) - len(changed), "generated": 0,
+               "failed": 0, "errors": []}
+    logger.info(f"Materializing {len(changed)} of {len(entries)} reports (concurrency {concurrency})")
+
+    def run(entry):
+        kind, key, fingerprint, prompt = entry
+        content = generate(prompt)
+        if not content:
+            raise Exception("Gemini model returned empty response")
+        store.put(kind, key, fingerprint, content, model_name)
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="materialize") as executor:
+        for entry, future in [(entry, executor.submit(run, entry)) for entry in changed]:
+            try:
+                future.result()
+                summary["generated"] += 1
+            except Exception as e:
+                logger.error(f"Materializing {entry[0]} {entry[1]} failed: {e}")
+                summary["failed"] += 1
+                summary["errors"].append({"kind": entry[0], "key": entry[1], "error": str(e)})
+    return summary
@@ -0,0 +1,149 @@
+"""
+Two-tier cache for generated report text.
+
+Tier 1 is an in-process LRU bounded by entry count and total bytes, with a TTL.
+Tier 2 is an optional SQLite file shared by every worker/thread on the instance.
+Keys are a SHA-256 of the model name and the fully rendered prompt, so any change
+in the input data produces a different key.
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(prompt, model_name):
+    """Stable key for a prompt/model pair (whitespace-insensitive)."""
+    normalized = " ".join(prompt.split())
+    return hashlib.sha256(f"{model_name}\n{normalized}".encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """In-process LRU + TTL cache with an optional shared SQLite tier."""
+
+    def __init__(self, max_entries=500, max_bytes=20 * 1024 * 1024, ttl_seconds=3600, sqlite_path=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.sqlite_path = sqlite_path
+        self._entries = OrderedDict()  # key -> (value, expires_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "memory_hits": 0, "shared_hits": 0,
+                          "evictions": 0, "bypassed": 0, "refreshed": 0}
+        if sqlite_path:
+            self._init_sqlite()
+
+    # --- shared tier -------------------------------------------------------
+
+    @contextmanager
+    def _connect(self):
+        """One transaction on a fresh connection, closed afterwards (sqlite3's own context manager doesn't)."""
+        conn = sqlite3.connect(self.sqlite_path, timeout=5)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _init_sqlite(self):
+        try:
+            with self._connect() as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS response_cache (
+                        key TEXT PRIMARY KEY,
+                        value TEXT NOT NULL,
+                        expires_at REAL NOT NULL
+                    )
+                """)
+        except sqlite3.Error as e:
+            logger.error(f"⚠️ Shared response cache disabled: {e}")
+            self.sqlite_path = None
+
+    def _shared_get(self, key):
+        if not self.sqlite_path:
+            return None
+        try:
+            with self._connect() as conn:
+                row = conn.execute("SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache read failed: {e}")
+            return None
+        if row is None or row[1] < time.time():
+            return None
+        return row[0], row[1]
+
+    def _shared_set(self, key, value, expires_at):
+        if not self.sqlite_path:
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute("INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                             (key, value, expires_at))
+                conn.execute("DELETE FROM response_cache WHERE expires_at < ?", (time.time(),))
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache write failed: {e}")
+
+    # --- in-process tier ---------------------------------------------------
+
+    def _memory_put(self, key, value, expires_at):
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self._bytes -= old[2]
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._counters["evictions"] += 1
+
+    def get(self, key):
+        """Returns the cached value or None; counts hits and misses."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] >= now:
+                self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+                self._counters["memory_hits"] += 1
+                return entry[0]
+            if entry:
+                self._entries.pop(key)
+                self._bytes -= entry[2]
+
+        shared = self._shared_get(key)
+        if shared:
+            value, expires_at = shared
+            self._memory_put(key, value, expires_at)
+            with self._lock:
+                self._counters["hits"] += 1
+                self._counters["shared_hits"] += 1
+            return value
+
+        with self._lock:
+            self._counters["misses"] += 1
+        return None
+
+    def set(self, key, value):
+        expires_at = time.time() + self.ttl_seconds
+        self._memory_put(key, value, expires_at)
+        self._shared_set(key, value, expires_at)
+
+    def count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def stats(self):
+        with self._lock:
+            return {**self._counters, "entries": len(self._entries), "bytes": self._bytes,
+                    "shared": bool(self.sqlite_path)}
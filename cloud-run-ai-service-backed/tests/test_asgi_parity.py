@@ -0,0 +1,98 @@
+import os
+import sys
+import time
+
+import pytest
+from starlette.testclient import TestClient
+
+import asgi
+import main
+from attendance_store import AttendanceStore
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                                "benchmarks"))
+from fakes import FakeGenerativeModel  # noqa: E402
+
+GROUP = {"group_name": "3A", "partial": "1", "grades": [95, 55, 70], "cache": False}
+STUDENT = {"student_name": "Ana", "subject": "Física", "grades": [70], "attendance": 90, "cache": False}
+ROLL_CALL = {"group_id": "3A", "partial": "1", "attendance_data": {"2024-03-01": {"s1": True, "s2": False}}}
+
+# The native Starlette routes; everything else reaches Flask through the WSGI mount
+GENERATION_ROUTES = [("/generate-report", GROUP), ("/generate-group-report", GROUP),
+                     ("/generate-student-feedback", STUDENT)]
+
+
+@pytest.fixture
+def clients(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "model", FakeGenerativeModel(response_chars=200))
+    monkeypatch.setattr(main, "is_ai_ready", True)
+    store = AttendanceStore(f"sqlite:///{tmp_path / 'attendance.db'}", max_batch=1000, max_age=0.01)
+    monkeypatch.setattr(main, "attendance_store", store)
+    monkeypatch.setattr(asgi, "attendance_store", store)
+    with TestClient(asgi.app) as async_client:
+        yield main.app.test_client(), async_client
+
+
+def responses(clients, method, path, **kwargs):
+    """(status, JSON body) from the Flask app and from the ASGI app."""
+    flask_client, async_client = clients
+    flask_response = getattr(flask_client, method)(path, **kwargs)
+    async_response = getattr(async_client, method)(path, **kwargs)
+    return ((flask_response.status_code, flask_response.get_json()),
+            (async_response.status_code, async_response.json()))
+
+
+def assert_same(clients, method, path, **kwargs):
+    flask_result, async_result = responses(clients, method, path, **kwargs)
+    assert async_result == flask_result
+    return flask_result
+
+
+def test_health(clients):
+    (flask_status, flask_body), (async_status, async_body) = responses(clients, "get", "/")
+    assert flask_body.pop("timestamp") and async_body.pop("timestamp")
+    assert (async_status, async_body) == (flask_status, flask_body)
+    assert flask_status == 200
+
+
+@pytest.mark.parametrize("path, body", GENERATION_ROUTES)
+def test_generation(clients, path, body):
+    status, payload = assert_same(clients, "post", path, json=body)
+    assert status == 200 and payload["success"] and payload["cached"] is False
+
+
+@pytest.mark.parametrize("path", [path for path, _ in GENERATION_ROUTES])
+def test_generation_without_data(clients, path):
+    assert assert_same(clients, "post", path, json={}) == (400, {"error": "No data provided"})
+
+
+@pytest.mark.parametrize("path, body", GENERATION_ROUTES)
+def test_generation_before_the_model_is_ready(clients, monkeypatch, path, body):
+    monkeypatch.setattr(main, "is_ai_ready", False)
+    status, _ = assert_same(clients, "post", path, json=body)
+    assert status == 500
+
+
+@pytest.mark.parametrize("path, body", GENERATION_ROUTES)
+def test_generation_while_the_breaker_is_open(clients, monkeypatch, path, body):
+    monkeypatch.setattr(main.model_scheduler.breaker, "_opened_at", time.monotonic())
+    status, payload = assert_same(clients, "post", path, json=body)
+    assert status == 503 and payload["retry_after"] >= 1
+
+
+def test_record_attendance(clients):
+    status, payload = assert_same(clients, "post", "/record-attendance", json=ROLL_CALL)
+    assert status == 200 and payload["records"] == 2
+
+
+@pytest.mark.parametrize("body", [{}, {"group_id": "3A"}, {"group_id": "3A", "attendance_data": [{"date": "2024-03-01"}]}])
+def test_record_attendance_validation(clients, body):
+    status, _ = assert_same(clients, "post", "/record-attendance", json=body)
+    assert status == 400
+
+
+def test_record_attendance_without_storage(clients, monkeypatch):
+    message = "ATTENDANCE_DB_URL is not set"
+    monkeypatch.setattr(main, "ATTENDANCE_STORAGE_ERROR", message)
+    monkeypatch.setattr(asgi, "ATTENDANCE_STORAGE_ERROR", message)
+    assert assert_same(clients, "post", "/record-attendance", json=ROLL_CALL) == (503, {"error": message})
@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def storage_error(**env):
+    """ATTENDANCE_STORAGE_ERROR of a freshly imported main.py under `env`."""
+    environ = {k: v for k, v in os.environ.items() if k not in ("K_SERVICE", "ATTENDANCE_DB_URL")}
+    environ.update(env)
+    result = subprocess.run([sys.executable, "-c", "import main; print(main.ATTENDANCE_STORAGE_ERROR)"],
+                            cwd=SERVICE_DIR, env=environ, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    return result.stdout.strip().splitlines()[-1], result.stderr
+
+
+def test_local_runs_default_to_sqlite():
+    error, _ = storage_error()
+    assert error == "None"
+
+
+def test_cloud_run_without_database_is_reported():
+    error, logs = storage_error(K_SERVICE="ai-report-service")
+    assert "ATTENDANCE_DB_URL is not set" in error
+    assert "ATTENDANCE_DB_URL is not set" in logs
+
+
+def test_cloud_run_with_database():
+    error, _ = storage_error(K_SERVICE="ai-report-service", ATTENDANCE_DB_URL="sqlite:///:memory:")
+    assert error == "None"
+
+
+def test_attendance_endpoints_refuse_without_storage(monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, "ATTENDANCE_STORAGE_ERROR", "ATTENDANCE_DB_URL is not set")
+    client = main.app.test_client()
+    response = client.post("/record-attendance", json={"group_id": "3A", "attendance_data": {}})
+    assert response.status_code == 503
+    assert client.get("/attendance-rate?group_id=3A").status_code == 503
+    assert main.health_status()[0]["attendance_storage_configured"] is False
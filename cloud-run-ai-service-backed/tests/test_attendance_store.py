@@ -0,0 +1,110 @@
+import threading
+
+import pytest
+
+import attendance_store
+from attendance_store import AttendanceStore, parse_attendance
+
+
+@pytest.fixture
+def store(tmp_path):
+    return AttendanceStore(f"sqlite:///{tmp_path / 'attendance.db'}", max_batch=1000, max_age=60)
+
+
+def record(store, group_id, partial, roll_call):
+    store.add(group_id, partial, parse_attendance(roll_call))
+    store.flush()
+
+
+def totals(store, group_id="3A"):
+    return {partial: (entry["present"], entry["total"], entry["attendanceRate"],
+                      {sid: (s["present"], s["total"]) for sid, s in entry.get("students", {}).items()})
+            for partial, entry in store.rates(group_id, include_students=True).items()}
+
+
+ROLL_CALL = {"2025-02-03": {"ana": True, "luis": False}, "2025-02-04": {"ana": True, "luis": True}}
+
+
+def test_rates_per_group_and_student(store):
+    record(store, "3A", "p1", ROLL_CALL)
+    assert totals(store) == {"p1": (3, 4, 75.0, {"ana": (2, 2), "luis": (1, 2)})}
+    assert store.rates("3A", partial="p2") == {}
+    assert store.rates("unknown") == {}
+
+
+def test_identical_resend_is_a_no_op(store):
+    record(store, "3A", "p1", ROLL_CALL)
+    before = totals(store)
+    record(store, "3A", "p1", ROLL_CALL)
+    assert totals(store) == before
+    assert store.stats()["written"] == 8
+
+
+def test_changed_record_moves_its_counts(store):
+    record(store, "3A", "p1", ROLL_CALL)
+    record(store, "3A", "p1", {"2025-02-03": {"luis": True}})
+    assert totals(store) == {"p1": (4, 4, 100.0, {"ana": (2, 2), "luis": (2, 2)})}
+
+    # Re-filed under another partial: leaves p1 and counts in p2
+    record(store, "3A", "p2", {"2025-02-04": {"ana": False}})
+    assert totals(store) == {"p1": (3, 3, 100.0, {"ana": (1, 1), "luis": (2, 2)}),
+                             "p2": (0, 1, 0.0, {"ana": (0, 1)})}
+
+
+def test_incremental_totals_match_a_rebuild(store):
+    record(store, "3A", "p1", ROLL_CALL)
+    record(store, "3A", "p1", {"2025-02-03": {"luis": True}, "2025-02-05": {"ana": False}})
+    record(store, "3B", "p1", {"2025-02-03": {"eva": True}})
+    incremental = totals(store), totals(store, "3B")
+    store.rebuild_aggregates()
+    assert (totals(store), totals(store, "3B")) == incremental
+
+
+def test_coalesced_records_keep_the_last_value(store):
+    first = store.add("3A", "p1", [("2025-02-03", "ana", 1)])
+    second = store.add("3A", "p1", [("2025-02-03", "ana", 0)])
+    store.flush()
+    assert first.result(1) == second.result(1) == 1
+    assert totals(store)["p1"][:2] == (0, 1)
+
+
+def test_flushes_apply_batches_in_order(store, monkeypatch):
+    # The first flush stalls between taking its batch and writing it; a flush from
+    # rates() meanwhile must not apply the newer batch first
+    write = AttendanceStore._write
+    taken = threading.Event()
+
+    def slow_write(self, batch, futures):
+        if not taken.is_set():
+            taken.set()
+            threading.Event().wait(0.2)
+        write(self, batch, futures)
+
+    monkeypatch.setattr(AttendanceStore, "_write", slow_write)
+    store.add("3A", "p1", [("2025-02-03", "ana", 1)])
+    writer = threading.Thread(target=store.flush)
+    writer.start()
+    taken.wait(1)
+    store.add("3A", "p1", [("2025-02-03", "ana", 0)])
+    assert totals(store)["p1"][:2] == (0, 1)
+    writer.join(1)
+    assert totals(store)["p1"][:2] == (0, 1)
+
+
+class RecordingConnection:
+    def __init__(self, dialect):
+        self.dialect = type("Dialect", (), {"name": dialect})()
+        self.statements = []
+
+    def execute(self, statement, params=None):
+        self.statements.append((str(statement), params))
+
+
+def test_postgres_flushes_lock_their_groups():
+    conn = RecordingConnection("postgresql")
+    attendance_store._lock_groups(conn, ["3A", "3B"])
+    assert conn.statements == [("SELECT pg_advisory_xact_lock(hashtext(:key))", {"key": "attendance:3A"}),
+                               ("SELECT pg_advisory_xact_lock(hashtext(:key))", {"key": "attendance:3B"})]
+    sqlite = RecordingConnection("sqlite")
+    attendance_store._lock_groups(sqlite, ["3A"])
+    assert sqlite.statements == []
@@ -0,0 +1,91 @@
+import json
+import threading
+import time
+
+import pytest
+
+import main
+
+STUDENTS = [{"student_name": name, "subject": "Física", "grades": [70], "attendance": 90}
+            for name in ("Ana", "Lento", "Falla", "Luis")]
+
+
+class ScriptedModel:
+    """generate_content by student: "Lento" hangs until released, "Falla" raises a caller error."""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def generate_content(self, prompt, **kwargs):
+        if "Lento" in prompt:
+            self.release.wait(10)
+        if "Falla" in prompt:
+            raise ValueError("400 invalid argument")
+        name = next(s["student_name"] for s in STUDENTS if s["student_name"] in prompt)
+        return type("Response", (), {"text": f"feedback for {name}"})()
+
+
+@pytest.fixture
+def scripted(monkeypatch):
+    model = ScriptedModel()
+    monkeypatch.setattr(main, "model", model)
+    monkeypatch.setattr(main, "is_ai_ready", True)
+    yield model
+    model.release.set()
+
+
+def post(fmt):
+    client = main.app.test_client()
+    started = time.monotonic()
+    response = client.post("/generate-group-feedback-batch", json={
+        "students": STUDENTS, "concurrency": 4, "item_timeout": 1, "format": fmt, "cache": False})
+    body = response.get_data(as_text=True)
+    return response, body, time.monotonic() - started
+
+
+def check_results(records):
+    results, summary = records[:-1], records[-1]
+    assert summary == {"type": "summary", "total": 4, "succeeded": 2, "failed": 2}
+    assert sorted(r["index"] for r in results) == [0, 1, 2, 3]
+    by_index = {r["index"]: r for r in results}
+    assert by_index[0]["success"] and by_index[0]["feedback"] == "feedback for Ana"
+    assert by_index[3]["success"] and by_index[3]["student"] == "Luis"
+    assert not by_index[2]["success"] and "400 invalid argument" in by_index[2]["error"]
+    assert by_index[1] == {"type": "result", "index": 1, "success": False, "student": "Lento",
+                           "error": "Timed out after 1s"}
+    # Results stream as they finish: the hung item is reported last, by the watchdog
+    assert results[-1]["index"] == 1
+
+
+def test_ndjson_reports_partial_failures_and_timeouts(scripted):
+    response, body, elapsed = post("ndjson")
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    check_results([json.loads(line) for line in body.splitlines()])
+    # The watchdog answers without waiting for the hung call
+    assert elapsed < 5
+
+
+def test_sse_reports_the_same_records(scripted):
+    response, body, _ = post("sse")
+    assert response.mimetype == "text/event-stream"
+    events = [block.split("\n") for block in body.strip().split("\n\n")]
+    assert [lines[0] for lines in events] == ["event: result"] * 4 + ["event: summary"]
+    check_results([json.loads(lines[1][len("data: "):]) for lines in events])
+
+
+def test_results_stream_in_completion_order(scripted, monkeypatch):
+    delays = {"Ana": 0.3, "Luis": 0.0}
+    generate = scripted.generate_content
+
+    def staggered(prompt, **kwargs):
+        for name, delay in delays.items():
+            if name in prompt:
+                time.sleep(delay)
+        return generate(prompt, **kwargs)
+
+    monkeypatch.setattr(scripted, "generate_content", staggered)
+    items = [STUDENTS[0], STUDENTS[3]]
+    results = list(main.iter_batch_feedback(items, concurrency=2, item_timeout=5, use_cache=False))
+    assert [r["student"] for r in results] == ["Luis", "Ana"]
+    assert [r["index"] for r in results] == [1, 0]
@@ -0,0 +1,58 @@
+import pytest
+
+from group_stats import compute_group_stats, has_raw_data
+
+
+def risk_levels(grades, **group):
+    stats = compute_group_stats([{"grades": grades, **group}], include_students=True)[0]
+    return [student["riskLevel"] for student in stats["students"]]
+
+
+@pytest.mark.parametrize("grade, level", [
+    (0, "high"),
+    (59, "high"),
+    (59.5, "medium"),
+    (60, "medium"),
+    (70, "medium"),
+    (70.5, "low"),
+    (100, "low"),
+])
+def test_risk_thresholds_match_the_app(grade, level):
+    assert risk_levels([grade]) == [level]
+
+
+def test_low_attendance_is_high_risk():
+    assert risk_levels([95, 95], attendance=[[True, False, False], [True, True, None]]) == ["high", "low"]
+
+
+def test_no_attendance_records_count_as_present():
+    assert risk_levels([95], attendance=[[None, None]]) == ["low"]
+
+
+def test_group_aggregates():
+    stats = compute_group_stats([{"group_id": "3A", "grades": [59.5, 70, 100, 40]}])[0]
+    assert stats["groupId"] == "3A"
+    assert stats["totalStudents"] == 4
+    assert stats["approvedCount"] == 2
+    assert stats["failedCount"] == 2
+    assert stats["highRiskCount"] == 1
+    assert stats["mediumRiskCount"] == 2
+    assert stats["atRiskStudentCount"] == 3
+    assert stats["minGrade"] == 40 and stats["maxGrade"] == 100
+    assert stats["gradeDistribution"] == {"0-59": 2, "60-69": 0, "70-79": 1, "80-89": 0, "90-100": 1}
+    assert [s["finalGrade"] for s in stats["atRiskStudents"]] == [59.5, 70, 40]
+
+
+def test_criteria_scores_and_empty_groups():
+    first, empty = compute_group_stats([
+        {"criteria_scores": [[30, 30], [20, 10]], "criteria_weights": [50, 50]},
+        {"grades": []},
+    ])
+    assert first["groupAverage"] == 45.0
+    assert first["highRiskCount"] == 1 and first["mediumRiskCount"] == 1
+    assert empty["totalStudents"] == 0 and empty["minGrade"] is None
+
+
+def test_has_raw_data():
+    assert has_raw_data({"grades": []})
+    assert not has_raw_data({"stats": {}})
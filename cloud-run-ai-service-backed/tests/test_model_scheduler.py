@@ -0,0 +1,180 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+from model_scheduler import (TokenBucket, CircuitBreaker, ModelScheduler, ModelUnavailableError, is_retryable,
+                             INTERACTIVE, BACKGROUND)
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                                "benchmarks"))
+from fakes import ServiceUnavailable  # noqa: E402
+
+
+def test_retryable_errors():
+    assert is_retryable(ServiceUnavailable("503 fake"))
+    assert is_retryable(Exception("429 Resource exhausted: quota"))
+    assert not is_retryable(ValueError("400 invalid argument"))
+
+
+def test_bucket_allows_a_burst_then_times_out():
+    bucket = TokenBucket(rate=0.1, capacity=2)
+    assert bucket.acquire(timeout=0)
+    assert bucket.acquire(timeout=0)
+    assert not bucket.acquire(timeout=0.05)
+    assert bucket._waiters == []
+
+
+def test_bucket_serves_higher_priority_first():
+    bucket = TokenBucket(rate=10, capacity=1)
+    assert bucket.acquire()
+    order = []
+
+    def take(priority, name):
+        bucket.acquire(priority)
+        order.append(name)
+
+    background = threading.Thread(target=take, args=(BACKGROUND, "background"))
+    background.start()
+    time.sleep(0.02)
+    interactive = threading.Thread(target=take, args=(INTERACTIVE, "interactive"))
+    interactive.start()
+    background.join(2)
+    interactive.join(2)
+    assert order == ["interactive", "background"]
+
+
+def test_breaker_opens_half_opens_and_closes():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(ModelUnavailableError):
+        breaker.allow()
+
+    breaker.reset_timeout = 0
+    assert breaker.state == "half_open"
+    breaker.allow()                       # the single trial call
+    with pytest.raises(ModelUnavailableError):
+        breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def flaky(failures, error=ServiceUnavailable("503 fake unavailable")):
+    calls = []
+
+    def fn(value):
+        calls.append(value)
+        if len(calls) <= failures:
+            raise error
+        return value * 2
+    return fn, calls
+
+
+def scheduler(**kwargs):
+    return ModelScheduler(**{"rate": 1000, "burst": 1000, "backoff_base": 0, "backoff_max": 0, **kwargs})
+
+
+def test_call_retries_retryable_errors():
+    model_scheduler = scheduler()
+    fn, calls = flaky(2)
+    assert model_scheduler.call(fn, 21) == 42
+    assert len(calls) == 3
+    assert model_scheduler.stats()["retries"] == 2
+    assert model_scheduler.breaker.state == "closed"
+
+
+def test_call_does_not_retry_caller_errors():
+    model_scheduler = scheduler(failure_threshold=1)
+    fn, calls = flaky(5, error=ValueError("400 bad request"))
+    with pytest.raises(ValueError):
+        model_scheduler.call(fn, 1)
+    assert len(calls) == 1
+    assert model_scheduler.breaker.state == "closed"
+
+
+def test_call_gives_up_and_reports_unavailable():
+    model_scheduler = scheduler(max_attempts=3, failure_threshold=10)
+    fn, calls = flaky(10)
+    with pytest.raises(ModelUnavailableError) as info:
+        model_scheduler.call(fn, 1)
+    assert len(calls) == 3 and info.value.retry_after >= 5
+
+
+def test_open_breaker_rejects_without_calling():
+    model_scheduler = scheduler(failure_threshold=1)
+    fn, calls = flaky(10)
+    with pytest.raises(ModelUnavailableError):
+        model_scheduler.call(fn, 1)
+    with pytest.raises(ModelUnavailableError):
+        model_scheduler.call(fn, 1)
+    assert len(calls) == 1
+    assert model_scheduler.stats()["rejected_open"] == 1
+
+
+def test_call_async_uses_the_same_policy():
+    model_scheduler = scheduler()
+    fn, calls = flaky(1)
+
+    async def coroutine(value):
+        return fn(value)
+
+    assert asyncio.run(model_scheduler.call_async(coroutine, 5)) == 10
+    assert len(calls) == 2
+
+
+def open_then_half_open(model_scheduler):
+    fn, _ = flaky(1)
+    with pytest.raises(ModelUnavailableError):
+        model_scheduler.call(fn, 1)
+    model_scheduler.breaker.reset_timeout = 0
+    assert model_scheduler.breaker.state == "half_open"
+
+
+def test_queue_timeout_during_the_trial_releases_it():
+    model_scheduler = scheduler(failure_threshold=1, max_attempts=1, queue_timeout=0.01)
+    open_then_half_open(model_scheduler)
+
+    model_scheduler.bucket._tokens = 0
+    model_scheduler.bucket.rate = 0.001  # rate limited: the trial never gets a token
+    with pytest.raises(ModelUnavailableError, match="queue timed out"):
+        model_scheduler.call(lambda: "unused")
+
+    model_scheduler.bucket.rate = 1000
+    assert model_scheduler.call(lambda: "ok") == "ok"
+    assert model_scheduler.breaker.state == "closed"
+
+
+def test_cancelled_async_trial_releases_it():
+    model_scheduler = scheduler(failure_threshold=1, max_attempts=1)
+    open_then_half_open(model_scheduler)
+
+    async def hangs():
+        await asyncio.sleep(60)
+
+    async def succeeds():
+        return "ok"
+
+    async def scenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(model_scheduler.call_async(hangs), timeout=0.05)
+        return await model_scheduler.call_async(succeeds)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert model_scheduler.breaker.state == "closed"
+
+
+def test_only_the_trial_owner_releases_it():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    trial = breaker.allow()
+    breaker.release_trial(None)
+    with pytest.raises(ModelUnavailableError):
+        breaker.allow()
+    breaker.release_trial(trial)
+    assert breaker.allow() is not None
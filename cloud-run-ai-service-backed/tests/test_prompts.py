@@ -0,0 +1,37 @@
+"""
+The prompts are part of the cache keys and shape the model output: any change to
+their text must be deliberate. The digests pin the rendered baseline prompts.
+"""
+import hashlib
+
+import main
+
+GROUP = {"group_name": "3A", "partial": "Parcial 1",
+         "stats": {"totalStudents": 30, "approvedCount": 27, "approvalRate": 90, "failedCount": 3,
+                   "groupAverage": 84.5, "attendanceRate": 95, "atRiskStudentCount": 2, "atRiskPercentage": 6.7}}
+STUDENT = {"student_name": "Ana", "subject": "Matemáticas", "grades": [58, 72], "attendance": 85,
+           "observations": "Participa poco"}
+
+
+def digest(prompt):
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def test_group_report_prompt_text_is_unchanged():
+    prompt, group_name, partial = main.build_group_report_prompt(GROUP)
+    assert (group_name, partial) == ("3A", "Parcial 1")
+    assert '\n    "Por medio del presente le saludo' in prompt
+    assert "\n    *   **PROHIBIDO** usar títulos" in prompt
+    assert digest(prompt) == "338852c102fa2b1e6a420fedd72f8b41cb82ed7459dbf5152cdc56fa6a7e8e78"
+
+
+def test_student_feedback_prompt_text_is_unchanged():
+    prompt, student_name, subject = main.build_student_feedback_prompt(STUDENT)
+    assert (student_name, subject) == ("Ana", "Matemáticas")
+    assert "Calificaciones: 58, 72" in prompt
+    assert digest(prompt) == "e226fe4fe0e2bf6e4449ccd53238156aa1c3f0ce455d3b59862e397f401e73f6"
+
+
+def test_raw_data_overrides_client_stats():
+    prompt, _, _ = main.build_group_report_prompt({**GROUP, "grades": [50, 90]})
+    assert "Total estudiantes: 2" in prompt
@@ -0,0 +1,107 @@
+import threading
+
+import pytest
+
+import main
+from report_store import GROUP_REPORT, STUDENT_FEEDBACK, MaterializedReports, entry_key, materialize
+from response_cache import ResponseCache, cache_key
+
+
+@pytest.fixture
+def store(tmp_path):
+    return MaterializedReports(f"sqlite:///{tmp_path / 'reports.db'}")
+
+
+class FakeGenerate:
+    def __init__(self, fail_on=()):
+        self.prompts = []
+        self.fail_on = set(fail_on)
+        self._lock = threading.Lock()
+
+    def __call__(self, prompt):
+        with self._lock:
+            self.prompts.append(prompt)
+        if prompt in self.fail_on:
+            raise RuntimeError("quota exceeded")
+        return f"text for {prompt}"
+
+
+def entries(*prompts):
+    return [(GROUP_REPORT, entry_key("3A", i), cache_key(prompt, "m"), prompt) for i, prompt in enumerate(prompts)]
+
+
+def test_entry_key_is_stable_json():
+    assert entry_key("3A", "Parcial 1", 7) == '["3A", "Parcial 1", "7"]'
+    assert entry_key("Matemáticas") == '["Matemáticas"]'
+
+
+def test_only_changed_entries_are_regenerated(store):
+    generate = FakeGenerate()
+    first = materialize(store, entries("a", "b"), generate, model_name="m")
+    assert (first["generated"], first["unchanged"], first["failed"]) == (2, 0, 0)
+
+    again = materialize(store, entries("a", "b"), generate, model_name="m")
+    assert (again["generated"], again["unchanged"]) == (0, 2)
+
+    changed = materialize(store, entries("a", "b2"), generate, model_name="m")
+    assert (changed["generated"], changed["unchanged"]) == (1, 1)
+    assert generate.prompts.count("b2") == 1
+    assert store.get(cache_key("b2", "m")) == "text for b2"
+    assert store.get(cache_key("b", "m")) is None  # replaced, not kept next to the new text
+
+    forced = materialize(store, entries("a", "b2"), generate, model_name="m", force=True)
+    assert forced["generated"] == 2
+
+
+def test_failures_keep_the_previous_text(store):
+    materialize(store, entries("a"), FakeGenerate(), model_name="m")
+    summary = materialize(store, entries("a2"), FakeGenerate(fail_on={"a2"}), model_name="m")
+    assert summary["failed"] == 1
+    assert summary["errors"] == [{"kind": GROUP_REPORT, "key": entry_key("3A", 0), "error": "quota exceeded"}]
+    assert store.get(cache_key("a", "m")) == "text for a"
+    # The fingerprint did not move, so the next run retries it
+    assert materialize(store, entries("a2"), FakeGenerate(), model_name="m")["generated"] == 1
+
+
+def test_empty_responses_are_not_stored(store):
+    summary = materialize(store, entries("a"), lambda prompt: "", model_name="m")
+    assert summary["failed"] == 1
+    assert store.get(cache_key("a", "m")) is None
+
+
+def test_disabled_store():
+    store = MaterializedReports(None)
+    assert store.get("anything") is None
+    with pytest.raises(RuntimeError, match="MATERIALIZED_REPORTS_DB_URL"):
+        materialize(store, [], FakeGenerate())
+
+
+def test_snapshot_fingerprints_match_the_request_cache_keys():
+    group = {"group_name": "3A", "partial": "Parcial 1", "grades": [55, 80, 95],
+             "feedback": [{"student_name": "Ana", "subject": "Física", "grades": [55], "attendance": 70}]}
+    (kind, key, fingerprint, prompt), (f_kind, f_key, f_fingerprint, f_prompt) = \
+        main.materialization_entries([group])
+
+    assert (kind, key) == (GROUP_REPORT, entry_key("3A", "Parcial 1"))
+    assert prompt == main.build_group_report_prompt(group)[0]
+    assert fingerprint == cache_key(prompt, main.model_name)
+    assert (f_kind, f_key) == (STUDENT_FEEDBACK, entry_key("3A", "Parcial 1", "Ana", "Física"))
+    assert f_fingerprint == cache_key(main.build_student_feedback_prompt(group["feedback"][0])[0], main.model_name)
+
+
+def test_handlers_serve_materialized_text(store, monkeypatch):
+    monkeypatch.setattr(main, "materialized_reports", store)
+    monkeypatch.setattr(main, "response_cache", ResponseCache(max_entries=10))
+
+    def unavailable(*args, **kwargs):
+        raise AssertionError("the model should not be called")
+
+    group = {"group_name": "3A", "partial": "Parcial 1", "grades": [55, 80, 95]}
+    materialize(store, main.materialization_entries([group]), lambda prompt: "stored report",
+                model_name=main.model_name)
+    monkeypatch.setattr(main, "call_generative_api", unavailable)
+
+    prompt = main.build_group_report_prompt(group)[0]
+    assert main.generate_with_cache(prompt) == ("stored report", True)
+    # The hit warmed the in-process cache
+    assert main.response_cache.get(cache_key(prompt, main.model_name)) == "stored report"
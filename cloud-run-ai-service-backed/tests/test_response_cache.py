@@ -0,0 +1,58 @@
+import sqlite3
+
+import response_cache
+from response_cache import ResponseCache, cache_key
+
+
+def test_cache_key_ignores_whitespace_but_not_model():
+    assert cache_key("a  b\n c", "m") == cache_key("a b c", "m")
+    assert cache_key("a b c", "m") != cache_key("a b c", "other")
+
+
+def test_lru_evicts_by_entries_and_bytes():
+    cache = ResponseCache(max_entries=2, max_bytes=10)
+    cache.set("a", "12345")
+    cache.set("b", "12345")
+    cache.get("a")            # a is now the most recently used
+    cache.set("c", "1")       # over 10 bytes: evicts b
+    assert cache.get("b") is None
+    assert cache.get("a") == "12345"
+    assert cache.get("c") == "1"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_expired_entries_miss():
+    cache = ResponseCache(ttl_seconds=-1)
+    cache.set("a", "x")
+    assert cache.get("a") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_shared_tier_is_seen_by_other_instances(tmp_path):
+    path = str(tmp_path / "cache.db")
+    ResponseCache(sqlite_path=path).set("k", "shared value")
+    other = ResponseCache(sqlite_path=path)
+    assert other.get("k") == "shared value"
+    assert other.stats()["shared_hits"] == 1
+
+
+def test_shared_tier_closes_its_connections(tmp_path, monkeypatch):
+    opened, closed = [], []
+    real_connect = sqlite3.connect
+
+    class Tracked(sqlite3.Connection):
+        def close(self):
+            closed.append(self)
+            super().close()
+
+    def connect(*args, **kwargs):
+        conn = real_connect(*args, factory=Tracked, **kwargs)
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(response_cache.sqlite3, "connect", connect)
+    cache = ResponseCache(sqlite_path=str(tmp_path / "cache.db"))
+    cache.set("k", "v")
+    cache._entries.clear()
+    assert cache.get("k") == "v"
+    assert len(opened) == 3 and len(closed) == 3
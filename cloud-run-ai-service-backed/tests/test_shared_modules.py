@@ -0,0 +1,19 @@
+"""
+Modules shipped in both Cloud Run services. Each service builds from its own
+directory, so each keeps a copy; this check fails when the copies drift.
+"""
+import filecmp
+import os
+
+import pytest
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OTHER_SERVICE_DIR = os.path.join(os.path.dirname(SERVICE_DIR), "ingestion-service")
+SHARED_MODULES = ("model_scheduler.py", "metrics.py")
+
+
+@pytest.mark.skipif(not os.path.isdir(OTHER_SERVICE_DIR), reason="needs the full repository checkout")
+@pytest.mark.parametrize("module", SHARED_MODULES)
+def test_shared_module_copies_are_identical(module):
+    assert filecmp.cmp(os.path.join(SERVICE_DIR, module), os.path.join(OTHER_SERVICE_DIR, module), shallow=False), \
+        f"{module} differs between the services; change both copies together"
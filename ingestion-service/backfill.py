@@ -0,0 +1,216 @@
+"""
+Re-embeds existing documents, e.g. after changing EMBEDDING_MODEL_NAME.
+
+Documents are scanned in id order (keyset pagination), re-downloaded and
+re-embedded with the same extraction/chunking code as the ingestion endpoint,
+on a pool of worker threads. After every page the last document id is saved in
+`backfill_checkpoints`, so a killed run picks up where it stopped.
+
+New vectors are written next to the existing ones (one row set per embedding
+model), so /search keeps answering from the old model until EMBEDDING_MODEL_NAME
+is switched. --replace drops the other models' vectors as each document is done.
+Chunk text is stored with the new vectors, which fills document_chunks.content
+(keyword/hybrid /search) for documents ingested before it was kept.
+
+    DB_PASSWORD=... python backfill.py --model text-embedding-005 --workers 8
+    DB_PASSWORD=... python backfill.py --model text-embedding-005 --check
+
+Live ingestion keeps writing vectors for the current EMBEDDING_MODEL_NAME only, so
+documents ingested during (or after) the run have none for --model. A run ends by
+counting them and exits non-zero while any are left; --check only counts. The cutover:
+run with --reset (it only re-embeds documents still missing --model vectors) until
+--check passes, switch EMBEDDING_MODEL_NAME, then run --reset and --check once more
+for documents ingested between the check and the switch. Don't --replace before that.
+
+Run `python migrate.py` first (it creates the checkpoint table and widens the
+embedding keys). Vectors must still have 768 dimensions (the column type); the embedding index
+covers all full-precision models, and /search widens its candidate list while more
+than one of them is stored (see vector_index.shares_index).
+"""
+import argparse
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import text
+from vertexai.language_models import TextEmbeddingModel
+
+from bulk_writer import copy_rows
+from main import (clients, db_pool, generate_embeddings, open_document_pages, pool_embeddings,
+                  EMBEDDING_DIMENSIONS, EMBEDDING_MODEL_NAME)
+
+logger = logging.getLogger("backfill")
+
+
+def load_checkpoint(name, reset=False):
+    with db_pool.connect() as conn:
+        if reset:
+            conn.execute(text("DELETE FROM backfill_checkpoints WHERE name = :name"), {"name": name})
+        conn.execute(text("""
+            INSERT INTO backfill_checkpoints (name) VALUES (:name) ON CONFLICT (name) DO NOTHING
+        """), {"name": name})
+        row = conn.execute(text("""
+            SELECT last_document_id, processed, failed FROM backfill_checkpoints WHERE name = :name
+        """), {"name": name}).fetchone()
+        conn.commit()
+    return row
+
+
+def save_checkpoint(name, last_document_id, processed, failed):
+    with db_pool.connect() as conn:
+        conn.execute(text("""
+            UPDATE backfill_checkpoints
+            SET last_document_id = :last_id, processed = processed + :processed,
+                failed = failed + :failed, updated_at = CURRENT_TIMESTAMP
+            WHERE name = :name
+        """), {"name": name, "last_id": last_document_id, "processed": processed, "failed": failed})
+        conn.commit()
+
+
+def next_page(after_id, page_size, model_name, only_missing):
+    """Next documents after `after_id`; with only_missing, skips ones that already have `model_name` vectors."""
+    missing = """
+        AND NOT EXISTS (SELECT 1 FROM document_embeddings e
+                        WHERE e.document_id = d.id AND e.embedding_model = :model)
+    """ if only_missing else ""
+    with db_pool.connect() as conn:
+        # The page boundary is taken before the NOT EXISTS filter, so skipped ids still advance the cursor
+        bounds = conn.execute(text("""
+            SELECT max(id) FROM (SELECT id FROM documents WHERE id > :after ORDER BY id LIMIT :limit) page
+        """), {"after": after_id, "limit": page_size}).scalar()
+        if bounds is None:
+            return None, []
+        rows = conn.execute(text(f"""
+            SELECT d.id, d.gcs_path, d.filename FROM documents d
+            WHERE d.id > :after AND d.id <= :last AND d.gcs_path LIKE 'gs://%' {missing}
+            ORDER BY d.id
+        """), {"after": after_id, "last": bounds, "model": model_name}).fetchall()
+    return bounds, rows
+
+
+def missing_documents(model_name, sample=10):
+    """(count, first ids) of stored documents without `model_name` vectors."""
+    where = """
+        FROM documents d
+        WHERE d.gcs_path LIKE 'gs://%' AND NOT EXISTS (SELECT 1 FROM document_embeddings e
+                                                       WHERE e.document_id = d.id AND e.embedding_model = :model)
+    """
+    with db_pool.connect() as conn:
+        count = conn.execute(text(f"SELECT count(*) {where}"), {"model": model_name}).scalar()
+        ids = conn.execute(text(f"SELECT d.id {where} ORDER BY d.id LIMIT :limit"),
+                           {"model": model_name, "limit": sample}).scalars().all()
+    return count, ids
+
+
+def check_cutover(model_name):
+    """Logs the documents still missing `model_name` vectors; 0 when switching to it loses none."""
+    count, ids = missing_documents(model_name)
+    if count:
+        logger.error(f"{count} documents have no {model_name} vectors (e.g. {', '.join(map(str, ids))}); "
+                     f"run again with --reset before switching EMBEDDING_MODEL_NAME")
+        return 1
+    logger.info(f"Every document has {model_name} vectors")
+    return 0
+
+
+def reembed_document(doc_id, gcs_path, file_name, model, model_name, replace):
+    bucket_name, _, object_name = gcs_path[5:].partition("/")
+    blob = clients.get("storage").bucket(bucket_name).get_blob(object_name)
+    if blob is None:
+        raise FileNotFoundError(f"{gcs_path} no longer exists")
+    pages, _ = open_document_pages(blob, file_name or object_name)
+    chunk_embeddings = generate_embeddings(pages, model=model)
+    if chunk_embeddings and len(chunk_embeddings[0][1]) != EMBEDDING_DIMENSIONS:
+        raise ValueError(f"{model_name} returned {len(chunk_embeddings[0][1])} dimensions, "
+                         f"the vector columns hold {EMBEDDING_DIMENSIONS}")
+    pooled = pool_embeddings(chunk_embeddings)
+
+    with db_pool.connect() as conn:
+        model_filter = "" if replace else "AND embedding_model = :model"
+        for table in ("document_chunks", "document_embeddings"):
+            conn.execute(text(f"DELETE FROM {table} WHERE document_id = :doc_id {model_filter}"),
+                         {"doc_id": doc_id, "model": model_name})
+        if pooled:
+            copy_rows(conn, "document_embeddings", ["document_id", "embedding", "embedding_model"],
+                      ["int4", "vector", "text"], [(doc_id, pooled, model_name)])
+        copy_rows(conn, "document_chunks",
+                  ["document_id", "chunk_index", "token_count", "embedding", "embedding_model", "content"],
+                  ["int4", "int4", "int4", "vector", "text", "text"],
+                  [(doc_id, chunk.index, chunk.token_count, vector, model_name, chunk.text)
+                   for chunk, vector in chunk_embeddings])
+        conn.commit()
+    return len(chunk_embeddings)
+
+
+def run(args):
+    if db_pool is None:
+        logger.error("Database pool is not available; check DATABASE_URL / Cloud SQL settings")
+        return 1
+    if args.check:
+        return check_cutover(args.model)
+
+    clients.get("vertexai")
+    model = TextEmbeddingModel.from_pretrained(args.model)
+    name = args.checkpoint or f"reembed:{args.model}"
+    after_id, processed_total, failed_total = load_checkpoint(name, reset=args.reset)
+    logger.info(f"Backfill '{name}' starting after document {after_id} "
+                f"({processed_total} processed, {failed_total} failed so far)")
+
+    started = time.perf_counter()
+    processed = failed = 0
+    with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="backfill") as executor:
+        while args.limit is None or processed + failed < args.limit:
+            last_id, rows = next_page(after_id, args.page_size, args.model, not args.all)
+            if last_id is None:
+                break
+            page_started = time.perf_counter()
+            futures = {row[0]: executor.submit(reembed_document, row[0], row[1], row[2], model,
+                                               args.model, args.replace) for row in rows}
+            page_processed = page_failed = 0
+            for doc_id, future in futures.items():
+                try:
+                    future.result()
+                    page_processed += 1
+                except Exception as e:
+                    page_failed += 1
+                    logger.error(f"Document {doc_id} failed: {e}")
+
+            # Every document of the page is finished (or failed) before the checkpoint moves past it;
+            # failed ones still lack vectors for the new model, so a later --reset run retries them
+            save_checkpoint(name, last_id, page_processed, page_failed)
+            after_id = last_id
+            processed += page_processed
+            failed += page_failed
+            elapsed = time.perf_counter() - started
+            page_elapsed = time.perf_counter() - page_started
+            logger.info(f"Through document {last_id}: {processed} processed, {failed} failed, "
+                        f"{processed / elapsed:.2f} docs/sec overall, "
+                        f"{page_processed / page_elapsed:.2f} docs/sec this page")
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"Backfill '{name}' done: {processed} processed, {failed} failed in {elapsed:.1f}s "
+                f"({processed / elapsed if elapsed else 0:.2f} docs/sec)")
+    # Failed documents, and ones ingested during the run under the old model, still lack vectors
+    return max(check_cutover(args.model), 1 if failed else 0)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME, help="embedding model to write vectors for")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--page-size", type=int, default=100, help="documents per keyset page / checkpoint")
+    parser.add_argument("--limit", type=int, default=None, help="stop after about this many documents")
+    parser.add_argument("--checkpoint", default=None, help="checkpoint name (default reembed:<model>)")
+    parser.add_argument("--reset", action="store_true", help="start again from the first document")
+    parser.add_argument("--all", action="store_true",
+                        help="re-embed documents that already have vectors for --model")
+    parser.add_argument("--check", action="store_true",
+                        help="only count documents without vectors for --model (exit 1 if any)")
+    parser.add_argument("--replace", action="store_true",
+                        help="delete other models' vectors instead of keeping them side by side")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(run(parse_args()))
@@ -0,0 +1,202 @@
+"""
+Batched writer for documents and their embeddings.
+
+Pending documents are collected in memory and flushed in one transaction
+when the batch reaches `max_batch` rows or the oldest row is `max_age`
+seconds old. Rows go through binary COPY, so each vector is sent as packed
+float4 values instead of str(list) text, and a whole batch costs a handful
+of round-trips on a single pooled connection.
+"""
+import io
+import struct
+import threading
+import time
+import logging
+from concurrent.futures import Future
+
+from sqlalchemy import text
+
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+_COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+_COPY_TRAILER = struct.pack(">h", -1)
+
+
+def _encode_field(value, kind):
+    if value is None:
+        return struct.pack(">i", -1)
+    if kind == "int4":
+        payload = struct.pack(">i", value)
+    elif kind == "text":
+        # PostgreSQL text can't hold NUL bytes, which PDF extraction sometimes yields
+        payload = str(value).replace("\x00", "").encode("utf-8")
+    elif kind == "vector":
+        # pgvector binary format: int16 dimensions, int16 unused, float4 values
+        payload = struct.pack(f">hh{len(value)}f", len(value), 0, *value)
+    else:
+        raise ValueError(f"Unsupported COPY field type: {kind}")
+    return struct.pack(">i", len(payload)) + payload
+
+
+def encode_copy_binary(rows, kinds):
+    """Encodes rows as a PostgreSQL binary COPY stream."""
+    buf = io.BytesIO()
+    buf.write(_COPY_HEADER)
+    field_count = struct.pack(">h", len(kinds))
+    for row in rows:
+        buf.write(field_count)
+        for value, kind in zip(row, kinds):
+            buf.write(_encode_field(value, kind))
+    buf.write(_COPY_TRAILER)
+    buf.seek(0)
+    return buf
+
+
+def copy_rows(conn, table, columns, kinds, rows):
+    """COPYs rows into `table` using the raw pg8000 connection behind a SQLAlchemy connection."""
+    if not rows:
+        return
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute(
+            f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT binary)",
+            stream=encode_copy_binary(rows, kinds),
+        )
+    finally:
+        cursor.close()
+
+
+class BulkDocumentWriter:
+    """Coalesces document, embedding, chunk and content-cache inserts into batched flushes."""
+
+    def __init__(self, get_pool, embedding_model, max_batch=50, max_age=0.5):
+        self.get_pool = get_pool
+        self.embedding_model = embedding_model
+        self.max_batch = max_batch
+        self.max_age = max_age
+        self._pending = []
+        self._oldest = None
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def add(self, document, embedding=None, chunks=(), cache_hash=None):
+        """
+        Queues one document for insertion and returns a Future resolving to its id.
+        `document` holds filename, gcs_path, document_type, summary, status, content_hash;
+        `chunks` is a list of (Chunk, vector) pairs; `cache_hash` adds a content_cache row.
+        """
+        future = Future()
+        with self._cond:
+            self._ensure_thread()
+            self._pending.append((document, embedding, list(chunks), cache_hash, future))
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            self._cond.notify()
+        return future
+
+    def available(self):
+        """False when there is no connection pool to write to."""
+        return self.get_pool() is not None
+
+    def flush(self):
+        """Writes everything that is pending right now."""
+        with self._cond:
+            batch, self._pending, self._oldest = self._pending, [], None
+        if batch:
+            self._write(batch)
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="bulk-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._pending:
+                        age = time.monotonic() - self._oldest
+                        if len(self._pending) >= self.max_batch or age >= self.max_age:
+                            break
+                        self._cond.wait(self.max_age - age)
+                    else:
+                        self._cond.wait()
+                batch, self._pending, self._oldest = self._pending, [], None
+            self._write(batch)
+
+    def _write(self, batch):
+        futures = [item[-1] for item in batch]
+        try:
+            with span("db_bulk_flush"):
+                doc_ids = self._insert(batch)
+        except Exception as e:
+            if len(batch) > 1 and self.available():
+                # One bad row fails the whole COPY: bisect, so only the bad documents fail
+                logger.warning(f"Bulk write of {len(batch)} documents failed ({e}); retrying in halves")
+                middle = len(batch) // 2
+                self._write(batch[:middle])
+                self._write(batch[middle:])
+                return
+            logger.error(f"Bulk write of {len(batch)} documents failed: {e}")
+            for future in futures:
+                future.set_exception(e)
+            return
+        for future, doc_id in zip(futures, doc_ids):
+            future.set_result(doc_id)
+
+    def _insert(self, batch):
+        pool = self.get_pool()
+        if pool is None:
+            raise RuntimeError("Database connection pool is not initialized")
+
+        with pool.connect() as conn:
+            # Allocate ids up front so child rows can be COPYed without RETURNING
+            doc_ids = [row[0] for row in conn.execute(text("""
+                SELECT nextval(pg_get_serial_sequence('documents', 'id'))
+                FROM generate_series(1, :n)
+            """), {"n": len(batch)})]
+
+            documents, embeddings, chunks, cache_rows = [], [], [], []
+            for doc_id, (doc, embedding, doc_chunks, cache_hash, _) in zip(doc_ids, batch):
+                documents.append((doc_id, doc["filename"], doc["gcs_path"], doc["document_type"],
+                                  doc["summary"], doc["status"], doc.get("content_hash")))
+                if embedding:
+                    embeddings.append((doc_id, embedding, self.embedding_model))
+                    if cache_hash:
+                        cache_rows.append((cache_hash, doc_id, doc["summary"], embedding, self.embedding_model))
+                for chunk, vector in doc_chunks:
+                    chunks.append((doc_id, chunk.index, chunk.token_count, vector, self.embedding_model, chunk.text))
+
+            copy_rows(conn, "documents",
+                      ["id", "filename", "gcs_path", "document_type", "summary", "status", "content_hash"],
+                      ["int4", "text", "text", "text", "text", "text", "text"], documents)
+            copy_rows(conn, "document_embeddings",
+                      ["document_id", "embedding", "embedding_model"],
+                      ["int4", "vector", "text"], embeddings)
+            copy_rows(conn, "document_chunks",
+                      ["document_id", "chunk_index", "token_count", "embedding", "embedding_model", "content"],
+                      ["int4", "int4", "int4", "vector", "text", "text"], chunks)
+
+            if cache_rows:
+                # COPY has no ON CONFLICT, so stage cache rows and merge them
+                conn.execute(text("""
+                    CREATE TEMP TABLE IF NOT EXISTS content_cache_staging
+                    (LIKE content_cache INCLUDING DEFAULTS) ON COMMIT DELETE ROWS
+                """))
+                copy_rows(conn, "content_cache_staging",
+                          ["content_hash", "document_id", "summary", "embedding", "embedding_model"],
+                          ["text", "int4", "text", "vector", "text"], cache_rows)
+                conn.execute(text("""
+                    INSERT INTO content_cache (content_hash, document_id, summary, embedding, embedding_model)
+                    SELECT DISTINCT ON (content_hash, embedding_model)
+                           content_hash, document_id, summary, embedding, embedding_model
+                    FROM content_cache_staging
+                    ON CONFLICT (content_hash, embedding_model) DO NOTHING
+                """))
+
+            conn.commit()
+
+        logger.info(f"Bulk wrote {len(documents)} documents, {len(embeddings)} embeddings, {len(chunks)} chunks")
+        return doc_ids
@@ -1,23 +1,50 @@
+import time
+_IMPORT_STARTED = time.perf_counter()  # Cold-start measurement (see /healthz and benchmarks/cold_start.py)
+
 import os
 import logging
 import json
+import base64
+import math
+import re
+from collections import namedtuple
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, request, jsonify
 from google.cloud import storage
-from google.cloud import secretmanager
 from google.cloud.sql.connector import Connector, IPTypes
 import sqlalchemy
 from sqlalchemy import text
 import vertexai
-from vertexai.language_models import TextEmbeddingModel
+from vertexai.language_models import TextEmbeddingModel, TextEmbeddingInput
 from vertexai.generative_models import GenerativeModel
-import pypdf
-import io
+from metrics import REGISTRY, span, install_flask, sqlalchemy_pool_stats
+from model_registry import ClientRegistry
+from pdf_extract import iter_pdf_pages, PdfExtractionError
+from summarizer import SectionCollector, HierarchicalSummarizer
+from pagination import keyset_clause, fetch_page, stream_rows, STREAM_FORMATS
+from bulk_writer import BulkDocumentWriter
+from model_scheduler import ModelScheduler, ModelUnavailableError, INTERACTIVE, BACKGROUND
+from vector_index import (ensure_vector_index, ensure_compact_indexes, apply_search_settings, storage_for,
+                          model_literal, candidate_distance, rerank_candidates, indexed_models, shares_index,
+                          SEARCH_MODES)
+from text_search import (ensure_text_search, lexical_ranking, fused_ranking, hybrid_candidates, is_short_query,
+                         RETRIEVAL_MODES, HYBRID_SHORTCIRCUIT_MIN_HITS)
+from work_queue import IngestQueue, StageLimiter, QueueFullError, RetryLater
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+install_flask(app)  # /metrics, request timing, X-Profile: 1 -> Server-Timing stage breakdown
+
+# --- Metrics ---
+bytes_processed = REGISTRY.counter("ingest_bytes_total", "Bytes of source objects processed, by document type")
+documents_total = REGISTRY.counter("ingest_documents_total", "Objects processed, by outcome")
+chunks_embedded = REGISTRY.counter("ingest_chunks_embedded_total", "Chunks sent to the embedding model")
+tokens_embedded = REGISTRY.counter("ingest_tokens_embedded_total", "Estimated tokens sent to the embedding model")
+summary_chars = REGISTRY.counter("ingest_summary_chars_total", "Characters of generated summaries")
 
 # --- Configuration ---
 PROJECT_ID = os.environ.get("GCP_PROJECT_ID", "academic-tracker-qeoxi")
@@ -26,14 +53,75 @@ REGION = os.environ.get("GCP_REGION", "us-central1")
 DB_INSTANCE_CONNECTION_NAME = os.environ.get("DB_INSTANCE_CONNECTION_NAME", "academic-tracker-qeoxi:us-central1:ingestion-academic-db")
 DB_USER = os.environ.get("DB_USER", "postgres")
 DB_NAME = os.environ.get("DB_NAME", "academic_db") # Adjust if different
+# Optional SQLAlchemy URL (e.g. a local Postgres+pgvector container); bypasses the Cloud SQL connector
+DATABASE_URL = os.environ.get("DATABASE_URL")
+
+# --- Embedding / chunking configuration ---
+EMBEDDING_MODEL_NAME = os.environ.get("EMBEDDING_MODEL_NAME", "text-embedding-004")
+EMBEDDING_DIMENSIONS = 768
+# text-embedding-004 accepts up to 2048 tokens per input; keep chunks well below that
+CHUNK_MAX_TOKENS = int(os.environ.get("CHUNK_MAX_TOKENS", "512"))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("CHUNK_OVERLAP_TOKENS", "64"))
+# Per-request caps for get_embeddings (Vertex allows 250 inputs / 20k tokens per call)
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_BATCH_MAX_TOKENS = int(os.environ.get("EMBEDDING_BATCH_MAX_TOKENS", "15000"))
+# --- Ingestion queue configuration ---
+# INGEST_ASYNC=0 keeps the original behaviour (process inside the request)
+INGEST_ASYNC = os.environ.get("INGEST_ASYNC", "1") == "1"
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", "4"))
+INGEST_MAX_PENDING = int(os.environ.get("INGEST_MAX_PENDING", "200"))
+INGEST_IO_CONCURRENCY = int(os.environ.get("INGEST_IO_CONCURRENCY", "3"))     # matches the 3-connection base pool
+INGEST_MODEL_CONCURRENCY = int(os.environ.get("INGEST_MODEL_CONCURRENCY", "2"))
+INGEST_RETRY_AFTER_SECONDS = int(os.environ.get("INGEST_RETRY_AFTER_SECONDS", "30"))
+# Queued jobs hit by a model outage are retried in-process (the event was already acknowledged)
+INGEST_MAX_ATTEMPTS = int(os.environ.get("INGEST_MAX_ATTEMPTS", "8"))
+INGEST_RETRY_MAX_DELAY_SECONDS = int(os.environ.get("INGEST_RETRY_MAX_DELAY_SECONDS", "600"))
+# /ingest-batch: max objects per request and parallel objects when waiting for results
+INGEST_BATCH_MAX_OBJECTS = int(os.environ.get("INGEST_BATCH_MAX_OBJECTS", "500"))
+INGEST_BATCH_CONCURRENCY = int(os.environ.get("INGEST_BATCH_CONCURRENCY", "8"))
+
+# --- Bulk writer configuration ---
+BULK_WRITE_MAX_BATCH = int(os.environ.get("BULK_WRITE_MAX_BATCH", "50"))
+BULK_WRITE_MAX_AGE_SECONDS = float(os.environ.get("BULK_WRITE_MAX_AGE_SECONDS", "0.5"))
+BULK_WRITE_TIMEOUT_SECONDS = float(os.environ.get("BULK_WRITE_TIMEOUT_SECONDS", "60"))
+
+# --- Summarization: page-aligned sections summarized concurrently, then reduced ---
+SUMMARY_PAGES_PER_SECTION = int(os.environ.get("SUMMARY_PAGES_PER_SECTION", "8"))
+SUMMARY_SECTION_MAX_CHARS = int(os.environ.get("SUMMARY_SECTION_MAX_CHARS", "20000"))
+SUMMARY_CONCURRENCY = int(os.environ.get("SUMMARY_CONCURRENCY", "4"))
+SUMMARY_REDUCE_MAX_CHARS = int(os.environ.get("SUMMARY_REDUCE_MAX_CHARS", "20000"))
 
-# Initialize Clients
-storage_client = storage.Client()
-secret_client = secretmanager.SecretManagerServiceClient()
-connector = Connector()
+SEARCH_DEFAULT_K = 10
+SEARCH_MAX_K = 100
+# How long /search trusts the embedding models it read from a table's planner statistics
+SEARCH_MODEL_STATS_TTL_SECONDS = float(os.environ.get("SEARCH_MODEL_STATS_TTL_SECONDS", "300"))
 
-# Initialize Vertex AI
-vertexai.init(project=PROJECT_ID, location=REGION)
+# --- Roster endpoints: keyset pages on (name, id), optional streaming export ---
+PAGE_DEFAULT_LIMIT = 100
+PAGE_MAX_LIMIT = 1000
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "500"))
+
+# Schema setup is a one-shot job (python migrate.py); set to 1 to also run it on startup
+RUN_MIGRATIONS_ON_STARTUP = os.environ.get("RUN_MIGRATIONS_ON_STARTUP", "0") == "1"
+SUMMARY_MODEL_NAME = "gemini-1.5-pro"
+
+# Initialize Clients lazily: created on first use, then shared across requests and threads
+def _vertex_model(factory):
+    def build():
+        clients.get("vertexai")
+        return factory()
+    return build
+
+clients = ClientRegistry()
+clients.register("storage", storage.Client)
+clients.register("connector", Connector)
+clients.register("vertexai", lambda: vertexai.init(project=PROJECT_ID, location=REGION) or True)
+clients.register("embedding_model", _vertex_model(lambda: TextEmbeddingModel.from_pretrained(EMBEDDING_MODEL_NAME)))
+# --- CORRECCIÓN #2: CAMBIAR MODELO PREVIEW POR ESTABLE ---
+clients.register("summary_model", _vertex_model(lambda: GenerativeModel(SUMMARY_MODEL_NAME)))
+
+# Rate limiting, retries and circuit breaking for Vertex AI calls (MODEL_* env vars)
+model_scheduler = ModelScheduler.from_env()
 
 # --- CORRECCIÓN #1: USAR VARIABLE DE ENTORNO DB_PASSWORD ---
 def get_db_password():
@@ -48,12 +136,15 @@ def get_db_password():
 
 def get_db_connection():
     """Creates a connection to the Cloud SQL database."""
+    if DATABASE_URL:
+        return sqlalchemy.create_engine(DATABASE_URL, pool_size=3, max_overflow=2, pool_pre_ping=True)
+
     db_pass = get_db_password()
     
     def getconn():
         # SECURITY: Cloud SQL connector uses SSL/TLS encryption by default
         # All connections are encrypted in transit
-        conn = connector.connect(
+        conn = clients.get("connector").connect(
             DB_INSTANCE_CONNECTION_NAME,
             "pg8000",
             user=DB_USER,
@@ -113,6 +204,10 @@ def init_db():
             );
         """))
 
+        # Keyset pagination indexes for /load-groups and /load-tutoring-data (NULL names sort as '')
+        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_courses_name_id ON courses ((COALESCE(name, '')), id);"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_students_name_id ON students ((COALESCE(name, '')), id);"))
+
         conn.execute(text("""
             CREATE TABLE IF NOT EXISTS documents (
                 id SERIAL PRIMARY KEY,
@@ -135,56 +230,491 @@ def init_db():
                 embedding_model VARCHAR(255)
             );
         """))
+
+        # One row per embedded chunk; document_embeddings keeps the pooled vector
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS document_chunks (
+                document_id INT REFERENCES documents(id),
+                chunk_index INT,
+                token_count INT,
+                embedding vector(768),
+                embedding_model VARCHAR(255),
+                PRIMARY KEY (document_id, chunk_index)
+            );
+        """))
+
+        # One vector set per (document, model), so a new embedding model can be
+        # backfilled next to the current one (backfill.py) before switching over
+        migrate_embedding_keys(conn)
+
+        # ANN indexes for /search (type and parameters from VECTOR_INDEX_TYPE / HNSW_* / IVFFLAT_*);
+        # models with compact EMBEDDING_STORAGE get a quantized partial index instead of the full one
+        for table in ("document_chunks", "document_embeddings"):
+            compact_models = ensure_compact_indexes(conn, table, dimensions=EMBEDDING_DIMENSIONS)
+            ensure_vector_index(conn, table, exclude_models=compact_models)
+
+        # Chunk text and full-text indexes over it and the summaries, for keyword/hybrid /search
+        ensure_text_search(conn)
+
+        # Content-addressed cache: identical uploads reuse the first document's summary and vectors
+        conn.execute(text("ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_hash VARCHAR(128);"))
+        conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_documents_content_hash ON documents (content_hash);
+        """))
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS content_cache (
+                content_hash VARCHAR(128),
+                document_id INT REFERENCES documents(id),
+                summary TEXT,
+                embedding vector(768),
+                embedding_model VARCHAR(255),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (content_hash, embedding_model)
+            );
+        """))
+        # One cache entry per (content, model), so it refills after an embedding model switch
+        migrate_embedding_keys(conn, [("content_cache", "content_hash, embedding_model")])
+
+        # Resumable backfill jobs (backfill.py)
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+                name VARCHAR(255) PRIMARY KEY,
+                last_document_id INT NOT NULL DEFAULT 0,
+                processed INT NOT NULL DEFAULT 0,
+                failed INT NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """))
+
+        # Section summaries for map-reduce summarization, keyed by a hash of the section text
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS chunk_summaries (
+                section_hash VARCHAR(64) PRIMARY KEY,
+                summary TEXT NOT NULL,
+                model_name VARCHAR(255),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """))
         conn.commit()
         logger.info("Database schema initialized.")
 
-# Initialize DB on startup (be careful with concurrency in Cloud Run, usually done in a separate job)
-try:
-    init_db()
-except Exception as e:
-    logger.error(f"Failed to initialize DB: {e}")
+EMBEDDING_KEYS = [("document_embeddings", "document_id, embedding_model"),
+                  ("document_chunks", "document_id, chunk_index, embedding_model")]
 
-def extract_text_from_pdf(blob):
-    """Extracts text from a PDF blob."""
+def migrate_embedding_keys(conn, keys=EMBEDDING_KEYS):
+    """Widens primary keys to include embedding_model (no-op once done)."""
+    for table, columns in keys:
+        key_size = conn.execute(text("""
+            SELECT array_length(conkey, 1) FROM pg_constraint
+            WHERE conname = :name AND contype = 'p'
+        """), {"name": f"{table}_pkey"}).scalar()
+        if key_size == len(columns.split(",")):
+            continue
+        logger.info(f"Migrating {table} primary key to ({columns})")
+        conn.execute(text(f"UPDATE {table} SET embedding_model = :model WHERE embedding_model IS NULL"),
+                      {"model": EMBEDDING_MODEL_NAME})
+        conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN embedding_model SET NOT NULL"))
+        conn.execute(text(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {table}_pkey"))
+        conn.execute(text(f"ALTER TABLE {table} ADD PRIMARY KEY ({columns})"))
+
+document_writer = BulkDocumentWriter(lambda: db_pool, EMBEDDING_MODEL_NAME,
+                                     max_batch=BULK_WRITE_MAX_BATCH, max_age=BULK_WRITE_MAX_AGE_SECONDS)
+
+def inject(storage_client=None, embedding_model=None, summary_model=None, pool=None, writer=None):
+    """
+    Dependency injection point for tests and benchmarks (see benchmarks/service_benchmark.py):
+    replaces the GCS client, the Vertex AI models, the DB pool and/or the document writer.
+    Arguments left as None keep the configured dependency; injected models never call vertexai.init.
+    """
+    global db_pool, document_writer
+    for name, client in (("storage", storage_client), ("embedding_model", embedding_model),
+                         ("summary_model", summary_model)):
+        if client is not None:
+            clients.override(name, client)
+    if pool is not None:
+        db_pool = pool
+    if writer is not None:
+        document_writer = writer
+
+# Initialize DB on startup only if asked to (be careful with concurrency in Cloud Run, usually done in a separate job)
+if RUN_MIGRATIONS_ON_STARTUP:
     try:
-        file_bytes = blob.download_as_bytes()
-        pdf_file = io.BytesIO(file_bytes)
-        reader = pypdf.PdfReader(pdf_file)
-        text_content = ""
-        for page in reader.pages:
-            text_content += page.extract_text() + "\n"
-        return text_content
+        init_db()
     except Exception as e:
-        logger.error(f"Error extracting PDF text: {e}")
-        return ""
+        logger.error(f"Failed to initialize DB: {e}")
+
+def blob_content_hash(blob):
+    """
+    Returns a content key for a blob from its GCS metadata, without downloading it.
+    Prefers the MD5 digest; composite objects only carry CRC32C, so size is added to it.
+    """
+    if blob.md5_hash:
+        return f"md5:{blob.md5_hash}"
+    if blob.crc32c:
+        return f"crc32c:{blob.crc32c}:{blob.size}"
+    return None
+
+def lookup_content_cache(conn, content_hash):
+    """Returns the cached (document_id, summary, embedding, embedding_model) row for a hash, or None."""
+    if not content_hash:
+        return None
+    return conn.execute(text("""
+        SELECT document_id, summary, embedding, embedding_model
+        FROM content_cache
+        WHERE content_hash = :content_hash AND embedding_model = :model
+    """), {"content_hash": content_hash, "model": EMBEDDING_MODEL_NAME}).fetchone()
 
-def generate_embeddings(text_content):
-    """Generates embeddings using Vertex AI."""
-    if not text_content:
+def link_cached_document(conn, cached, file_name, gcs_path, content_hash):
+    """Creates a documents row that reuses a cached summary, pooled vector and chunk vectors."""
+    source_id, cached_summary, cached_embedding, cached_model = cached
+    doc_id = conn.execute(text("""
+        INSERT INTO documents (filename, gcs_path, document_type, summary, status, content_hash)
+        SELECT :filename, :gcs_path, document_type, :summary, :status, :content_hash
+        FROM documents WHERE id = :source_id
+        RETURNING id
+    """), {
+        "filename": file_name,
+        "gcs_path": gcs_path,
+        "summary": cached_summary,
+        "status": "processed",
+        "content_hash": content_hash,
+        "source_id": source_id
+    }).scalar()
+    if doc_id is None:
+        return None
+    conn.execute(text("""
+        INSERT INTO document_embeddings (document_id, embedding, embedding_model)
+        VALUES (:doc_id, :embedding, :model)
+    """), {"doc_id": doc_id, "embedding": cached_embedding, "model": cached_model})
+    conn.execute(text("""
+        INSERT INTO document_chunks (document_id, chunk_index, token_count, embedding, embedding_model, content)
+        SELECT :doc_id, chunk_index, token_count, embedding, embedding_model, content
+        FROM document_chunks WHERE document_id = :source_id AND embedding_model = :model
+    """), {"doc_id": doc_id, "source_id": source_id, "model": cached_model})
+    return doc_id
+
+Chunk = namedtuple("Chunk", ["index", "text", "token_count"])
+
+_WORD_RE = re.compile(r"\S+")
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(word):
+    """Rough token estimate for a single word (~4 characters per token)."""
+    return max(1, math.ceil(len(word) / CHARS_PER_TOKEN))
+
+def _words(piece, max_tokens):
+    """
+    (word, tokens) pairs of a piece of text. Words over `max_tokens` (base64 blobs,
+    long URLs) are cut into `max_tokens` parts, so no chunk can exceed the cap.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    for match in _WORD_RE.finditer(piece or ""):
+        word = match.group(0)
+        for start in range(0, len(word), max_chars):
+            part = word[start:start + max_chars]
+            yield part, estimate_tokens(part)
+
+def chunk_text(pieces, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    Splits text into overlapping, token-bounded chunks.
+    `pieces` may be a single string or any iterable of strings (e.g. PDF pages);
+    chunks are yielded as soon as they fill up, so the input is never joined in memory.
+    """
+    if isinstance(pieces, str):
+        pieces = [pieces]
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+
+    window = []  # list of (word, tokens)
+    window_tokens = 0
+    index = 0
+    for piece in pieces:
+        for word, tokens in _words(piece, max_tokens):
+            if window and window_tokens + tokens > max_tokens:
+                yield Chunk(index, " ".join(w for w, _ in window), window_tokens)
+                index += 1
+                # Carry the tail of the window over as overlap for the next chunk
+                carried = []
+                carried_tokens = 0
+                for w, t in reversed(window):
+                    if carried_tokens + t > overlap_tokens:
+                        break
+                    carried.append((w, t))
+                    carried_tokens += t
+                window = list(reversed(carried))
+                window_tokens = carried_tokens
+            window.append((word, tokens))
+            window_tokens += tokens
+    if window:
+        yield Chunk(index, " ".join(w for w, _ in window), window_tokens)
+
+def _embedding_batches(chunks, batch_size, max_batch_tokens):
+    """Groups chunks into batches capped by input count and total tokens."""
+    batch = []
+    batch_tokens = 0
+    for chunk in chunks:
+        if batch and (len(batch) >= batch_size or batch_tokens + chunk.token_count > max_batch_tokens):
+            yield batch
+            batch = []
+            batch_tokens = 0
+        batch.append(chunk)
+        batch_tokens += chunk.token_count
+    if batch:
+        yield batch
+
+def generate_embeddings(text_content, model=None, batch_size=EMBEDDING_BATCH_SIZE,
+                        max_batch_tokens=EMBEDDING_BATCH_MAX_TOKENS, priority=BACKGROUND, limit=None):
+    """
+    Generates chunk-level embeddings using Vertex AI.
+    `text_content` is a string or an iterable of page strings, consumed lazily.
+    Returns a list of (Chunk, vector) pairs. Any object exposing
+    `get_embeddings(list_of_inputs)` can be passed as `model` (e.g. a fake in tests).
+    `limit`, if given, returns a context manager held around each embedding call only.
+    """
+    results = []
+    for batch in _embedding_batches(chunk_text(text_content), batch_size, max_batch_tokens):
+        if model is None:
+            model = clients.get("embedding_model")
+        inputs = [TextEmbeddingInput(chunk.text, "RETRIEVAL_DOCUMENT") for chunk in batch]
+        with (limit() if limit else nullcontext()), span("embed_batch"):
+            embeddings = model_scheduler.call(model.get_embeddings, inputs, priority=priority)
+        chunks_embedded.inc(len(batch))
+        tokens_embedded.inc(sum(chunk.token_count for chunk in batch))
+        results.extend((chunk, embedding.values) for chunk, embedding in zip(batch, embeddings))
+    return results
+
+def embed_query(query, model=None):
+    """Embeds a search query (RETRIEVAL_QUERY task type, same model as the documents)."""
+    if model is None:
+        model = clients.get("embedding_model")
+    inputs = [TextEmbeddingInput(query, "RETRIEVAL_QUERY")]
+    with span("embed_query"):
+        return model_scheduler.call(model.get_embeddings, inputs, priority=INTERACTIVE)[0].values
+
+def pool_embeddings(chunk_embeddings):
+    """Mean-pools chunk vectors into a single L2-normalized document vector."""
+    if not chunk_embeddings:
         return []
-    model = TextEmbeddingModel.from_pretrained("text-embedding-004")
-    # Vertex AI embedding models have a token limit. Truncate if necessary.
-    # For simplicity, we take the first chunk. In production, chunk the document.
-    embeddings = model.get_embeddings([text_content[:8000]]) 
-    return embeddings[0].values
-
-def generate_summary(text_content):
-    """Generates a summary using Vertex AI."""
-    if not text_content:
-        return ""
-    
-    # --- CORRECCIÓN #2: CAMBIAR MODELO PREVIEW POR ESTABLE ---
-    model = GenerativeModel("gemini-1.5-pro") 
-    
-    prompt = f"Summarize the following academic document in a concise paragraph:\n\n{text_content[:10000]}"
-    response = model.generate_content(prompt)
+    dims = len(chunk_embeddings[0][1])
+    pooled = [0.0] * dims
+    for _, vector in chunk_embeddings:
+        for i, value in enumerate(vector):
+            pooled[i] += value
+    norm = math.sqrt(sum(v * v for v in pooled)) or 1.0
+    return [v / norm for v in pooled]
+
+def _summary_call(prompt):
+    model = clients.get("summary_model")
+    with span("summary_call"):
+        response = model_scheduler.call(model.generate_content, prompt, priority=BACKGROUND)
     return response.text
+
+summarizer = HierarchicalSummarizer(_summary_call, SUMMARY_MODEL_NAME, get_pool=lambda: db_pool,
+                                    concurrency=SUMMARY_CONCURRENCY, reduce_max_chars=SUMMARY_REDUCE_MAX_CHARS)
+
+def generate_summary(document_summary):
+    """
+    Generates a summary of the whole document using Vertex AI: reduces the section
+    summaries started while its pages were read (see summarizer.DocumentSummary).
+    """
+    with span("summary"):
+        summary = document_summary.result()
+    summary_chars.inc(len(summary))
+    return summary
 # ---------------------------------------------------------
 
+def parse_storage_event(event):
+    """Extracts (bucket, name) from a direct GCS, Pub/Sub push or Eventarc payload."""
+    # Handle different event formats (Direct GCS trigger vs Eventarc)
+    if 'bucket' in event: # Direct GCS notification
+        return event['bucket'], event['name']
+    elif 'message' in event and 'data' in event['message']: # Pub/Sub
+        data = json.loads(base64.b64decode(event['message']['data']).decode('utf-8'))
+        return data['bucket'], data['name']
+    # Fallback/Assumption for Eventarc payload structure
+    return event.get('bucket'), event.get('name')
+
+def open_document_pages(blob, file_name):
+    """Returns (pages, document_type); pages is a lazy iterable of page strings."""
+    if file_name.lower().endswith('.pdf'):
+        return iter_pdf_pages(blob), "pdf"
+    if file_name.lower().endswith('.txt'):
+        with span("download"):
+            return [blob.download_as_text()], "text"
+    logger.warning(f"Unsupported file type for text extraction: {file_name}")
+    return [], "unknown"
+
+def process_object(bucket_name, file_name):
+    """
+    Runs the full ingestion pipeline for one Cloud Storage object.
+    Returns a (response_body, status_code) tuple.
+    """
+    logger.info(f"Processing file: {file_name} from {bucket_name}")
+
+    # 1. Read File metadata (no download yet) and check the content cache
+    bucket = clients.get("storage").bucket(bucket_name)
+    with span("metadata"):
+        blob = bucket.get_blob(file_name) or bucket.blob(file_name)
+    gcs_path = f"gs://{bucket_name}/{file_name}"
+    content_hash = blob_content_hash(blob)
+
+    if db_pool is not None and content_hash:
+        with span("dedupe_lookup"), ingest_stages.limit("io"), db_pool.connect() as conn:
+            # Duplicate delivery of an object that was already embedded: nothing to do
+            existing = conn.execute(text("""
+                SELECT d.id FROM documents d
+                JOIN document_embeddings e ON e.document_id = d.id
+                WHERE d.gcs_path = :gcs_path AND d.content_hash = :content_hash
+                LIMIT 1
+            """), {"gcs_path": gcs_path, "content_hash": content_hash}).scalar()
+            if existing:
+                logger.info(f"Skipping duplicate event for {gcs_path} (document {existing})")
+                documents_total.inc(outcome="duplicate")
+                return {"status": "success", "message": f"Already processed {file_name}", "document_id": existing, "deduplicated": True}, 200
+
+            cached = lookup_content_cache(conn, content_hash)
+            if cached:
+                doc_id = link_cached_document(conn, cached, file_name, gcs_path, content_hash)
+                if doc_id is not None:
+                    conn.commit()
+                    logger.info(f"Content cache hit for {gcs_path}: linked to document {cached[0]}")
+                    documents_total.inc(outcome="content_cache_hit")
+                    return {"status": "success", "message": f"Processed {file_name}", "document_id": doc_id, "deduplicated": True}, 200
+    
+    # Determine file type; pages are extracted lazily as they are chunked
+    # (unsupported types are still recorded, without text)
+    pages, doc_type = open_document_pages(blob, file_name)
+    bytes_processed.inc(blob.size or 0, document_type=doc_type)
+    
+    # 2. Process with Vertex AI
+    chunk_embeddings = []
+    embedding_vector = []
+    summary_text = ""
+    # Sections are summarized in the background as they are read; only their summaries are kept
+    document_summary = summarizer.start(limit=lambda: ingest_stages.limit("model"))
+    sections = SectionCollector(document_summary.add, SUMMARY_PAGES_PER_SECTION, SUMMARY_SECTION_MAX_CHARS)
+    
+    try:
+        # "extract_and_embed" covers download, page extraction, embedding and section summary calls, which
+        # are interleaved; download/extraction take an "io" slot per page and only model calls take a "model" slot
+        with span("extract_and_embed"):
+            chunk_embeddings = generate_embeddings(sections.wrap(ingest_stages.iterate(pages, "io")),
+                                                   limit=lambda: ingest_stages.limit("model"))
+            embedding_vector = pool_embeddings(chunk_embeddings)
+        if sections.count:
+            summary_text = generate_summary(document_summary)
+    except ModelUnavailableError as e:
+        # Don't store a half-processed document; the event is redelivered (sync mode)
+        # or the queued job is retried after retry_after (async mode)
+        logger.error(f"Vertex AI unavailable, not storing {file_name}: {e}")
+        documents_total.inc(outcome="model_unavailable")
+        return {"status": "failure", "message": str(e), "retry_after": e.retry_after}, 503
+    except PdfExtractionError as e:
+        # Storing whatever pages were read would look like a complete document
+        logger.error(f"Not storing {file_name}: {e}")
+        documents_total.inc(outcome="extraction_failed")
+        return {"status": "failure", "message": str(e)}, 422
+    except Exception as e:
+        logger.error(f"Vertex AI processing failed: {e}")
+    finally:
+        document_summary.cancel()
+
+    # 3. Store in Cloud SQL
+    # Verificar si el pool se inicializó correctamente antes de usarlo
+    if not document_writer.available():
+        logger.error("Skipping database storage due to failed connection pool initialization.")
+        return {"status": "failure", "message": "Database connection failed during initialization."}, 500
+
+    # Rows are coalesced with other documents and written with binary COPY
+    with span("db_write"):
+        doc_id = document_writer.add(
+            {
+                "filename": file_name,
+                "gcs_path": gcs_path,
+                "document_type": doc_type,
+                "summary": summary_text,
+                "status": "processed",
+                "content_hash": content_hash
+            },
+            embedding=embedding_vector,
+            chunks=chunk_embeddings,
+            # Only fully processed content is cached, so failed Vertex calls get retried next time
+            cache_hash=content_hash if summary_text else None,
+        ).result(timeout=BULK_WRITE_TIMEOUT_SECONDS)
+    documents_total.inc(outcome="processed")
+
+    return {"status": "success", "message": f"Processed {file_name}", "document_id": doc_id, "chunks": len(chunk_embeddings)}, 200
+
+def parse_gcs_uri(uri):
+    """'gs://bucket/name' -> (bucket, name)."""
+    if not uri.startswith("gs://") or "/" not in uri[5:]:
+        raise ValueError(f"Not a gs://bucket/object URI: {uri}")
+    bucket_name, _, file_name = uri[5:].partition("/")
+    return bucket_name, file_name
+
+def resolve_batch_objects(body):
+    """
+    Expands an /ingest-batch body into a de-duplicated, ordered list of (bucket, name).
+    Accepts "objects" (gs:// URIs, {"bucket", "name"} or any single-event payload),
+    "bucket" + "prefix" (lists the prefix), and "manifest" (gs:// URI of a file with
+    one gs:// URI per line, or a JSON list of them). Returns (objects, duplicates).
+    """
+    refs = []
+    for item in body.get("objects") or []:
+        refs.append(parse_gcs_uri(item) if isinstance(item, str) else parse_storage_event(item))
+
+    if body.get("prefix") is not None:
+        if not body.get("bucket"):
+            raise ValueError("bucket is required with prefix")
+        blobs = clients.get("storage").list_blobs(body["bucket"], prefix=body["prefix"],
+                                                  max_results=INGEST_BATCH_MAX_OBJECTS + 1)
+        refs.extend((body["bucket"], blob.name) for blob in blobs if not blob.name.endswith("/"))
+
+    if body.get("manifest"):
+        bucket_name, manifest_name = parse_gcs_uri(body["manifest"])
+        content = clients.get("storage").bucket(bucket_name).blob(manifest_name).download_as_text()
+        lines = json.loads(content) if content.lstrip().startswith("[") else content.splitlines()
+        refs.extend(parse_gcs_uri(line.strip()) for line in lines if line.strip())
+
+    objects, seen = [], set()
+    for bucket_name, file_name in refs:
+        if not bucket_name or not file_name:
+            raise ValueError("Every object needs a bucket and a name")
+        if (bucket_name, file_name) not in seen:
+            seen.add((bucket_name, file_name))
+            objects.append((bucket_name, file_name))
+    return objects, len(refs) - len(objects)
+
+def _run_ingest_job(bucket_name, file_name):
+    """
+    Queue worker entry point: raises so failed objects are reported as failed jobs.
+    The event was already acknowledged, so a model outage re-queues the job instead.
+    """
+    body, status_code = process_object(bucket_name, file_name)
+    if status_code == 503 and "retry_after" in body:
+        raise RetryLater(body.get("message") or "Vertex AI unavailable", body["retry_after"])
+    if status_code >= 400:
+        raise Exception(body.get("message") or body.get("error") or f"HTTP {status_code}")
+    return body
+
+ingest_stages = StageLimiter({"io": INGEST_IO_CONCURRENCY, "model": INGEST_MODEL_CONCURRENCY})
+ingest_queue = IngestQueue(_run_ingest_job, workers=INGEST_WORKERS, max_pending=INGEST_MAX_PENDING,
+                           max_attempts=INGEST_MAX_ATTEMPTS, max_retry_delay=INGEST_RETRY_MAX_DELAY_SECONDS)
+
+REGISTRY.callback("db_pool_connections", "SQLAlchemy connection pool state", lambda: sqlalchemy_pool_stats(db_pool), label="state")
+REGISTRY.callback("ingest_queue_pending", "Jobs waiting in the ingestion queue", lambda: ingest_queue.stats()["pending"])
+REGISTRY.callback("ingest_jobs", "Ingestion jobs by state (retained window)", lambda: ingest_queue.stats()["jobs"], label="state")
+REGISTRY.callback("model_calls_total", "Model scheduler call outcomes (retries, rejections, ...)",
+                  lambda: {k: v for k, v in model_scheduler.stats().items() if isinstance(v, int) and k != "burst"},
+                  kind="counter", label="event")
+REGISTRY.callback("model_breaker_open", "1 while the model circuit breaker is open",
+                  lambda: int(model_scheduler.breaker.state == "open"))
+
 @app.route('/', methods=['POST'])
 def ingest_event():
     """
     Cloud Run service endpoint triggered by Cloud Storage events (via Eventarc).
+    In async mode the object is queued and 202 is returned immediately; when the
+    queue is saturated the event is rejected with 429 so the sender redelivers it.
     """
     try:
         # CloudEvents format
@@ -192,119 +722,325 @@ def ingest_event():
         if not event:
             return "No event received", 400
 
-        logger.info(f"Received event: {event}")
-
-        # Handle different event formats (Direct GCS trigger vs Eventarc)
-        if 'bucket' in event: # Direct GCS notification
-            bucket_name = event['bucket']
-            file_name = event['name']
-        elif 'message' in event and 'data' in event['message']: # Pub/Sub
-             import base64
-             data = json.loads(base64.b64decode(event['message']['data']).decode('utf-8'))
-             bucket_name = data['bucket']
-             file_name = data['name']
-        else:
-            # Fallback/Assumption for Eventarc payload structure
-            bucket_name = event.get('bucket')
-            file_name = event.get('name')
+        bucket_name, file_name = parse_storage_event(event)
+        logger.info(f"Received event for gs://{bucket_name}/{file_name}")
+        logger.debug(f"Event payload: {event}")
 
         if not bucket_name or not file_name:
              return "Invalid event data", 400
 
-        logger.info(f"Processing file: {file_name} from {bucket_name}")
+        # Shed load while Vertex AI is failing so Eventarc/Pub/Sub back off and redeliver
+        if model_scheduler.breaker.state == "open":
+            retry_after = model_scheduler.breaker.retry_after()
+            response = jsonify({"status": "rejected", "message": "Vertex AI temporarily unavailable", "retry_after": retry_after})
+            response.headers["Retry-After"] = str(retry_after)
+            return response, 503
 
-        # 1. Read File
-        bucket = storage_client.bucket(bucket_name)
-        blob = bucket.blob(file_name)
-        
-        # Determine file type and extract text
-        text_content = ""
-        doc_type = "unknown"
-        
-        if file_name.lower().endswith('.pdf'):
-            text_content = extract_text_from_pdf(blob)
-            doc_type = "pdf"
-        elif file_name.lower().endswith('.txt'):
-            text_content = blob.download_as_text()
-            doc_type = "text"
+        if not INGEST_ASYNC:
+            body, status_code = process_object(bucket_name, file_name)
+            response = jsonify(body)
+            if "retry_after" in body:
+                response.headers["Retry-After"] = str(body["retry_after"])
+            return response, status_code
+
+        try:
+            job = ingest_queue.submit({"bucket_name": bucket_name, "file_name": file_name},
+                                      key=f"gs://{bucket_name}/{file_name}")
+        except QueueFullError as e:
+            logger.warning(f"Rejecting {file_name}: {e}")
+            response = jsonify({"status": "rejected", "message": str(e)})
+            response.headers["Retry-After"] = str(INGEST_RETRY_AFTER_SECONDS)
+            return response, 429
+
+        return jsonify({
+            "status": "accepted",
+            "job_id": job["job_id"],
+            "state": job["state"],
+            "status_url": f"/ingest-status/{job['job_id']}"
+        }), 202
+
+    except Exception as e:
+        logger.error(f"Error processing event: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/ingest-batch', methods=['POST'])
+def ingest_batch():
+    """
+    Ingests many objects in one request (see resolve_batch_objects for the body).
+    By default each object is queued and the report lists its job; with "wait": true
+    (or INGEST_ASYNC=0) objects are processed concurrently and the report has the results.
+    """
+    try:
+        body = request.get_json(silent=True)
+        if not body:
+            return jsonify({"error": "No data provided"}), 400
+        try:
+            objects, duplicates = resolve_batch_objects(body)
+        except (ValueError, KeyError, TypeError) as e:
+            return jsonify({"error": str(e)}), 400
+        if not objects:
+            return jsonify({"error": "No objects to ingest"}), 400
+        if len(objects) > INGEST_BATCH_MAX_OBJECTS:
+            return jsonify({"error": f"Too many objects ({len(objects)}); max is {INGEST_BATCH_MAX_OBJECTS}"}), 413
+
+        logger.info(f"Batch ingest of {len(objects)} objects ({duplicates} duplicates dropped)")
+
+        if model_scheduler.breaker.state == "open":
+            retry_after = model_scheduler.breaker.retry_after()
+            response = jsonify({"status": "rejected", "message": "Vertex AI temporarily unavailable", "retry_after": retry_after})
+            response.headers["Retry-After"] = str(retry_after)
+            return response, 503
+
+        results = []
+        if body.get("wait") or not INGEST_ASYNC:
+            # Downloads overlap across objects; the io/model stage limits still apply inside process_object
+            def run(ref):
+                try:
+                    return process_object(*ref)
+                except Exception as e:
+                    logger.error(f"Batch ingest of gs://{ref[0]}/{ref[1]} failed: {e}")
+                    return {"status": "failure", "message": str(e)}, 500
+            with ThreadPoolExecutor(max_workers=min(INGEST_BATCH_CONCURRENCY, len(objects))) as executor:
+                for (bucket_name, file_name), (result, status_code) in zip(objects, executor.map(run, objects)):
+                    results.append({"object": f"gs://{bucket_name}/{file_name}", "status_code": status_code, **result})
         else:
-            logger.warning(f"Unsupported file type for text extraction: {file_name}")
-            # Still record the file existence
-        
-        # 2. Process with Vertex AI
-        embedding_vector = []
-        summary_text = ""
-        
-        if text_content:
-            try:
-                embedding_vector = generate_embeddings(text_content)
-                summary_text = generate_summary(text_content)
-            except Exception as e:
-                logger.error(f"Vertex AI processing failed: {e}")
-
-        # 3. Store in Cloud SQL
-        # Verificar si el pool se inicializó correctamente antes de usarlo
+            for bucket_name, file_name in objects:
+                uri = f"gs://{bucket_name}/{file_name}"
+                try:
+                    job = ingest_queue.submit({"bucket_name": bucket_name, "file_name": file_name}, key=uri)
+                    results.append({"object": uri, "status": "accepted", "job_id": job["job_id"],
+                                    "state": job["state"], "status_url": f"/ingest-status/{job['job_id']}"})
+                except QueueFullError as e:
+                    results.append({"object": uri, "status": "rejected", "message": str(e),
+                                    "retry_after": INGEST_RETRY_AFTER_SECONDS})
+
+        summary = {}
+        for result in results:
+            summary[result["status"]] = summary.get(result["status"], 0) + 1
+        return jsonify({"objects": len(objects), "duplicates": duplicates, "summary": summary, "results": results}), 200
+
+    except Exception as e:
+        logger.error(f"Error processing batch: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/ingest-status/<job_id>', methods=['GET'])
+def ingest_status(job_id):
+    """Returns the state of a queued ingestion job."""
+    job = ingest_queue.status(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job id"}), 404
+    job["queue"] = ingest_queue.stats()
+    job["model_scheduler"] = model_scheduler.stats()
+    return jsonify(job), 200
+
+def vector_ranking(table, chunk_index, where, storage, limit="k"):
+    """
+    SELECT of (document_id, chunk_index, distance) nearest to :query_vector. With compact
+    storage, candidates come from the quantized index and are re-ranked by exact distance.
+    """
+    if storage == "full":
+        return f"""
+            SELECT e.document_id, {chunk_index} AS chunk_index,
+                   e.embedding <=> CAST(:query_vector AS vector) AS distance
+            FROM {table} e JOIN documents d ON d.id = e.document_id
+            WHERE {where}
+            ORDER BY e.embedding <=> CAST(:query_vector AS vector)
+            LIMIT :{limit}
+        """
+    return f"""
+        SELECT c.document_id, c.chunk_index, c.embedding <=> CAST(:query_vector AS vector) AS distance
+        FROM (
+            SELECT e.document_id, {chunk_index} AS chunk_index, e.embedding
+            FROM {table} e JOIN documents d ON d.id = e.document_id
+            WHERE {where}
+            ORDER BY {candidate_distance(storage, dimensions=EMBEDDING_DIMENSIONS)}
+            LIMIT :candidates
+        ) c
+        ORDER BY distance
+        LIMIT :{limit}
+    """
+
+_table_models = {}
+
+def index_shared(conn, table):
+    """Whether EMBEDDING_MODEL_NAME shares `table`'s ANN index with another model (e.g. mid-backfill)."""
+    now = time.monotonic()
+    cached = _table_models.get(table)
+    if cached is None or now - cached[0] > SEARCH_MODEL_STATS_TTL_SECONDS:
+        cached = _table_models[table] = (now, indexed_models(conn, table))
+    return shares_index(EMBEDDING_MODEL_NAME, cached[1])
+
+@app.route('/search', methods=['GET', 'POST'])
+def search():
+    """
+    Search over ingested documents.
+    Parameters (query string or JSON body): q, k, level ("chunks" | "documents"),
+    retrieval ("vector" | "hybrid" | "keyword"), mode ("ann" | "exact"), and optional
+    student_id / course_id / document_type filters.
+    "vector" ranks by cosine distance; with compact EMBEDDING_STORAGE for the model, "ann"
+    reads candidates from the quantized index and re-ranks them by exact distance.
+    "keyword" ranks by full-text match on chunk text (or summaries at document level).
+    "hybrid" fuses both rankings (reciprocal-rank fusion) in one query; short queries with
+    keyword matches are answered from the full-text index without embedding the query.
+    """
+    try:
         if db_pool is None:
-            logger.error("Skipping database storage due to failed connection pool initialization.")
-            return jsonify({"status": "failure", "message": "Database connection failed during initialization."}), 500
+            return jsonify({"error": "Database connection not available"}), 500
 
-        with db_pool.connect() as conn:
-            # SECURITY: Using parameterized queries to prevent SQL injection
-            # All user inputs are passed as parameters, not concatenated into SQL strings
-            result = conn.execute(text("""
-                INSERT INTO documents (filename, gcs_path, document_type, summary, status)
-                VALUES (:filename, :gcs_path, :dtype, :summary, :status)
-                RETURNING id
-            """), {
-                "filename": file_name,
-                "gcs_path": f"gs://{bucket_name}/{file_name}",
-                "dtype": doc_type,
-                "summary": summary_text,
-                "status": "processed"
-            })
-            doc_id = result.scalar()
-            
-            # Insert Embeddings
-            if embedding_vector:
-                conn.execute(text("""
-                    INSERT INTO document_embeddings (document_id, embedding, embedding_model)
-                    VALUES (:doc_id, :embedding, :model)
-                """), {
-                    "doc_id": doc_id,
-                    "embedding": str(embedding_vector), # pgvector expects string representation or list
-                    "model": "text-embedding-004"
-                })
-            
-            conn.commit()  # Explicit commit within the context manager ensures connection is properly closed
-
-        return jsonify({"status": "success", "message": f"Processed {file_name}"}), 200
+        params = request.get_json(silent=True) or {}
+        params = {**request.args.to_dict(), **params}
+
+        query = (params.get('q') or params.get('query') or '').strip()
+        if not query:
+            return jsonify({"error": "Missing query parameter 'q'"}), 400
+        k = min(max(int(params.get('k', SEARCH_DEFAULT_K)), 1), SEARCH_MAX_K)
+        level = params.get('level', 'chunks')
+        mode = params.get('mode', 'ann')
+        retrieval = params.get('retrieval', 'vector')
+        if level not in ('chunks', 'documents') or mode not in SEARCH_MODES or retrieval not in RETRIEVAL_MODES:
+            return jsonify({"error": "Invalid level, mode or retrieval"}), 400
+
+        # Filters are fixed column names; only their values come from the request
+        filters = []
+        filter_values = {}
+        for column in ('student_id', 'course_id', 'document_type'):
+            if params.get(column) not in (None, ''):
+                filters.append(f"d.{column} = :{column}")
+                filter_values[column] = int(params[column]) if column != 'document_type' else params[column]
+        # The model is inlined (validated) so the planner can use the per-model partial indexes
+        where = " AND ".join([f"e.embedding_model = {model_literal(EMBEDDING_MODEL_NAME)}"] + filters)
+        table = "document_chunks" if level == 'chunks' else "document_embeddings"
+        chunk_index = "e.chunk_index" if level == 'chunks' else "NULL::int"
+        storage = storage_for(EMBEDDING_MODEL_NAME) if mode == "ann" else "full"
+        # Hybrid takes a longer list from each ranking, so fusion has overlap to work with
+        pool = hybrid_candidates(k) if retrieval == "hybrid" else k
+        candidates = pool if storage == "full" else rerank_candidates(storage, pool)
+
+        # Every ranking yields (document_id, chunk_index, distance, score); documents are joined once
+        keyword = f"""
+            SELECT r.document_id, r.chunk_index, NULL::float8 AS distance, r.score
+            FROM ({lexical_ranking(table, chunk_index, where, level)}) r
+        """
+        if retrieval == "vector":
+            ranked = f"SELECT *, NULL::float8 AS score FROM ({vector_ranking(table, chunk_index, where, storage)}) v"
+        elif retrieval == "hybrid":
+            ranked = fused_ranking(lexical_ranking(table, chunk_index, where, level, limit="pool"),
+                                   vector_ranking(table, chunk_index, where, storage, limit="pool"))
+        else:
+            ranked = keyword
+        order = "r.distance" if retrieval == "vector" else "r.score DESC"
+
+        def run(ranking, order, query_vector=None):
+            select = f"""
+                WITH ranked AS MATERIALIZED ({ranking})
+                SELECT d.id, d.filename, d.gcs_path, d.document_type, d.summary,
+                       r.chunk_index, r.distance, r.score
+                FROM ranked r JOIN documents d ON d.id = r.document_id
+                ORDER BY {order}, d.id, r.chunk_index
+                LIMIT :k
+            """
+            with span("vector_search" if query_vector is not None else "keyword_search"), db_pool.connect() as conn:
+                if query_vector is not None:
+                    # While another model's vectors share the index, the model predicate filters it too
+                    filtered = bool(filters) or (mode == "ann" and index_shared(conn, table))
+                    apply_search_settings(conn, mode=mode, k=candidates, filtered=filtered)
+                rows = conn.execute(text(select), {
+                    "q": query,
+                    "query_vector": str(query_vector) if query_vector is not None else None,
+                    "k": k,
+                    "pool": pool,
+                    "candidates": candidates,
+                    **filter_values
+                }).fetchall()
+                conn.rollback()  # Discard the transaction-local search settings
+            return rows
+
+        rows = None
+        embedded = False
+        if retrieval == "hybrid" and is_short_query(query):
+            # Exact-term lookups (names, course codes) rarely need the embedding call; the keyword
+            # ranking only answers alone when it fills all k results, otherwise fusion could change them
+            rows = run(keyword, "r.score DESC")
+            if len(rows) < max(k, HYBRID_SHORTCIRCUIT_MIN_HITS):
+                rows = None
+        if rows is None:
+            query_vector = None
+            if retrieval != "keyword":
+                query_vector = embed_query(query)
+                embedded = True
+            rows = run(ranked, order, query_vector)
+
+        results = [{
+            "document_id": row[0],
+            "filename": row[1],
+            "gcs_path": row[2],
+            "document_type": row[3],
+            "summary": row[4],
+            "chunk_index": row[5],
+            "distance": float(row[6]) if row[6] is not None else None,
+            "score": float(row[7]) if row[7] is not None else None
+        } for row in rows]
 
+        return jsonify({"results": results, "level": level, "mode": mode, "k": k, "storage": storage,
+                        "retrieval": retrieval, "embedded": embedded}), 200
+
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {e}"}), 400
+    except ModelUnavailableError as e:
+        response = jsonify({"error": str(e), "retry_after": e.retry_after})
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response, 503
     except Exception as e:
-        logger.error(f"Error processing event: {e}")
+        logger.error(f"Error searching documents: {e}")
         return jsonify({"error": str(e)}), 500
 
+def page_options(args):
+    """Parses limit/cursor/stream query parameters shared by the roster endpoints."""
+    limit = min(max(int(args.get("limit", PAGE_DEFAULT_LIMIT)), 1), PAGE_MAX_LIMIT)
+    stream = args.get("stream")
+    if stream and stream not in STREAM_FORMATS:
+        raise ValueError(f"stream must be one of {', '.join(STREAM_FORMATS)}")
+    return limit, args.get("cursor"), stream
+
+def _group_item(row):
+    return {"id": row[0], "name": row[1], "code": row[2]}
+
+def _tutoring_item(row):
+    return {
+        "student_id": row[0],
+        "student_name": row[1],
+        "email": row[2],
+        "course_name": row[3]
+    }
+
 @app.route('/load-groups', methods=['GET'])
 def load_groups():
     """
-    Optimized endpoint to load groups with only necessary fields.
-    Uses LIMIT to prevent loading entire database into memory.
+    Loads groups with only the necessary fields, one keyset page at a time.
+    Query params: limit (default 100, max 1000), cursor (next_cursor of the previous page),
+    stream=json|ndjson to export every group from the cursor on in a single streamed response.
     """
     try:
         if db_pool is None:
             return jsonify({"error": "Database connection not available"}), 500
+        try:
+            limit, cursor, stream = page_options(request.args)
+            where, params = keyset_clause(cursor, "name", "id")
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        sql = f"""
+            SELECT id, name, code
+            FROM courses
+            WHERE {where}
+            ORDER BY COALESCE(name, ''), id
+        """
+        if stream:
+            return stream_rows(db_pool, sql, params, _group_item, "groups", stream, EXPORT_BATCH_SIZE)
 
         with db_pool.connect() as conn:
-            # Query only necessary fields, with LIMIT for safety
-            result = conn.execute(text("""
-                SELECT id, name, code
-                FROM courses
-                ORDER BY name
-                LIMIT 100  -- Prevent loading too much data
-            """))
-            
-            groups = [{"id": row[0], "name": row[1], "code": row[2]} for row in result]
-            
-            return jsonify({"groups": groups}), 200
+            groups, next_cursor = fetch_page(conn, sql + " LIMIT :limit", params, limit, _group_item)
+            return jsonify({"groups": groups, "next_cursor": next_cursor}), 200
 
     except Exception as e:
         logger.error(f"Error loading groups: {e}")
@@ -313,35 +1049,49 @@ def load_groups():
 @app.route('/load-tutoring-data', methods=['GET'])
 def load_tutoring_data():
     """
-    Optimized endpoint to load tutoring-related data.
-    Select only required fields and use JOINs efficiently.
+    Loads students with their course info, one keyset page at a time.
+    Same limit/cursor/stream parameters as /load-groups.
     """
     try:
         if db_pool is None:
             return jsonify({"error": "Database connection not available"}), 500
+        try:
+            limit, cursor, stream = page_options(request.args)
+            where, params = keyset_clause(cursor, "s.name", "s.id")
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        sql = f"""
+            SELECT s.id, s.name, s.email, c.name as course_name
+            FROM students s
+            LEFT JOIN courses c ON s.course_id = c.id
+            WHERE {where}
+            ORDER BY COALESCE(s.name, ''), s.id
+        """
+        if stream:
+            return stream_rows(db_pool, sql, params, _tutoring_item, "tutoring_data", stream, EXPORT_BATCH_SIZE)
 
         with db_pool.connect() as conn:
-            # Example: Load students with their course info, limited
-            result = conn.execute(text("""
-                SELECT s.id, s.name, s.email, c.name as course_name
-                FROM students s
-                LEFT JOIN courses c ON s.course_id = c.id
-                ORDER BY s.name
-                LIMIT 50  -- Limit to prevent memory overload
-            """))
-            
-            tutoring_data = [{
-                "student_id": row[0], 
-                "student_name": row[1], 
-                "email": row[2], 
-                "course_name": row[3]
-            } for row in result]
-            
-            return jsonify({"tutoring_data": tutoring_data}), 200
+            tutoring_data, next_cursor = fetch_page(conn, sql + " LIMIT :limit", params, limit, _tutoring_item)
+            return jsonify({"tutoring_data": tutoring_data, "next_cursor": next_cursor}), 200
 
     except Exception as e:
         logger.error(f"Error loading tutoring data: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness/diagnostics: cold-start time, loaded clients, queue and scheduler state."""
+    return jsonify({
+        "status": "healthy" if db_pool is not None else "degraded",
+        "startup_seconds": round(STARTUP_SECONDS, 3),
+        "clients_loaded": clients.loaded(),
+        "queue": ingest_queue.stats(),
+        "model_scheduler": model_scheduler.stats()
+    }), 200
+
+STARTUP_SECONDS = time.perf_counter() - _IMPORT_STARTED
+logger.info(f"Ingestion service module loaded in {STARTUP_SECONDS:.2f}s")
+
 if __name__ == "__main__":
     app.run(debug=True, host='0.0.0.0', port=int(os.environ.get('PORT', 8080)))
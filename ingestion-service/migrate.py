@@ -0,0 +1,31 @@
+"""
+One-shot schema migration for the ingestion service.
+
+Run it once per deploy instead of on every instance start, e.g. as a Cloud Run Job
+built from the same image:
+
+    gcloud run jobs create ingestion-migrate --image <image> --command python --args migrate.py
+"""
+import sys
+import logging
+
+from main import init_db, db_pool
+
+logger = logging.getLogger("migrate")
+
+
+def main():
+    if db_pool is None:
+        logger.error("Database pool is not available; check DATABASE_URL / Cloud SQL settings")
+        return 1
+    try:
+        init_db()
+    except Exception as e:
+        logger.error(f"Migration failed: {e}")
+        return 1
+    logger.info("Schema is up to date")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+"""
+Process-wide registry of lazily created clients (GCS, Cloud SQL connector, Vertex AI models).
+
+Each client is built by its factory on first use and then shared by every request
+and worker thread, instead of being rebuilt per document or created at import time.
+"""
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ClientRegistry:
+    """Thread-safe, lazily initialised name -> client mapping."""
+
+    def __init__(self):
+        self._factories = {}
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._build_locks = {}
+
+    def register(self, name, factory):
+        """Registers how to build `name`; nothing is created until get()."""
+        self._factories[name] = factory
+
+    def get(self, name):
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+        with self._lock:
+            build_lock = self._build_locks.setdefault(name, threading.Lock())
+        # Per-name lock: a factory may get() the clients it depends on, and building
+        # one client doesn't hold up the others
+        with build_lock:
+            client = self._clients.get(name)
+            if client is None:
+                start = time.perf_counter()
+                client = self._factories[name]()
+                with self._lock:
+                    client = self._clients.setdefault(name, client)
+                logger.info(f"Initialized client '{name}' in {time.perf_counter() - start:.2f}s")
+            return client
+
+    def override(self, name, client):
+        """Replaces a client (e.g. with an in-process fake)."""
+        with self._lock:
+            self._clients[name] = client
+
+    def loaded(self):
+        return sorted(self._clients)
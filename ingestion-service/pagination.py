@@ -0,0 +1,74 @@
+"""
+Keyset pagination and streaming exports for the roster endpoints.
+
+Pages are ordered by (name, id) and continue from an opaque cursor holding the
+last (name, id) seen, so every page is an index range scan no matter how deep
+it is. NULL names sort as '' (the expression indexes in init_db match this).
+Streaming mode reads one server-side cursor in fixed-size batches and writes
+JSON or NDJSON as it goes, so memory stays flat for full-roster exports.
+"""
+import base64
+import json
+
+from flask import Response, stream_with_context
+from sqlalchemy import text
+
+STREAM_FORMATS = ("json", "ndjson")
+
+
+def encode_cursor(name, row_id):
+    raw = json.dumps([name or "", row_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """Returns (name, id); raises ValueError for malformed cursors."""
+    try:
+        name, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(name), int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def keyset_clause(cursor, name_expr, id_expr):
+    """SQL condition and params continuing after `cursor` (or no-op without one)."""
+    if not cursor:
+        return "TRUE", {}
+    name, row_id = decode_cursor(cursor)
+    return f"(COALESCE({name_expr}, ''), {id_expr}) > (:after_name, :after_id)", \
+        {"after_name": name, "after_id": row_id}
+
+
+def fetch_page(conn, sql, params, limit, to_item):
+    """
+    Runs a keyset query (which must select id and name first and end with
+    `LIMIT :limit`) and returns (items, next_cursor).
+    """
+    rows = conn.execute(text(sql), {**params, "limit": limit + 1}).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+    return [to_item(row) for row in rows], next_cursor
+
+
+def stream_rows(pool, sql, params, to_item, key, fmt="json", batch_size=500):
+    """Streams every row of `sql` as {"<key>": [...]} JSON or as NDJSON lines."""
+    def generate():
+        with pool.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(text(sql), params)
+            if fmt == "ndjson":
+                for batch in result.partitions():
+                    yield "".join(json.dumps(to_item(row)) + "\n" for row in batch)
+                return
+            yield f'{{"{key}": ['
+            first = True
+            for batch in result.partitions():
+                parts = [json.dumps(to_item(row)) for row in batch]
+                if parts:
+                    yield ("" if first else ",") + ",".join(parts)
+                    first = False
+            yield "]}"
+
+    mimetype = "application/x-ndjson" if fmt == "ndjson" else "application/json"
+    return Response(stream_with_context(generate()), mimetype=mimetype)
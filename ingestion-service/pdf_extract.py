@@ -0,0 +1,114 @@
+"""
+PDF text extraction helpers for the ingestion service.
+
+Kept separate from main.py so process-pool workers only import pypdf
+(and the stdlib-only metrics module), not the Flask app and its cloud clients.
+"""
+import os
+import logging
+import tempfile
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pypdf
+
+from metrics import span, observe_stage
+
+logger = logging.getLogger(__name__)
+
+# Blobs smaller than this stay in memory; larger ones roll over to a temp file
+PDF_SPOOL_MAX_BYTES = int(os.environ.get("PDF_SPOOL_MAX_BYTES", str(8 * 1024 * 1024)))
+# 0/1 = extract pages serially in the request thread; >1 = process pool of that size
+PDF_EXTRACT_WORKERS = int(os.environ.get("PDF_EXTRACT_WORKERS", "0"))
+PDF_PAGES_PER_TASK = int(os.environ.get("PDF_PAGES_PER_TASK", "16"))
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+class PdfExtractionError(Exception):
+    """The PDF could not be read; the document must not be stored from partial text."""
+
+
+def _get_process_pool(workers):
+    """
+    Lazily creates the shared extraction pool (spawned, so no forked threads/sockets),
+    sized for the first caller's effective worker count.
+    """
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                max_workers=max(workers, PDF_EXTRACT_WORKERS),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _process_pool
+
+
+def _extract_page_range(path, start, stop):
+    """Worker entry point: extracts pages [start, stop) from the PDF at `path`; returns (texts, seconds)."""
+    started = time.perf_counter()
+    reader = pypdf.PdfReader(path)
+    texts = [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+    return texts, time.perf_counter() - started
+
+
+def _iter_pages_serial(blob):
+    with tempfile.SpooledTemporaryFile(max_size=PDF_SPOOL_MAX_BYTES) as spool:
+        with span("download"):
+            blob.download_to_file(spool)
+        spool.seek(0)
+        reader = pypdf.PdfReader(spool)
+        for page in reader.pages:
+            with span("pdf_extract"):
+                page_text = page.extract_text() or ""
+            yield page_text
+
+
+def _iter_pages_parallel(blob, workers):
+    # Workers open the file themselves, so it has to live on disk
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp:
+        with span("download"):
+            blob.download_to_file(tmp)
+            tmp.flush()
+        page_count = len(pypdf.PdfReader(tmp.name).pages)
+
+        ranges = [(start, min(start + PDF_PAGES_PER_TASK, page_count))
+                  for start in range(0, page_count, PDF_PAGES_PER_TASK)]
+        pool = _get_process_pool(workers)
+        # Keep a bounded window of ranges in flight and yield pages in document order
+        lookahead = workers * 2
+        pending = [pool.submit(_extract_page_range, tmp.name, start, stop) for start, stop in ranges[:lookahead]]
+        next_range = len(pending)
+        while pending:
+            # Extraction time is measured in the worker; waiting here is what the pipeline stalls on
+            with span("pdf_extract_wait"):
+                pages, seconds = pending.pop(0).result()
+            observe_stage("pdf_extract", seconds)
+            if next_range < len(ranges):
+                start, stop = ranges[next_range]
+                pending.append(pool.submit(_extract_page_range, tmp.name, start, stop))
+                next_range += 1
+            for page_text in pages:
+                yield page_text
+
+
+def iter_pdf_pages(blob, workers=None):
+    """
+    Yields the text of each page of a PDF blob, in order.
+    The blob is streamed to a spooled temp file instead of being loaded with
+    download_as_bytes(), and pages are produced lazily so callers can feed them
+    straight into chunking. Extraction errors raise PdfExtractionError, so a
+    truncated page stream is never mistaken for the whole document.
+    """
+    workers = PDF_EXTRACT_WORKERS if workers is None else workers
+    try:
+        if workers > 1:
+            yield from _iter_pages_parallel(blob, workers)
+        else:
+            yield from _iter_pages_serial(blob)
+    except Exception as e:
+        logger.error(f"Error extracting PDF text: {e}")
+        raise PdfExtractionError(f"Could not extract text from PDF: {e}") from e
@@ -0,0 +1,241 @@
+"""
+Map-reduce summarization for long documents.
+
+The document is split into page-aligned sections (a fixed number of pages per
+section) as its pages are read, each section is summarized concurrently as soon
+as it is complete (map), and the section summaries are combined into one
+paragraph (reduce); only the section summaries are kept until the reduce.
+Section summaries are cached in `chunk_summaries` keyed by a hash of the section
+text, so re-uploading a document with one edited page only re-summarizes the
+section that page is in.
+"""
+import hashlib
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+MAP_PROMPT = (
+    "Summarize the following section of an academic document in a few sentences. "
+    "Keep the key topics, definitions and conclusions:\n\n{text}"
+)
+REDUCE_PROMPT = (
+    "The following are summaries of consecutive sections of one academic document. "
+    "Combine them into a single concise paragraph summarizing the whole document:\n\n{text}"
+)
+SINGLE_PROMPT = "Summarize the following academic document in a concise paragraph:\n\n{text}"
+
+
+def section_hash(section_text, model_name):
+    """Cache key for one section: model + map prompt + normalized text."""
+    normalized = " ".join(section_text.split())
+    return hashlib.sha256(f"{model_name}\n{MAP_PROMPT}\n{normalized}".encode("utf-8")).hexdigest()
+
+
+class SectionCollector:
+    """
+    Passes pages through unchanged while grouping them into summary sections of
+    `pages_per_section` pages. A section is also closed early at `max_chars`, and
+    single pages above that (e.g. a whole .txt file) are split by characters.
+    Each closed section is handed to `on_section` and not kept, so at most one
+    section of text is buffered here.
+    """
+
+    def __init__(self, on_section, pages_per_section=8, max_chars=20000):
+        self.on_section = on_section
+        self.pages_per_section = pages_per_section
+        self.max_chars = max_chars
+        self.count = 0
+        self._current = []
+        self._pages = 0
+        self._size = 0
+
+    def wrap(self, pages):
+        for page in pages:
+            self._add(page or "")
+            yield page
+        self._close()
+
+    def _add(self, page):
+        for start in range(0, max(len(page), 1), self.max_chars):
+            piece = page[start:start + self.max_chars]
+            if self._size and self._size + len(piece) > self.max_chars:
+                self._close()
+            self._current.append(piece)
+            self._size += len(piece)
+        self._pages += 1
+        if self._pages >= self.pages_per_section:
+            self._close()
+
+    def _close(self):
+        section = "\n".join(self._current)
+        self._current, self._pages, self._size = [], 0, 0
+        if section.strip():
+            self.count += 1
+            self.on_section(section)
+
+
+class DocumentSummary:
+    """
+    Summary of one document fed section by section (see HierarchicalSummarizer.start).
+    Each section is summarized as soon as it is added, so only partial summaries are
+    kept; the first section is held back until a second one arrives, because a
+    single-section document is summarized with SINGLE_PROMPT instead.
+    """
+
+    def __init__(self, summarizer, limit=None):
+        self.summarizer = summarizer
+        self.limit = limit
+        self._first = None
+        self._futures = []
+        self._cached = 0
+
+    def add(self, section):
+        if not section.strip():
+            return
+        if self._first is None and not self._futures:
+            self._first = section
+            return
+        if self._first is not None:
+            self._submit(self._first)
+            self._first = None
+        self._submit(section)
+
+    def _submit(self, section):
+        # Sections queued behind busy workers still hold their text; wait for the
+        # oldest one instead of queueing more than the pool can run at once
+        running = [future for future in self._futures if not future.done()]
+        if len(running) >= self.summarizer.concurrency:
+            running[0].result()
+        executor = self.summarizer._pool_executor()
+        self._futures.append(executor.submit(self.summarizer.map_section, section, self.limit))
+
+    def result(self):
+        """Returns one paragraph for the whole document."""
+        if self._first is not None:
+            return self.summarizer._generate(SINGLE_PROMPT.format(text=self._first), self.limit).strip()
+        if not self._futures:
+            return ""
+        # result() re-raises the first failure (e.g. ModelUnavailableError) to the caller
+        partials = [future.result() for future in self._futures]
+        cached = sum(1 for _, hit in partials if hit)
+        logger.info(f"Summarized {len(partials)} sections ({cached} cached, {len(partials) - cached} generated)")
+        return self.summarizer.reduce([summary for summary, _ in partials], self.limit)
+
+    def cancel(self):
+        """Drops sections that haven't been summarized yet (the document is not being stored)."""
+        self._first = None
+        for future in self._futures:
+            future.cancel()
+
+
+class HierarchicalSummarizer:
+    """Summarizes documents with a shared, bounded pool of map workers."""
+
+    def __init__(self, generate, model_name, get_pool=None, concurrency=4, reduce_max_chars=20000):
+        """
+        `generate(prompt) -> str` performs one model call (already rate limited by the caller);
+        `get_pool()` returns the SQLAlchemy engine used for the section summary cache.
+        """
+        self.generate = generate
+        self.model_name = model_name
+        self.get_pool = get_pool or (lambda: None)
+        self.concurrency = max(1, concurrency)
+        self.reduce_max_chars = reduce_max_chars
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.concurrency,
+                                                    thread_name_prefix="summary-map")
+            return self._executor
+
+    def _generate(self, prompt, limit=None):
+        """One model call, inside `limit()` (e.g. an ingest stage slot) when given."""
+        with (limit() if limit else nullcontext()):
+            return self.generate(prompt)
+
+    def start(self, limit=None):
+        """A DocumentSummary to add sections to as they are read; `limit` wraps each model call."""
+        return DocumentSummary(self, limit)
+
+    def summarize(self, sections, limit=None):
+        """Returns one paragraph for a document already split into sections."""
+        summary = self.start(limit)
+        for section in sections:
+            summary.add(section)
+        return summary.result()
+
+    def map_section(self, section, limit=None):
+        """(summary, cached) for one section; cached summaries are not regenerated."""
+        key = section_hash(section, self.model_name)
+        cached = self._cache_get({key})
+        if key in cached:
+            return cached[key], True
+        summary = self._generate(MAP_PROMPT.format(text=section), limit).strip()
+        self._cache_set({key: summary})
+        return summary, False
+
+    def reduce(self, partials, limit=None):
+        """
+        Combines partial summaries, in several rounds if they don't fit in one prompt.
+        Partials are cut to half a prompt and every group takes at least two of them,
+        so each round at least halves their number.
+        """
+        half = max(1, (self.reduce_max_chars - 2) // 2)
+        partials = [partial[:half] for partial in partials]
+        while True:
+            joined = "\n\n".join(partials)
+            if len(joined) <= self.reduce_max_chars or len(partials) == 1:
+                return self._generate(REDUCE_PROMPT.format(text=joined[:self.reduce_max_chars]), limit).strip()
+            groups, current, size = [], [], 0
+            for partial in partials:
+                if len(current) >= 2 and size + len(partial) > self.reduce_max_chars:
+                    groups.append(current)
+                    current, size = [], 0
+                current.append(partial)
+                size += len(partial) + 2
+            groups.append(current)
+            executor = self._pool_executor()
+            futures = [executor.submit(self._generate, REDUCE_PROMPT.format(text="\n\n".join(group)), limit)
+                       for group in groups]
+            partials = [future.result().strip()[:half] for future in futures]
+
+    # --- section summary cache ---------------------------------------------
+
+    def _cache_get(self, keys):
+        pool = self.get_pool()
+        if pool is None or not keys:
+            return {}
+        try:
+            with pool.connect() as conn:
+                rows = conn.execute(text("""
+                    SELECT section_hash, summary FROM chunk_summaries
+                    WHERE section_hash = ANY(:keys)
+                """), {"keys": list(keys)}).fetchall()
+            return {row[0]: row[1] for row in rows}
+        except Exception as e:
+            logger.warning(f"Section summary cache read failed: {e}")
+            return {}
+
+    def _cache_set(self, summaries):
+        pool = self.get_pool()
+        if pool is None or not summaries:
+            return
+        try:
+            with pool.connect() as conn:
+                conn.execute(text("""
+                    INSERT INTO chunk_summaries (section_hash, summary, model_name)
+                    VALUES (:section_hash, :summary, :model_name)
+                    ON CONFLICT (section_hash) DO NOTHING
+                """), [{"section_hash": key, "summary": value, "model_name": self.model_name}
+                       for key, value in summaries.items()])
+                conn.commit()
+        except Exception as e:
+            logger.warning(f"Section summary cache write failed: {e}")
@@ -0,0 +1,31 @@
+import pytest
+import sqlalchemy
+from sqlalchemy import text
+
+import backfill
+
+
+@pytest.fixture
+def db(monkeypatch):
+    engine = sqlalchemy.create_engine("sqlite://", poolclass=sqlalchemy.pool.StaticPool)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE documents (id INTEGER PRIMARY KEY, gcs_path TEXT)"))
+        conn.execute(text("CREATE TABLE document_embeddings (document_id INTEGER, embedding_model TEXT)"))
+        conn.execute(text("INSERT INTO documents VALUES (1, 'gs://b/1.pdf'), (2, 'gs://b/2.pdf'), "
+                          "(3, 'gs://b/3.pdf'), (4, 'local/4.txt')"))
+        # 1 was backfilled; 2 and 3 were ingested during the run, under the old model only
+        conn.execute(text("INSERT INTO document_embeddings VALUES (1, 'old'), (1, 'new'), (2, 'old'), (3, 'old')"))
+    monkeypatch.setattr(backfill, "db_pool", engine)
+    return engine
+
+
+def test_documents_missing_the_target_model(db):
+    assert backfill.missing_documents("new") == (2, [2, 3])
+    assert backfill.missing_documents("old") == (0, [])
+
+
+def test_check_blocks_the_cutover_until_every_document_has_vectors(db):
+    assert backfill.run(backfill.parse_args(["--model", "new", "--check"])) == 1
+    with db.begin() as conn:
+        conn.execute(text("INSERT INTO document_embeddings VALUES (2, 'new'), (3, 'new')"))
+    assert backfill.run(backfill.parse_args(["--model", "new", "--check"])) == 0
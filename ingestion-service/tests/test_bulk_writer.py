@@ -0,0 +1,92 @@
+import struct
+from collections import namedtuple
+
+import pytest
+
+from bulk_writer import BulkDocumentWriter, encode_copy_binary
+
+Chunk = namedtuple("Chunk", ["index", "text", "token_count"])
+
+
+def fields(stream):
+    """Decodes a binary COPY stream back into rows of raw field bytes (None for NULL)."""
+    data = stream.read()
+    assert data.startswith(b"PGCOPY\n\xff\r\n\x00")
+    pos, rows = 19, []
+    while True:
+        (count,) = struct.unpack_from(">h", data, pos)
+        pos += 2
+        if count == -1:
+            break
+        row = []
+        for _ in range(count):
+            (size,) = struct.unpack_from(">i", data, pos)
+            pos += 4
+            if size == -1:
+                row.append(None)
+            else:
+                row.append(data[pos:pos + size])
+                pos += size
+        rows.append(row)
+    assert pos == len(data)
+    return rows
+
+
+def test_encode_copy_binary_round_trip():
+    rows = fields(encode_copy_binary([(7, "héllo", [1.0, -0.5]), (8, None, None)], ["int4", "text", "vector"]))
+    assert rows[0][0] == struct.pack(">i", 7)
+    assert rows[0][1] == "héllo".encode("utf-8")
+    assert rows[0][2] == struct.pack(">hhff", 2, 0, 1.0, -0.5)
+    assert rows[1] == [struct.pack(">i", 8), None, None]
+
+
+def test_text_fields_drop_nul_bytes():
+    assert fields(encode_copy_binary([("a\x00b",)], ["text"]))[0][0] == b"ab"
+
+
+def test_unknown_field_kind_is_rejected():
+    with pytest.raises(ValueError):
+        encode_copy_binary([(1,)], ["float8"])
+
+
+class FlakyWriter(BulkDocumentWriter):
+    """Fails any insert that contains a document named "bad"."""
+
+    def __init__(self):
+        super().__init__(lambda: object(), "model")
+        self.inserts = []
+
+    def _insert(self, batch):
+        names = [doc["filename"] for doc, *_ in batch]
+        self.inserts.append(names)
+        if "bad" in names:
+            raise ValueError("invalid input")
+        return [hash(name) for name in names]
+
+
+def document(name):
+    return {"filename": name, "gcs_path": f"gs://b/{name}", "document_type": "text",
+            "summary": "", "status": "processed", "content_hash": None}
+
+
+def test_a_bad_document_only_fails_itself():
+    writer = FlakyWriter()
+    names = ["a", "b", "bad", "c", "d"]
+    futures = [writer.add(document(name), chunks=[(Chunk(0, "x", 1), [0.0])]) for name in names]
+    writer.flush()
+    for name, future in zip(names, futures):
+        if name == "bad":
+            with pytest.raises(ValueError):
+                future.result(timeout=5)
+        else:
+            assert future.result(timeout=5) == hash(name)
+    assert writer.inserts[0] == names
+
+
+def test_no_pool_fails_the_batch_without_bisecting():
+    writer = BulkDocumentWriter(lambda: None, "model")
+    futures = [writer.add(document(name)) for name in "ab"]
+    writer.flush()
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=5)
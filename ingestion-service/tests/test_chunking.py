@@ -0,0 +1,109 @@
+import os
+import sys
+
+from main import chunk_text, estimate_tokens, generate_embeddings, pool_embeddings, _embedding_batches, Chunk
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                                "benchmarks"))
+from fakes import FakeEmbeddingModel  # noqa: E402
+
+
+def words(n, prefix="w"):
+    # 4-character words: one estimated token each
+    return " ".join(f"{prefix}{i:03d}"[-4:] for i in range(n))
+
+
+def test_chunks_respect_the_token_cap_and_overlap():
+    chunks = list(chunk_text(words(25), max_tokens=10, overlap_tokens=3))
+    assert [c.index for c in chunks] == list(range(len(chunks)))
+    assert all(c.token_count <= 10 for c in chunks)
+    for previous, current in zip(chunks, chunks[1:]):
+        assert previous.text.split()[-3:] == current.text.split()[:3]
+    # Every word is in some chunk, in order
+    seen = []
+    for chunk in chunks:
+        for word in chunk.text.split():
+            if not seen or word > seen[-1]:
+                seen.append(word)
+    assert seen == words(25).split()
+
+
+def test_overlap_is_capped_at_half_a_chunk():
+    chunks = list(chunk_text(words(20), max_tokens=4, overlap_tokens=100))
+    assert all(c.token_count <= 4 for c in chunks)
+    assert chunks[1].text.split()[:2] == chunks[0].text.split()[-2:]
+
+
+def test_string_and_page_iterables_chunk_the_same():
+    text = words(30)
+    pages = iter([" ".join(text.split()[:13]), "", None, " ".join(text.split()[13:])])
+    assert list(chunk_text(pages, max_tokens=8, overlap_tokens=2)) == list(chunk_text(text, max_tokens=8,
+                                                                                      overlap_tokens=2))
+
+
+def test_long_words_are_split_at_the_cap():
+    chunks = list(chunk_text(["x" * 10000], max_tokens=100, overlap_tokens=0))
+    assert len(chunks) == 25
+    assert all(c.token_count == 100 and len(c.text) == 400 for c in chunks)
+    assert "".join(c.text for c in chunks) == "x" * 10000
+
+
+def test_empty_input_has_no_chunks():
+    assert list(chunk_text(["", "   \n"])) == []
+    assert estimate_tokens("a") == 1 and estimate_tokens("abcde") == 2
+
+
+def test_batches_are_capped_by_count_and_tokens():
+    chunks = [Chunk(i, "t", tokens) for i, tokens in enumerate([5, 5, 5, 20, 1, 1, 1])]
+    batches = list(_embedding_batches(chunks, batch_size=3, max_batch_tokens=12))
+    assert [[c.index for c in batch] for batch in batches] == [[0, 1], [2], [3], [4, 5, 6]]
+    # A single chunk over the token cap still gets its own batch
+    assert list(_embedding_batches([Chunk(0, "t", 50)], 3, 12)) == [[Chunk(0, "t", 50)]]
+
+
+class CountingModel(FakeEmbeddingModel):
+    def __init__(self):
+        super().__init__(dimensions=8)
+        self.calls = []
+
+    def get_embeddings(self, inputs):
+        self.calls.append([item.text for item in inputs])
+        return super().get_embeddings(inputs)
+
+
+def test_generate_embeddings_with_a_fake_model():
+    model = CountingModel()
+    pages = [words(800), words(800, prefix="v")]
+    results = generate_embeddings(iter(pages), model=model, batch_size=2, max_batch_tokens=1000)
+
+    chunks = [chunk for chunk, _ in results]
+    assert chunks == list(chunk_text(pages))
+    assert len(chunks) >= 3
+    assert [text for call in model.calls for text in call] == [chunk.text for chunk in chunks]
+    tokens = {chunk.text: chunk.token_count for chunk in chunks}
+    assert all(len(call) == 1 or sum(tokens[text] for text in call) <= 1000 for call in model.calls)
+    assert len(model.calls) > len(chunks) // 2  # full chunks don't fit two to a call
+    assert all(len(vector) == 8 for _, vector in results)
+
+    model = CountingModel()
+    generate_embeddings(iter(pages), model=model, batch_size=2, max_batch_tokens=100000)
+    assert [len(call) for call in model.calls] == [2] * (len(chunks) // 2) + [1] * (len(chunks) % 2)
+
+    pooled = pool_embeddings(results)
+    assert abs(sum(v * v for v in pooled) - 1) < 1e-9
+
+
+def test_model_slot_is_only_held_around_embedding_calls():
+    held = []
+
+    class Limit:
+        def __enter__(self):
+            held.append("enter")
+
+        def __exit__(self, *exc):
+            held.append("exit")
+
+    model = CountingModel()
+    generate_embeddings(words(40), model=model, batch_size=1, max_batch_tokens=1000, limit=Limit)
+    assert held == ["enter", "exit"] * len(model.calls)
+    assert generate_embeddings("", model=model) == []
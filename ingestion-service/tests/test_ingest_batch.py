@@ -0,0 +1,137 @@
+import json
+
+import pytest
+
+import main
+from model_registry import ClientRegistry
+from work_queue import QueueFullError
+
+
+class StubBlob:
+    def __init__(self, name, content=""):
+        self.name = name
+        self.content = content
+
+    def download_as_text(self):
+        return self.content
+
+
+class StubStorage:
+    """Buckets as {bucket: {name: content}}."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+
+    def list_blobs(self, bucket_name, prefix="", max_results=None):
+        names = sorted(name for name in self.buckets.get(bucket_name, {}) if name.startswith(prefix))
+        return [StubBlob(name) for name in names][:max_results]
+
+    def bucket(self, bucket_name):
+        files = self.buckets.get(bucket_name, {})
+        return type("Bucket", (), {"blob": lambda _self, name: StubBlob(name, files.get(name, ""))})()
+
+
+class StubQueue:
+    """Accepts the first `capacity` jobs, then raises QueueFullError like a saturated queue."""
+
+    def __init__(self, capacity=100):
+        self.capacity = capacity
+        self.submitted = []
+
+    def submit(self, payload, key=None):
+        if len(self.submitted) >= self.capacity:
+            raise QueueFullError("Ingestion queue is full")
+        self.submitted.append((payload, key))
+        return {"job_id": f"job-{len(self.submitted)}", "state": "queued"}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    storage = StubStorage({
+        "docs": {"2025/a.pdf": "", "2025/b.txt": "", "2025/sub/": "", "2024/old.pdf": ""},
+        "lists": {"manifest.txt": "gs://docs/2025/a.pdf\n\ngs://docs/m1.txt\n",
+                  "manifest.json": json.dumps(["gs://docs/j1.txt", "gs://docs/j2.txt"])},
+    })
+    registry = ClientRegistry()
+    registry.override("storage", storage)
+    monkeypatch.setattr(main, "clients", registry)
+    monkeypatch.setattr(main, "ingest_queue", StubQueue())
+    monkeypatch.setattr(main, "INGEST_ASYNC", True)
+    return main.app.test_client()
+
+
+def test_resolves_uris_objects_prefix_and_manifests(client):
+    objects, duplicates = main.resolve_batch_objects({
+        "objects": ["gs://docs/x.pdf", {"bucket": "docs", "name": "y.txt"}, "gs://docs/x.pdf"],
+        "bucket": "docs", "prefix": "2025/",
+        "manifest": "gs://lists/manifest.txt",
+    })
+    assert objects == [("docs", "x.pdf"), ("docs", "y.txt"), ("docs", "2025/a.pdf"), ("docs", "2025/b.txt"),
+                       ("docs", "m1.txt")]
+    # x.pdf twice and 2025/a.pdf from both the prefix and the manifest
+    assert duplicates == 2
+
+
+def test_json_manifest(client):
+    assert main.resolve_batch_objects({"manifest": "gs://lists/manifest.json"}) == (
+        [("docs", "j1.txt"), ("docs", "j2.txt")], 0)
+
+
+@pytest.mark.parametrize("body, message", [
+    ({"objects": ["https://example.com/a.pdf"]}, "Not a gs://"),
+    ({"prefix": "2025/"}, "bucket is required"),
+    ({"objects": [{"name": "a.pdf"}]}, "bucket and a name"),
+    ({"objects": []}, "No objects"),
+])
+def test_invalid_bodies_are_400(client, body, message):
+    response = client.post("/ingest-batch", json=body)
+    assert response.status_code == 400
+    assert message in response.get_json()["error"]
+
+
+def test_too_many_objects_is_413(client, monkeypatch):
+    monkeypatch.setattr(main, "INGEST_BATCH_MAX_OBJECTS", 2)
+    response = client.post("/ingest-batch", json={"objects": ["gs://docs/1", "gs://docs/2", "gs://docs/3"]})
+    assert response.status_code == 413
+    assert main.ingest_queue.submitted == []
+
+
+def test_queued_report_lists_accepted_and_rejected_objects(client):
+    main.ingest_queue.capacity = 2
+    response = client.post("/ingest-batch", json={"objects": ["gs://docs/1", "gs://docs/2", "gs://docs/1",
+                                                              "gs://docs/3"]})
+    assert response.status_code == 200
+    report = response.get_json()
+    assert (report["objects"], report["duplicates"]) == (3, 1)
+    assert report["summary"] == {"accepted": 2, "rejected": 1}
+    accepted, _, rejected = report["results"]
+    assert accepted == {"object": "gs://docs/1", "status": "accepted", "job_id": "job-1", "state": "queued",
+                        "status_url": "/ingest-status/job-1"}
+    assert rejected["object"] == "gs://docs/3" and rejected["retry_after"] == main.INGEST_RETRY_AFTER_SECONDS
+    assert main.ingest_queue.submitted[0] == ({"bucket_name": "docs", "file_name": "1"}, "gs://docs/1")
+
+
+def test_wait_processes_objects_and_reports_each_result(client, monkeypatch):
+    def process_object(bucket_name, file_name):
+        if file_name == "bad.pdf":
+            raise RuntimeError("boom")
+        if file_name == "busy.pdf":
+            return {"status": "failure", "message": "Vertex AI unavailable", "retry_after": 30}, 503
+        return {"status": "success", "document_id": 7}, 200
+
+    monkeypatch.setattr(main, "process_object", process_object)
+    response = client.post("/ingest-batch", json={"objects": ["gs://docs/ok.pdf", "gs://docs/bad.pdf",
+                                                              "gs://docs/busy.pdf"], "wait": True})
+    results = response.get_json()["results"]
+    assert [(r["object"], r["status_code"]) for r in results] == [
+        ("gs://docs/ok.pdf", 200), ("gs://docs/bad.pdf", 500), ("gs://docs/busy.pdf", 503)]
+    assert results[1]["message"] == "boom"
+    assert response.get_json()["summary"] == {"success": 1, "failure": 2}
+    assert main.ingest_queue.submitted == []
+
+
+def test_open_breaker_rejects_the_batch(client, monkeypatch):
+    monkeypatch.setattr(main.model_scheduler.breaker, "_opened_at", main.time.monotonic())
+    response = client.post("/ingest-batch", json={"objects": ["gs://docs/1"]})
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
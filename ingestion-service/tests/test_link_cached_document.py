@@ -0,0 +1,27 @@
+import sqlalchemy
+from sqlalchemy import text
+
+import main
+
+
+def test_only_the_cached_models_chunks_are_copied():
+    engine = sqlalchemy.create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(text("""CREATE TABLE documents (id INTEGER PRIMARY KEY, filename TEXT, gcs_path TEXT,
+                             document_type TEXT, summary TEXT, status TEXT, content_hash TEXT)"""))
+        conn.execute(text("CREATE TABLE document_embeddings (document_id INTEGER, embedding TEXT, embedding_model TEXT)"))
+        conn.execute(text("""CREATE TABLE document_chunks (document_id INTEGER, chunk_index INTEGER, token_count INTEGER,
+                             embedding TEXT, embedding_model TEXT, content TEXT)"""))
+        conn.execute(text("INSERT INTO documents (id, filename, document_type) VALUES (1, 'a.pdf', 'pdf')"))
+        # The source was ingested before and after a model cutover, so it has chunk vectors for both
+        conn.execute(text("""INSERT INTO document_chunks VALUES
+                             (1, 0, 10, '[1]', 'old-model', 'x'), (1, 1, 10, '[2]', 'old-model', 'y'),
+                             (1, 0, 10, '[3]', 'new-model', 'x'), (1, 1, 10, '[4]', 'new-model', 'y')"""))
+
+        doc_id = main.link_cached_document(conn, (1, "summary", "[9]", "new-model"), "b.pdf", "gs://b/b.pdf", "h")
+
+        chunks = conn.execute(text("""SELECT chunk_index, embedding, embedding_model FROM document_chunks
+                                      WHERE document_id = :id ORDER BY chunk_index"""), {"id": doc_id}).all()
+        assert chunks == [(0, "[3]", "new-model"), (1, "[4]", "new-model")]
+        assert conn.execute(text("SELECT embedding_model FROM document_embeddings WHERE document_id = :id"),
+                            {"id": doc_id}).all() == [("new-model",)]
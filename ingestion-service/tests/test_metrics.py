@@ -0,0 +1,49 @@
+from metrics import Registry, finish_profile, server_timing, span, start_profile, wants_profile
+import metrics
+
+
+def test_counter_and_summary_render():
+    registry = Registry()
+    counter = registry.counter("bytes_total", "Bytes")
+    counter.inc(3, kind="pdf")
+    counter.inc(2, kind="pdf")
+    counter.inc(kind='a"b')
+    summary = registry.summary("latency_seconds", "Latency")
+    for value in (1.0, 2.0, 3.0, 4.0):
+        summary.observe(value, stage="x")
+
+    lines = registry.render().splitlines()
+    assert 'bytes_total{kind="pdf"} 5' in lines
+    assert 'bytes_total{kind="a\\"b"} 1' in lines
+    assert 'latency_seconds{quantile="0.5",stage="x"} 3.000000' in lines
+    assert 'latency_seconds_sum{stage="x"} 10.000000' in lines
+    assert 'latency_seconds_count{stage="x"} 4' in lines
+
+
+def test_registering_twice_returns_the_same_metric():
+    registry = Registry()
+    assert registry.counter("c", "help") is registry.counter("c", "other help")
+
+
+def test_failing_callbacks_are_skipped():
+    registry = Registry()
+    registry.callback("broken", "help", lambda: 1 / 0)
+    registry.callback("pool", "help", lambda: {"size": 5, "name": "x"}, label="state")
+    text = registry.render()
+    assert "broken" not in text
+    assert 'pool{state="size"} 5' in text and "name" not in text
+
+
+def test_span_records_the_stage_and_the_request_profile():
+    profile, token = start_profile(wants_profile("1"))
+    try:
+        with span("unit_test_stage"):
+            pass
+        with span("unit_test_stage"):
+            pass
+    finally:
+        finish_profile(token)
+    assert [stage for stage, _ in profile] == ["unit_test_stage", "unit_test_stage"]
+    assert metrics.REGISTRY.stages.snapshot()[(("stage", "unit_test_stage"),)]["count"] >= 2
+    assert server_timing([("a", 0.001), ("a", 0.002)], 0.01) == "a;dur=3.00, total;dur=10.00"
+    assert start_profile(wants_profile("no")) == (None, None)
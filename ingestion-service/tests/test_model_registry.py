@@ -0,0 +1,49 @@
+import threading
+
+from model_registry import ClientRegistry
+
+
+def test_factory_can_depend_on_another_registered_client():
+    clients = ClientRegistry()
+    clients.register("vertexai", lambda: "initialized")
+    clients.register("embedding_model", lambda: ("model", clients.get("vertexai")))
+
+    result = []
+    worker = threading.Thread(target=lambda: result.append(clients.get("embedding_model")), daemon=True)
+    worker.start()
+    worker.join(5)
+    assert result == [("model", "initialized")], "get() deadlocked on a nested factory"
+    assert clients.loaded() == ["embedding_model", "vertexai"]
+
+
+def test_each_client_is_built_once_under_concurrency():
+    clients = ClientRegistry()
+    builds = []
+    started = threading.Barrier(8)
+
+    def factory():
+        builds.append(1)
+        return object()
+
+    clients.register("storage", factory)
+    results = []
+
+    def get():
+        started.wait()
+        results.append(clients.get("storage"))
+
+    threads = [threading.Thread(target=get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert len(builds) == 1
+    assert len({id(client) for client in results}) == 1
+
+
+def test_override_replaces_without_building():
+    clients = ClientRegistry()
+    clients.register("storage", lambda: (_ for _ in ()).throw(AssertionError("should not build")))
+    fake = object()
+    clients.override("storage", fake)
+    assert clients.get("storage") is fake
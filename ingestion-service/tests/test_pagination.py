@@ -0,0 +1,49 @@
+import pytest
+import sqlalchemy
+from sqlalchemy import text
+
+from pagination import decode_cursor, encode_cursor, fetch_page, keyset_clause
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor("Ñandú, María", 42)
+    assert "/" not in cursor and "+" not in cursor  # safe in a query string
+    assert decode_cursor(cursor) == ("Ñandú, María", 42)
+
+
+def test_null_name_cursor_sorts_as_empty():
+    assert decode_cursor(encode_cursor(None, 7)) == ("", 7)
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", encode_cursor("a", 1)[:-4], "WyJhIl0="])
+def test_malformed_cursor(cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(cursor)
+
+
+def test_keyset_clause():
+    assert keyset_clause(None, "name", "id") == ("TRUE", {})
+    where, params = keyset_clause(encode_cursor("b", 3), "s.name", "s.id")
+    assert where == "(COALESCE(s.name, ''), s.id) > (:after_name, :after_id)"
+    assert params == {"after_name": "b", "after_id": 3}
+
+
+def test_pages_cover_every_row_once():
+    engine = sqlalchemy.create_engine("sqlite://")
+    names = ["b", None, "a", "b", "c", None, "a"]
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE groups (id INTEGER PRIMARY KEY, name TEXT)"))
+        conn.execute(text("INSERT INTO groups (id, name) VALUES (:id, :name)"),
+                     [{"id": i + 1, "name": name} for i, name in enumerate(names)])
+
+    seen, cursor = [], None
+    with engine.connect() as conn:
+        while True:
+            where, params = keyset_clause(cursor, "name", "id")
+            sql = f"SELECT id, name FROM groups WHERE {where} ORDER BY COALESCE(name, ''), id LIMIT :limit"
+            items, cursor = fetch_page(conn, sql, params, 2, lambda row: (row[0], row[1]))
+            seen += items
+            if cursor is None:
+                break
+
+    assert seen == sorted(((i + 1, name) for i, name in enumerate(names)), key=lambda r: (r[1] or "", r[0]))
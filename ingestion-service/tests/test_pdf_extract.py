@@ -0,0 +1,45 @@
+import io
+
+import pypdf
+import pytest
+
+import pdf_extract
+from pdf_extract import iter_pdf_pages, PdfExtractionError
+
+
+class BytesBlob:
+    def __init__(self, data):
+        self.data = data
+
+    def download_to_file(self, file_obj):
+        file_obj.write(self.data)
+
+
+def blank_pdf(pages):
+    writer = pypdf.PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=72, height=72)
+    buf = io.BytesIO()
+    writer.write(buf)
+    return buf.getvalue()
+
+
+def test_serial_yields_every_page():
+    assert list(iter_pdf_pages(BytesBlob(blank_pdf(3)), workers=0)) == ["", "", ""]
+
+
+def test_parallel_pool_is_sized_from_the_callers_workers(monkeypatch):
+    monkeypatch.setattr(pdf_extract, "PDF_EXTRACT_WORKERS", 0)
+    monkeypatch.setattr(pdf_extract, "PDF_PAGES_PER_TASK", 2)
+    monkeypatch.setattr(pdf_extract, "_process_pool", None)
+    try:
+        assert list(iter_pdf_pages(BytesBlob(blank_pdf(5)), workers=2)) == [""] * 5
+    finally:
+        if pdf_extract._process_pool is not None:
+            pdf_extract._process_pool.shutdown()
+            pdf_extract._process_pool = None
+
+
+def test_unreadable_pdf_raises_instead_of_ending_the_stream():
+    with pytest.raises(PdfExtractionError):
+        list(iter_pdf_pages(BytesBlob(b"%PDF-1.4 not really a pdf"), workers=0))
@@ -0,0 +1,135 @@
+import threading
+
+import pytest
+
+from summarizer import MAP_PROMPT, REDUCE_PROMPT, SINGLE_PROMPT, HierarchicalSummarizer, SectionCollector
+
+
+class FakeModel:
+    """generate(prompt): echoes which prompt it got, or a fixed-length reply."""
+
+    def __init__(self, reply_chars=None):
+        self.reply_chars = reply_chars
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def __call__(self, prompt):
+        with self._lock:
+            self.prompts.append(prompt)
+        if self.reply_chars is not None:
+            return "x" * self.reply_chars
+        if prompt.startswith(MAP_PROMPT[:40]):
+            return "map:" + prompt[len(MAP_PROMPT.format(text="")):]
+        if prompt.startswith(REDUCE_PROMPT[:40]):
+            return "reduce"
+        return "single"
+
+
+def test_collector_hands_off_sections_without_keeping_them():
+    received = []
+    collector = SectionCollector(received.append, pages_per_section=2, max_chars=100)
+    pages = ["p1", "p2", "p3", "", "p5"]
+
+    assert list(collector.wrap(pages)) == pages
+    assert received == ["p1\np2", "p3\n", "p5"]
+    assert collector.count == 3
+    assert not hasattr(collector, "sections")
+
+
+def test_collector_splits_oversized_pages():
+    received = []
+    collector = SectionCollector(received.append, pages_per_section=8, max_chars=4)
+    list(collector.wrap(["abcdefghij"]))
+    assert received == ["abcd", "efgh", "ij"]
+
+
+def test_single_section_uses_single_prompt():
+    model = FakeModel()
+    summarizer = HierarchicalSummarizer(model, "m")
+    assert summarizer.summarize(["only section"]) == "single"
+    assert model.prompts == [SINGLE_PROMPT.format(text="only section")]
+
+
+def test_sections_are_mapped_as_added_and_reduced_in_order():
+    model = FakeModel()
+    summarizer = HierarchicalSummarizer(model, "m", concurrency=2)
+    document = summarizer.start()
+    document.add("one")
+    assert model.prompts == []  # held back until it is known not to be the only section
+    document.add("two")
+    document.add("three")
+    assert document.result() == "reduce"
+    assert model.prompts[-1] == REDUCE_PROMPT.format(text="map:one\n\nmap:two\n\nmap:three")
+
+
+def test_empty_document():
+    assert HierarchicalSummarizer(FakeModel(), "m").summarize(["", "  "]) == ""
+
+
+def test_every_call_takes_the_limit():
+    model = FakeModel()
+    entered = []
+
+    class Limit:
+        def __enter__(self):
+            entered.append(1)
+
+        def __exit__(self, *exc):
+            return False
+
+    HierarchicalSummarizer(model, "m").summarize(["a", "b", "c"], limit=Limit)
+    assert len(entered) == len(model.prompts) == 4
+
+
+def test_reduce_terminates_when_every_partial_is_large():
+    # Each reply is as long as a whole reduce prompt, so no two partials fit together as is
+    model = FakeModel(reply_chars=1000)
+    summarizer = HierarchicalSummarizer(model, "m", concurrency=4, reduce_max_chars=1000)
+    result = []
+    worker = threading.Thread(target=lambda: result.append(summarizer.reduce(["y" * 1000] * 9)), daemon=True)
+    worker.start()
+    worker.join(5)
+    assert result == ["x" * 1000]
+    # 9 partials -> 5 -> 3 -> 2, which fit in the final prompt
+    assert len(model.prompts) == 5 + 3 + 2 + 1
+    assert all(len(p) <= len(REDUCE_PROMPT) + 1000 for p in model.prompts)
+
+
+def test_map_failure_reaches_the_caller():
+    class Unavailable(Exception):
+        pass
+
+    def generate(prompt):
+        raise Unavailable()
+
+    document = HierarchicalSummarizer(generate, "m").start()
+    document.add("a")
+    document.add("b")
+    with pytest.raises(Unavailable):
+        document.result()
+
+
+def test_in_flight_sections_are_bounded():
+    release = threading.Event()
+    running = []
+    peak = []
+
+    def generate(prompt):
+        running.append(1)
+        peak.append(len(running))
+        release.wait(5)
+        running.pop()
+        return "s"
+
+    summarizer = HierarchicalSummarizer(generate, "m", concurrency=2)
+    document = summarizer.start()
+    adder = threading.Thread(target=lambda: [document.add(str(i)) for i in range(6)])
+    adder.start()
+    adder.join(0.3)
+    # The reader is blocked instead of queueing every section's text behind the workers
+    assert adder.is_alive()
+    assert len(document._futures) <= summarizer.concurrency + 1
+    release.set()
+    adder.join(5)
+    assert document.result() == "s"
+    assert max(peak) <= 2
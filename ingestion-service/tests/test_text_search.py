@@ -0,0 +1,49 @@
+import pytest
+import sqlalchemy
+from sqlalchemy import text
+
+import text_search
+from text_search import config_literal, fused_ranking, hybrid_candidates, is_short_query, lexical_ranking
+
+
+def test_config_literal_is_validated():
+    assert config_literal("spanish") == "'spanish'"
+    with pytest.raises(ValueError):
+        config_literal("spanish'; --")
+
+
+def test_short_queries():
+    assert is_short_query("Ana López")
+    assert not is_short_query(" ".join(["term"] * (text_search.HYBRID_SHORTCIRCUIT_MAX_TERMS + 1)))
+
+
+def test_hybrid_candidates():
+    assert hybrid_candidates(10) == 10 * text_search.HYBRID_CANDIDATE_FACTOR
+    assert hybrid_candidates(500, limit=1000) == 1000
+
+
+def test_lexical_ranking_uses_the_level_column():
+    chunks = lexical_ranking("document_chunks", "e.chunk_index", "TRUE", "chunks", config="simple")
+    documents = lexical_ranking("document_embeddings", "NULL::int", "TRUE", "documents", config="simple")
+    assert "e.content_tsv @@ tsq" in chunks and "websearch_to_tsquery('simple', :q)" in chunks
+    assert "d.summary_tsv @@ tsq" in documents and "LIMIT :k" in documents
+
+
+def test_reciprocal_rank_fusion():
+    # fused_ranking only uses portable SQL, so SQLite can run it over fixed rankings
+    engine = sqlalchemy.create_engine("sqlite://")
+    lexical = ("SELECT 1 AS document_id, 0 AS chunk_index, 9.0 AS score "
+               "UNION ALL SELECT 2, 0, 5.0")
+    semantic = ("SELECT 2 AS document_id, 0 AS chunk_index, 0.1 AS distance "
+                "UNION ALL SELECT 3, NULL, 0.2")
+    with engine.connect() as conn:
+        rows = conn.execute(text(f"SELECT * FROM ({fused_ranking(lexical, semantic, rrf_k=60)}) "
+                                 "ORDER BY score DESC, document_id")).fetchall()
+
+    scores = {row[0]: row[3] for row in rows}
+    # Document 2 is second lexically and first semantically, so it wins
+    assert [row[0] for row in rows] == [2, 1, 3]
+    assert scores[2] == pytest.approx(1 / 62 + 1 / 61)
+    assert scores[1] == pytest.approx(1 / 61)
+    assert scores[3] == pytest.approx(1 / 62)
+    assert {row[0]: row[2] for row in rows} == {1: None, 2: 0.1, 3: 0.2}
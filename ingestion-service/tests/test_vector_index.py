@@ -0,0 +1,71 @@
+import pytest
+
+import vector_index
+from vector_index import (apply_search_settings, indexed_models, model_literal, parse_storage, rerank_candidates,
+                          shares_index)
+
+
+class RecordingConnection:
+    """Records executed statements and answers scalar() with `scalar`."""
+
+    def __init__(self, scalar=None):
+        self.statements = []
+        self._scalar = scalar
+
+    def execute(self, statement, params=None):
+        self.statements.append((str(statement), params or {}))
+        return self
+
+    def scalar(self):
+        return self._scalar
+
+
+def test_parse_storage():
+    assert parse_storage(" text-embedding-004=halfvec, text-embedding-005=BINARY ,") == {
+        "text-embedding-004": "halfvec", "text-embedding-005": "binary"}
+    with pytest.raises(ValueError, match="Unknown storage type"):
+        parse_storage("m=int8")
+
+
+def test_model_literal_rejects_injection():
+    assert model_literal("text-embedding-004") == "'text-embedding-004'"
+    with pytest.raises(ValueError):
+        model_literal("x'; DROP TABLE documents; --")
+
+
+def test_rerank_candidates_are_capped():
+    assert rerank_candidates("halfvec", 10) == 10 * vector_index.RERANK_FACTORS["halfvec"]
+    assert rerank_candidates("binary", 500) == vector_index.MAX_CANDIDATES
+
+
+def test_indexed_models_reads_planner_statistics():
+    conn = RecordingConnection(["text-embedding-005", "text-embedding-004"])
+    assert indexed_models(conn, "document_chunks") == ["text-embedding-004", "text-embedding-005"]
+    assert "pg_stats" in conn.statements[0][0]
+    assert indexed_models(RecordingConnection(None), "document_chunks") == []
+
+
+def test_shares_index_during_a_backfill():
+    models = ["text-embedding-004", "text-embedding-005"]
+    assert shares_index("text-embedding-004", models, modes={})
+    assert not shares_index("text-embedding-004", ["text-embedding-004"], modes={})
+    # A compact-storage model is searched through its own partial index
+    assert not shares_index("text-embedding-004", models, modes={"text-embedding-004": "halfvec"})
+    # ...and its rows are not in the full-precision index the other model uses
+    assert not shares_index("text-embedding-004", models, modes={"text-embedding-005": "binary"})
+
+
+def test_filtered_searches_widen_the_candidate_list():
+    plain, filtered = RecordingConnection(), RecordingConnection()
+    apply_search_settings(plain, k=20)
+    apply_search_settings(filtered, k=20, filtered=True)
+    ef = [int(params["ef"]) for conn in (plain, filtered) for _, params in conn.statements if "ef" in params]
+    assert ef == [max(vector_index.HNSW_EF_SEARCH, 20), max(vector_index.HNSW_EF_SEARCH, 200)]
+
+
+def test_exact_mode_disables_index_scans():
+    conn = RecordingConnection()
+    apply_search_settings(conn, mode="exact")
+    assert "enable_indexscan" in conn.statements[0][0]
+    with pytest.raises(ValueError):
+        apply_search_settings(conn, mode="fuzzy")
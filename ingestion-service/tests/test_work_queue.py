@@ -0,0 +1,108 @@
+import threading
+import time
+
+import pytest
+
+from work_queue import StageLimiter, IngestQueue, RetryLater, QueueFullError, SUCCEEDED, FAILED
+
+
+def test_iterate_holds_the_stage_only_while_producing_items():
+    limiter = StageLimiter({"io": 1})
+    held = []
+
+    def pages():
+        for i in range(3):
+            # Producing an item happens inside the io slot
+            held.append(limiter._semaphores["io"].acquire(blocking=False))
+            yield i
+
+    seen = []
+    for page in limiter.iterate(pages(), "io"):
+        # ... and the consumer (e.g. an embedding call) runs outside it
+        free = limiter._semaphores["io"].acquire(blocking=False)
+        assert free
+        limiter._semaphores["io"].release()
+        seen.append(page)
+    assert seen == [0, 1, 2]
+    assert held == [False, False, False]
+
+
+def test_unknown_stage_is_unlimited():
+    limiter = StageLimiter({"io": 1})
+    with limiter.limit("model"), limiter.limit("model"):
+        pass
+    assert list(limiter.iterate(iter("ab"), "model")) == ["a", "b"]
+
+
+def test_limit_caps_concurrency():
+    limiter = StageLimiter({"model": 2})
+    inside, peak, lock = [0], [0], threading.Lock()
+    release = threading.Event()
+
+    def work():
+        with limiter.limit("model"):
+            with lock:
+                inside[0] += 1
+                peak[0] = max(peak[0], inside[0])
+            release.wait(0.05)
+            with lock:
+                inside[0] -= 1
+
+    threads = [threading.Thread(target=work) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert 1 <= peak[0] <= 2
+
+
+def wait_for(queue_, job_id, states=(SUCCEEDED, FAILED), timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue_.status(job_id)
+        if job["state"] in states:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job still {queue_.status(job_id)['state']}")
+
+
+def test_retry_later_requeues_the_job():
+    calls = []
+
+    def handler(name):
+        calls.append(name)
+        if len(calls) < 3:
+            raise RetryLater("model unavailable", retry_after=0.01)
+        return {"name": name}
+
+    ingest = IngestQueue(handler, workers=1, max_pending=2)
+    job = wait_for(ingest, ingest.submit({"name": "a"}, key="a")["job_id"])
+    assert job["state"] == SUCCEEDED and job["result"] == {"name": "a"}
+    assert job["attempts"] == 3 and calls == ["a"] * 3
+
+
+def test_retries_are_bounded():
+    def handler():
+        raise RetryLater("model unavailable", retry_after=0)
+
+    ingest = IngestQueue(handler, workers=1, max_attempts=2)
+    job = wait_for(ingest, ingest.submit({})["job_id"])
+    assert job["state"] == FAILED and job["attempts"] == 2
+
+
+def test_jobs_waiting_for_a_retry_count_as_pending():
+    ingest = IngestQueue(lambda: None, workers=0, max_pending=1)
+    ingest.start()
+    with ingest._lock:
+        ingest._delayed = 1
+    with pytest.raises(QueueFullError):
+        ingest.submit({})
+
+
+def test_duplicate_keys_share_a_job():
+    release = threading.Event()
+    ingest = IngestQueue(lambda: release.wait(5), workers=1)
+    first = ingest.submit({}, key="gs://b/a")
+    assert ingest.submit({}, key="gs://b/a")["job_id"] == first["job_id"]
+    release.set()
+    wait_for(ingest, first["job_id"])
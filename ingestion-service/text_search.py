@@ -0,0 +1,114 @@
+"""
+Full-text search over chunk text and summaries, and its fusion with vector search.
+
+document_chunks.content keeps the text of every embedded chunk, and
+documents.summary the Gemini summary; each has a generated tsvector column
+(content_tsv / summary_tsv) with a GIN index, so exact-term lookups (student
+names, course codes) are index scans. Hybrid queries rank both ways in one
+statement and merge the two lists with reciprocal-rank fusion:
+
+    score = 1 / (HYBRID_RRF_K + lexical rank) + 1 / (HYBRID_RRF_K + vector rank)
+
+Only depends on SQLAlchemy, like vector_index.py.
+"""
+import os
+import re
+import logging
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# Text search configuration of the tsvector columns; changing it regenerates them
+TEXT_SEARCH_CONFIG = os.environ.get("TEXT_SEARCH_CONFIG", "spanish").lower()
+HYBRID_RRF_K = int(os.environ.get("HYBRID_RRF_K", "60"))
+# Results taken from each ranking per requested result, before fusion
+HYBRID_CANDIDATE_FACTOR = int(os.environ.get("HYBRID_CANDIDATE_FACTOR", "4"))
+# Hybrid queries of at most this many terms are tried against the full-text index
+# first; when the matches fill the k results (and at least HYBRID_SHORTCIRCUIT_MIN_HITS)
+# the query is never embedded
+HYBRID_SHORTCIRCUIT_MAX_TERMS = int(os.environ.get("HYBRID_SHORTCIRCUIT_MAX_TERMS", "3"))
+HYBRID_SHORTCIRCUIT_MIN_HITS = int(os.environ.get("HYBRID_SHORTCIRCUIT_MIN_HITS", "1"))
+
+RETRIEVAL_MODES = ("vector", "hybrid", "keyword")
+
+_CONFIG_RE = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+# (table, source column, tsvector column)
+TEXT_SEARCH_COLUMNS = (
+    ("document_chunks", "content", "content_tsv"),
+    ("documents", "summary", "summary_tsv"),
+)
+
+
+def config_literal(config=None):
+    config = config or TEXT_SEARCH_CONFIG
+    if not _CONFIG_RE.match(config):
+        raise ValueError(f"Invalid TEXT_SEARCH_CONFIG: {config}")
+    return f"'{config}'"
+
+
+def ensure_text_search(conn, config=None):
+    """
+    Adds the chunk text column, the generated tsvector columns and their GIN indexes.
+    A tsvector column generated with another configuration is dropped and rebuilt.
+    """
+    config = config_literal(config)
+    conn.execute(text("ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS content TEXT"))
+    for table, source, column in TEXT_SEARCH_COLUMNS:
+        current = conn.execute(text("""
+            SELECT pg_get_expr(d.adbin, d.adrelid) FROM pg_attrdef d
+            JOIN pg_attribute a ON a.attrelid = d.adrelid AND a.attnum = d.adnum
+            WHERE d.adrelid = CAST(:table AS regclass) AND a.attname = :column
+        """), {"table": table, "column": column}).scalar()
+        if current is not None and config not in current:
+            logger.info(f"Rebuilding {table}.{column} with text search configuration {config}")
+            conn.execute(text(f"ALTER TABLE {table} DROP COLUMN {column}"))
+        conn.execute(text(f"""
+            ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} tsvector
+            GENERATED ALWAYS AS (to_tsvector({config}::regconfig, COALESCE({source}, ''))) STORED
+        """))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table} USING gin ({column})"))
+
+
+def is_short_query(query):
+    return len(query.split()) <= HYBRID_SHORTCIRCUIT_MAX_TERMS
+
+
+def hybrid_candidates(k, limit=1000):
+    return min(limit, max(k, k * HYBRID_CANDIDATE_FACTOR))
+
+
+def lexical_ranking(table, chunk_index, where, level="chunks", limit="k", config=None):
+    """
+    SELECT of (document_id, chunk_index, score) ranked by ts_rank_cd; the query text is
+    bound as :q. `table` is aliased e and joined to documents d, like the vector queries.
+    """
+    column = "e.content_tsv" if level == "chunks" else "d.summary_tsv"
+    return f"""
+        SELECT e.document_id, {chunk_index} AS chunk_index, ts_rank_cd({column}, tsq) AS score
+        FROM {table} e JOIN documents d ON d.id = e.document_id,
+             websearch_to_tsquery({config_literal(config)}, :q) tsq
+        WHERE {where} AND {column} @@ tsq
+        ORDER BY score DESC
+        LIMIT :{limit}
+    """
+
+
+def fused_ranking(lexical, semantic, rrf_k=None):
+    """
+    Reciprocal-rank fusion of a lexical_ranking and a vector ranking (document_id,
+    chunk_index, distance) into (document_id, chunk_index, distance, score).
+    """
+    rrf_k = HYBRID_RRF_K if rrf_k is None else int(rrf_k)
+    return f"""
+        WITH lexical AS MATERIALIZED ({lexical}),
+             semantic AS MATERIALIZED ({semantic})
+        SELECT COALESCE(l.document_id, s.document_id) AS document_id,
+               COALESCE(l.chunk_index, s.chunk_index) AS chunk_index,
+               s.distance,
+               COALESCE(1.0 / ({rrf_k} + l.rank), 0) + COALESCE(1.0 / ({rrf_k} + s.rank), 0) AS score
+        FROM (SELECT *, row_number() OVER (ORDER BY score DESC) AS rank FROM lexical) l
+        FULL JOIN (SELECT *, row_number() OVER (ORDER BY distance) AS rank FROM semantic) s
+          ON s.document_id = l.document_id AND COALESCE(s.chunk_index, -1) = COALESCE(l.chunk_index, -1)
+    """
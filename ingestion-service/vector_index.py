@@ -0,0 +1,246 @@
+"""
+pgvector index management and similarity-search helpers.
+
+Shared by main.py (schema setup and /search) and benchmarks/search_benchmark.py,
+so it only depends on SQLAlchemy.
+
+Compact storage (EMBEDDING_STORAGE, per embedding model) keeps the ANN index small
+enough for a 512 MB instance. The full-precision vectors stay in the table. At 3 kB
+they are TOASTed out of line, so scans don't pull them into the buffer cache. A
+model's rows are indexed instead through a partial expression index over a
+compact form:
+- halfvec: 16-bit floats, half the index size, recall close to full precision.
+- binary: binary_quantize(), 1 bit per dimension, about 1/32 of the size.
+  Candidates come from Hamming distance, so more of them are needed.
+Searches fetch k * RERANK_FACTOR_<TYPE> candidates from that index and re-rank
+them by exact cosine distance on the full vectors. The full-precision index
+then skips compact models. Requires pgvector >= 0.7.
+
+int8 vectors with per-vector scale factors are not offered: pgvector has no int8
+vector type or operator class. They would need a bytea column and a SQL distance
+function, which no index can serve. halfvec is the nearest native equivalent,
+and binary quantization gives the larger saving.
+"""
+import os
+import re
+import hashlib
+import logging
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# "hnsw", "ivfflat" or "none"
+VECTOR_INDEX_TYPE = os.environ.get("VECTOR_INDEX_TYPE", "hnsw").lower()
+HNSW_M = int(os.environ.get("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.environ.get("HNSW_EF_CONSTRUCTION", "64"))
+HNSW_EF_SEARCH = int(os.environ.get("HNSW_EF_SEARCH", "40"))
+# IVFFlat should be (re)built once the table has data; rows/1000 lists is the usual starting point
+IVFFLAT_LISTS = int(os.environ.get("IVFFLAT_LISTS", "100"))
+IVFFLAT_PROBES = int(os.environ.get("IVFFLAT_PROBES", "10"))
+
+SEARCH_MODES = ("ann", "exact")
+
+# "text-embedding-004=halfvec,text-embedding-005=binary"; models not listed use "full"
+EMBEDDING_STORAGE = os.environ.get("EMBEDDING_STORAGE", "")
+STORAGE_TYPES = ("full", "halfvec", "binary")
+# Candidates read from a compact index per requested result, before the exact re-rank
+RERANK_FACTORS = {
+    "halfvec": int(os.environ.get("RERANK_FACTOR_HALFVEC", "2")),
+    "binary": int(os.environ.get("RERANK_FACTOR_BINARY", "10")),
+}
+MAX_CANDIDATES = 1000  # hnsw.ef_search upper bound
+VECTOR_DIMENSIONS = 768
+
+_IDENTIFIER_RE = re.compile(r"^[a-z_][a-z0-9_]*$")
+_MODEL_RE = re.compile(r"^[A-Za-z0-9._@/-]+$")
+
+
+def parse_storage(spec):
+    """'model=halfvec,other=binary' -> {model: storage}."""
+    modes = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        model, _, storage = item.partition("=")
+        model, storage = model.strip(), storage.strip().lower()
+        if storage not in STORAGE_TYPES:
+            raise ValueError(f"Unknown storage type '{storage}' for {model} (expected one of {', '.join(STORAGE_TYPES)})")
+        model_literal(model)
+        modes[model] = storage
+    return modes
+
+
+STORAGE_MODES = parse_storage(EMBEDDING_STORAGE)
+
+
+def storage_for(model, modes=None):
+    return (STORAGE_MODES if modes is None else modes).get(model, "full")
+
+
+def model_literal(model):
+    """
+    SQL literal for a configured model name. Searches inline it instead of binding it,
+    so the planner can prove the per-model partial index predicates.
+    """
+    if not _MODEL_RE.match(model or ""):
+        raise ValueError(f"Invalid embedding model name: {model!r}")
+    return f"'{model}'"
+
+
+def _index_method(index_type, ops):
+    if index_type == "hnsw":
+        return "hnsw", ops, f"WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION})"
+    if index_type == "ivfflat":
+        return "ivfflat", ops, f"WITH (lists = {IVFFLAT_LISTS})"
+    raise ValueError(f"Unknown VECTOR_INDEX_TYPE: {index_type}")
+
+
+def _compact_expression(storage, dimensions):
+    """(indexed expression, operator class) of a compact storage type."""
+    if storage == "halfvec":
+        return f"(embedding::halfvec({dimensions}))", "halfvec_cosine_ops"
+    if storage == "binary":
+        return f"(binary_quantize(embedding)::bit({dimensions}))", "bit_hamming_ops"
+    raise ValueError(f"Not a compact storage type: {storage}")
+
+
+def candidate_distance(storage, column="e.embedding", dimensions=VECTOR_DIMENSIONS):
+    """ORDER BY expression for the compact-index scan; the query vector is bound as :query_vector."""
+    if storage == "halfvec":
+        return f"{column}::halfvec({dimensions}) <=> CAST(:query_vector AS halfvec({dimensions}))"
+    if storage == "binary":
+        return f"binary_quantize({column})::bit({dimensions}) <~> binary_quantize(CAST(:query_vector AS vector))"
+    raise ValueError(f"Not a compact storage type: {storage}")
+
+
+def rerank_candidates(storage, k):
+    return min(MAX_CANDIDATES, max(k, k * RERANK_FACTORS[storage]))
+
+
+def _digest(*parts):
+    return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()[:8]
+
+
+def index_name(table, index_type=None, exclude_models=()):
+    """Index name encodes the build parameters, so a parameter change means a new index."""
+    index_type = index_type or VECTOR_INDEX_TYPE
+    suffix = f"_x{_digest(*sorted(exclude_models))}" if exclude_models else ""
+    if index_type == "hnsw":
+        return f"idx_{table}_embedding_hnsw_m{HNSW_M}_ef{HNSW_EF_CONSTRUCTION}{suffix}"
+    if index_type == "ivfflat":
+        return f"idx_{table}_embedding_ivfflat_l{IVFFLAT_LISTS}{suffix}"
+    return None
+
+
+def compact_index_name(table, model, storage, index_type=None):
+    index_type = index_type or VECTOR_INDEX_TYPE
+    params = f"m{HNSW_M}_ef{HNSW_EF_CONSTRUCTION}" if index_type == "hnsw" else f"l{IVFFLAT_LISTS}"
+    return f"idx_{table}_compact_{storage}_{_digest(model)}_{params}"
+
+
+def _replace_indexes(conn, table, prefix, wanted):
+    """Drops `idx_<table>_<prefix>*` indexes that are not in `wanted`."""
+    existing = [row[0] for row in conn.execute(text("""
+        SELECT indexname FROM pg_indexes
+        WHERE tablename = :table AND indexname LIKE :pattern
+    """), {"table": table, "pattern": f"idx_{table}_{prefix}%"})]
+    for name in existing:
+        if name not in wanted:
+            logger.info(f"Dropping outdated vector index {name}")
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+def ensure_vector_index(conn, table, index_type=None, exclude_models=()):
+    """
+    Creates the configured cosine-distance index on `table.embedding` and drops
+    embedding indexes built with other settings. Rows of `exclude_models` (compact
+    storage) are left out of it.
+    """
+    if not _IDENTIFIER_RE.match(table):
+        raise ValueError(f"Invalid table name: {table}")
+    index_type = index_type or VECTOR_INDEX_TYPE
+    wanted = index_name(table, index_type, exclude_models)
+    _replace_indexes(conn, table, "embedding_", {wanted})
+    if index_type == "none":
+        return
+
+    method, ops, options = _index_method(index_type, "vector_cosine_ops")
+    where = ""
+    if exclude_models:
+        where = f"WHERE embedding_model NOT IN ({', '.join(model_literal(m) for m in sorted(exclude_models))})"
+    conn.execute(text(f"""
+        CREATE INDEX IF NOT EXISTS {wanted} ON {table}
+        USING {method} (embedding {ops})
+        {options}
+        {where}
+    """))
+
+
+def ensure_compact_indexes(conn, table, modes=None, index_type=None, dimensions=VECTOR_DIMENSIONS):
+    """
+    One partial index per compact-storage model over its quantized expression; drops
+    compact indexes of models/types no longer configured. Returns the compact models.
+    """
+    if not _IDENTIFIER_RE.match(table):
+        raise ValueError(f"Invalid table name: {table}")
+    modes = STORAGE_MODES if modes is None else modes
+    index_type = index_type or VECTOR_INDEX_TYPE
+    compact = {model: storage for model, storage in modes.items() if storage != "full"}
+    wanted = {} if index_type == "none" else {
+        compact_index_name(table, model, storage, index_type): (model, storage) for model, storage in compact.items()}
+    _replace_indexes(conn, table, "compact_", set(wanted))
+
+    for name, (model, storage) in wanted.items():
+        expression, ops = _compact_expression(storage, dimensions)
+        method, ops, options = _index_method(index_type, ops)
+        conn.execute(text(f"""
+            CREATE INDEX IF NOT EXISTS {name} ON {table}
+            USING {method} ({expression} {ops})
+            {options}
+            WHERE embedding_model = {model_literal(model)}
+        """))
+    return sorted(compact)
+
+
+def indexed_models(conn, table):
+    """
+    Embedding models in `table` according to its planner statistics (pg_stats, kept
+    by ANALYZE/autovacuum), so it costs one catalog read instead of a table scan.
+    Empty until the table has been analyzed.
+    """
+    values = conn.execute(text("""
+        SELECT CAST(CAST(most_common_vals AS text) AS text[]) FROM pg_stats
+        WHERE schemaname = current_schema() AND tablename = :table AND attname = 'embedding_model'
+    """), {"table": table}).scalar()
+    return sorted(values or [])
+
+
+def shares_index(model, models, modes=None):
+    """
+    True when `model`'s rows share the full-precision index with another model's
+    (e.g. during a backfill). The model predicate is then applied after the index
+    scan like any other filter, so searches need the wider candidate list.
+    """
+    if storage_for(model, modes) != "full":
+        return False  # compact models have their own partial index
+    return any(other != model and storage_for(other, modes) == "full" for other in models)
+
+
+def apply_search_settings(conn, mode="ann", k=10, filtered=False):
+    """
+    Sets transaction-local planner/index settings for one search.
+    "exact" disables index scans so pgvector does a brute-force scan (ground truth);
+    "ann" widens the candidate list when filters are applied (including the model
+    predicate on an index shared with other models), since pgvector filters after
+    the index scan.
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode: {mode}")
+    if mode == "exact":
+        conn.execute(text("SELECT set_config('enable_indexscan', 'off', true)"))
+        return
+    ef_search = max(HNSW_EF_SEARCH, k * (10 if filtered else 1))
+    probes = IVFFLAT_PROBES * (4 if filtered else 1)
+    conn.execute(text("SELECT set_config('hnsw.ef_search', :ef, true)"), {"ef": str(ef_search)})
+    conn.execute(text("SELECT set_config('ivfflat.probes', :probes, true)"), {"probes": str(probes)})
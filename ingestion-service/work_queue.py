@@ -0,0 +1,206 @@
+"""
+In-process ingestion work queue.
+
+Requests are acknowledged as soon as a job is queued; a fixed pool of worker
+threads drains the queue. The queue is bounded: when it is full, `submit`
+raises QueueFullError and the HTTP layer answers 429 so Pub/Sub / Eventarc
+redeliver later instead of the event being dropped.
+
+The event behind a job has already been acknowledged, so a handler that raises
+RetryLater (e.g. Vertex AI is shedding load) gets its job re-queued after
+retry_after seconds, doubled on each further attempt up to `max_retry_delay`,
+for at most `max_attempts` runs. Jobs waiting for a retry count against
+`max_pending`.
+
+Background work keeps running after the HTTP response, so the Cloud Run
+service must be deployed with CPU always allocated (--no-cpu-throttling).
+"""
+import threading
+import queue
+import time
+import uuid
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """Raised when the queue cannot accept more work."""
+
+
+class RetryLater(Exception):
+    """Raised by a handler when its job should run again in `retry_after` seconds."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class StageLimiter:
+    """Caps how many jobs can be inside a given pipeline stage (e.g. "io", "model") at once."""
+
+    def __init__(self, limits):
+        self._semaphores = {name: threading.BoundedSemaphore(n) for name, n in limits.items()}
+
+    @contextmanager
+    def limit(self, stage):
+        semaphore = self._semaphores.get(stage)
+        if semaphore is None:
+            yield
+            return
+        with semaphore:
+            yield
+
+    def iterate(self, iterable, stage):
+        """
+        Yields from `iterable`, holding the `stage` slot only while each item is produced
+        (e.g. a lazy page stream whose next() downloads and extracts).
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.limit(stage):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+
+class IngestQueue:
+    """Bounded job queue drained by `workers` threads calling `handler(**payload)`."""
+
+    def __init__(self, handler, workers=4, max_pending=100, status_retention=1000,
+                 max_attempts=8, max_retry_delay=600):
+        self.handler = handler
+        self.workers = workers
+        self.max_pending = max_pending
+        self.status_retention = status_retention
+        self.max_attempts = max_attempts
+        self.max_retry_delay = max_retry_delay
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._delayed = 0  # jobs waiting for a retry timer
+        self._jobs = OrderedDict()
+        self._active_keys = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._started = False
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"ingest-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._started = True
+
+    def submit(self, payload, key=None):
+        """
+        Queues a job and returns its status dict.
+        If a job with the same `key` (e.g. the gs:// path) is still queued or running,
+        that job is returned instead of queueing a duplicate.
+        """
+        self.start()
+        with self._lock:
+            if key is not None and key in self._active_keys:
+                return dict(self._jobs[self._active_keys[key]])
+
+            job_id = uuid.uuid4().hex
+            job = {"job_id": job_id, "key": key, "state": QUEUED, "submitted_at": time.time(),
+                   "started_at": None, "finished_at": None, "result": None, "error": None,
+                   "attempts": 0, "retry_at": None}
+            if self._queue.qsize() + self._delayed >= self.max_pending:
+                raise QueueFullError(f"Ingestion queue is full ({self.max_pending} pending jobs)")
+            try:
+                self._queue.put_nowait((job_id, payload))
+            except queue.Full:
+                raise QueueFullError(f"Ingestion queue is full ({self.max_pending} pending jobs)")
+            self._jobs[job_id] = job
+            if key is not None:
+                self._active_keys[key] = job_id
+            self._trim()
+            return dict(job)
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def stats(self):
+        with self._lock:
+            states = {QUEUED: 0, RUNNING: 0, SUCCEEDED: 0, FAILED: 0}
+            for job in self._jobs.values():
+                states[job["state"]] += 1
+            return {"workers": self.workers, "max_pending": self.max_pending,
+                    "pending": self._queue.qsize(), "retrying": self._delayed, "jobs": states}
+
+    def _trim(self):
+        # Forget the oldest finished jobs once the status table is over its retention size
+        excess = len(self._jobs) - self.status_retention
+        if excess <= 0:
+            return
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            if self._jobs[job_id]["state"] in (SUCCEEDED, FAILED):
+                del self._jobs[job_id]
+                excess -= 1
+
+    def _finish(self, job_id, state, result=None, error=None):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(state=state, result=result, error=error, finished_at=time.time())
+            if job["key"] is not None and self._active_keys.get(job["key"]) == job_id:
+                del self._active_keys[job["key"]]
+
+    def _retry(self, job_id, payload, error):
+        """Re-queues a job after a backoff delay, or fails it once it is out of attempts."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            attempts = job["attempts"] if job else self.max_attempts
+            if attempts < self.max_attempts:
+                delay = min(self.max_retry_delay, max(error.retry_after, 0) * 2 ** (attempts - 1))
+                if job:
+                    job.update(state=QUEUED, error=str(error), retry_at=time.time() + delay)
+                self._delayed += 1
+        if attempts >= self.max_attempts:
+            logger.error(f"Ingestion job {job_id} failed after {attempts} attempts: {error}")
+            self._finish(job_id, FAILED, error=str(error))
+            return
+        logger.warning(f"Ingestion job {job_id} will be retried in {delay:.0f}s (attempt {attempts}): {error}")
+        timer = threading.Timer(delay, self._requeue, (job_id, payload))
+        timer.daemon = True
+        timer.start()
+
+    def _requeue(self, job_id, payload):
+        self._queue.put((job_id, payload))
+        with self._lock:
+            self._delayed -= 1
+
+    def _worker(self):
+        while True:
+            job_id, payload = self._queue.get()
+            with self._lock:
+                if job_id in self._jobs:
+                    job = self._jobs[job_id]
+                    job.update(state=RUNNING, started_at=time.time(), retry_at=None, attempts=job["attempts"] + 1)
+            try:
+                result = self.handler(**payload)
+                self._finish(job_id, SUCCEEDED, result=result)
+            except RetryLater as e:
+                self._retry(job_id, payload, e)
+            except Exception as e:
+                logger.error(f"Ingestion job {job_id} failed: {e}", exc_info=True)
+                self._finish(job_id, FAILED, error=str(e))
+            finally:
+                self._queue.task_done()